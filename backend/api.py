@@ -1,9 +1,13 @@
 import os
 import sys
 import re
+import ast
+import hashlib
 import logging
+import sqlalchemy
+from functools import lru_cache
 from collections import defaultdict
-from flask import Flask, jsonify, request, redirect
+from flask import Flask, jsonify, request, redirect, stream_with_context
 from flask_cors import CORS
 
 logger = logging.getLogger(__name__)
@@ -13,7 +17,8 @@ app = Flask(__name__)
 PDPATTERN = re.compile("DQM_V\d+_R\d+__(.+__.+__.+)[.]root")  # PD inside the file name
 CORS(app)
 
-from . import db
+from . import db, columnar, export
+from .response_cache import ResponseCache
 
 app.config["SQLALCHEMY_DATABASE_URI"] = db.get_formatted_db_uri(
     username=os.environ.get("DB_USERNAME", "postgres"),
@@ -24,6 +29,85 @@ app.config["SQLALCHEMY_DATABASE_URI"] = db.get_formatted_db_uri(
 )
 
 
+@app.before_request
+def check_db_process():
+    # e.g. gunicorn --preload forks the workers after create_app
+    db.check_process(app.config["SQLALCHEMY_DATABASE_URI"])
+
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    # return the connection of the request thread to the pool
+    if db.session is not None:
+        db.session.remove()
+
+
+# /api/data responses, invalidated by the generation of their dataset
+data_cache = ResponseCache(int(os.environ.get("API_CACHE_SIZE", 256)))
+DATA_FORMATS = [1, 2]
+
+
+@lru_cache(maxsize=4096)
+def parse_oms_data(oms_data):
+    """
+    OMS info dict of a legacy Runs.oms_data string, parsed once per distinct string.
+    The dict is shared, do not modify it.
+    """
+    return ast.literal_eval(oms_data)
+
+
+def get_oms_info(run):
+    if run.oms is not None:
+        return run.oms
+    return parse_oms_data(run.oms_data) if run.oms_data else {}
+
+
+def parse_bool(value):
+    if value.lower() in ["1", "true", "yes"]:
+        return True
+    if value.lower() in ["0", "false", "no"]:
+        return False
+    raise ValueError("not a boolean: %s" % value)
+
+
+def parse_ints(value):
+    return [int(x) for x in value.split(",")]
+
+
+B_FIELD_TOLERANCE = 0.05  # Tesla
+ENERGY_TOLERANCE = 1.0  # GeV
+# /api/data run filters on the OMS columns: parameter -> (parser, SQL condition)
+RUN_FILTERS = {
+    "min_lumi": (float, lambda x: db.Run.recorded_lumi >= x),
+    "b_field": (
+        float,
+        lambda x: db.Run.b_field.between(x - B_FIELD_TOLERANCE, x + B_FIELD_TOLERANCE),
+    ),
+    "energy": (
+        float,
+        lambda x: db.Run.energy.between(x - ENERGY_TOLERANCE, x + ENERGY_TOLERANCE),
+    ),
+    "fill": (parse_ints, lambda x: db.Run.fill_number.in_(x)),
+    "stable_beam": (parse_bool, lambda x: db.Run.stable_beam == x),
+}
+
+
+def get_metadata(trend, config, subsystem, pd, processing_string):
+    return {
+        "y_title": config.y_title,
+        "plot_title": config.plot_title,
+        "name": config.name,
+        "subsystem": subsystem,
+        "pd": pd,  ### why we return what we requested ???
+        "processing_string": processing_string,
+        "relative_path": config.relative_path,
+        "histo1_path": config.histo1_path,
+        "histo2_path": config.histo2_path,
+        "reference_path": config.reference_path,
+        "trend_id": trend.id,
+    }
+
+
 @app.route("/api/data", methods=["GET"])
 def get_data(json=True):
     if not json:
@@ -36,7 +120,13 @@ def get_data(json=True):
         runs = None
         # runs = [ 355708, 355710, 355711 ]
         latest = 50
-        trend_id = 0
+        trend_ids = []
+        series = []
+        run_filters = {}
+        since_run = None
+        since_generation = None
+        data_format = 1
+        mimetype = columnar.JSON_MIMETYPE
     else:
         ### old HDQM code
         subsystem = request.args.get("subsystem")
@@ -46,7 +136,11 @@ def get_data(json=True):
         to_run = request.args.get("to_run", type=int)
         runs = request.args.get("runs")
         latest = request.args.get("latest", type=int)
-        trend_id = request.args.get("trend_id", type=int)
+        trend_ids = request.args.get("trend_id")
+        series = request.args.get("series")
+        data_format = request.args.get("format", 1, type=int)
+        since_run = request.args.get("since_run", type=int)
+        since_generation = request.args.get("since_generation", type=int)
 
         if subsystem == None:
             return jsonify({"message": "Please provide a subsystem parameter."}), 400
@@ -67,6 +161,34 @@ def get_data(json=True):
             modes += 1
         if runs != None:
             modes += 1
+        if since_run != None or since_generation != None:
+            modes += 1
+
+        if data_format not in DATA_FORMATS:
+            return (
+                jsonify(
+                    {
+                        "message": "Unknown format. Accepted values are: %s"
+                        % ",".join(str(x) for x in DATA_FORMATS)
+                    }
+                ),
+                400,
+            )
+
+        # JSON unless a columnar encoding is requested in the Accept header
+        mimetype = columnar.JSON_MIMETYPE
+        if request.accept_mimetypes:
+            mimetype = request.accept_mimetypes.best_match(columnar.get_mimetypes())
+        if mimetype is None:
+            return (
+                jsonify(
+                    {
+                        "message": "Accepted response types are: %s"
+                        % ",".join(columnar.get_mimetypes())
+                    }
+                ),
+                406,
+            )
 
         if modes > 1:
             return (
@@ -78,6 +200,32 @@ def get_data(json=True):
                 400,
             )
 
+        try:
+            trend_ids = [int(x) for x in trend_ids.split(",")] if trend_ids else []
+        except ValueError:
+            return (
+                jsonify(
+                    {
+                        "message": "trend_id parameter is not valid. It has to be a comma separated list of integers."
+                    }
+                ),
+                400,
+            )
+        series = [x for x in series.split(",") if x] if series else []
+
+        run_filters = {}
+        for name, (parse, condition) in RUN_FILTERS.items():
+            value = request.args.get(name)
+            if value is None:
+                continue
+            try:
+                run_filters[name] = parse(value)
+            except ValueError:
+                return (
+                    jsonify({"message": "%s parameter is not valid." % name}),
+                    400,
+                )
+
         if runs != None:
             try:
                 runs = runs.split(",")
@@ -96,56 +244,162 @@ def get_data(json=True):
     if latest == None:
         latest = 50
 
-    if runs:
-        runs = db.session.query(db.Run).filter(db.Run.id.in_(runs)).all()
+    # delta of a format 2 response: points of new runs or written since a generation
+    delta = since_run != None or since_generation != None
+    if delta:
+        data_format = 2
+        mimetype = columnar.JSON_MIMETYPE
+        selection = ("delta", since_run, since_generation)
+    elif runs:
+        selection = ("runs",) + tuple(sorted(set(runs)))
     elif from_run and to_run:
-        runs = (
-            db.session.query(db.Run)
-            .where(db.Run.id >= from_run, db.Run.id <= to_run)
-            .all()
-        )
+        selection = ("range", from_run, to_run)
     else:
-        runs = db.session.query(db.Run).order_by(db.Run.id.desc()).limit(latest).all()
+        selection = ("latest", latest)
 
-    logger.debug(f"{[run.id for run in runs]}")
     ### datasets
     dataset = (
-        db.session.query(db.Dataset)
+        db.session.query(db.Dataset.id, db.Dataset.generation)
         .where(db.Dataset.stream == pd, db.Dataset.reco_path == processing_string)
         .first()
     )
+    if not dataset:
+        result = get_data_v2([], [], {}, subsystem, pd, processing_string)
+        if data_format == 1:
+            result = []
+        return jsonify(result) if json else result
+
+    key = (subsystem, pd, processing_string, selection)
+    key += (tuple(sorted(set(trend_ids))), tuple(sorted(set(series))))
+    key += (data_format, mimetype)
+    key += tuple((x, str(run_filters[x])) for x in sorted(run_filters))
+    cached = data_cache.get(key, dataset.id, dataset.generation)
+    if cached is not None:
+        result, body = cached
+        if json and body is not None:
+            return app.response_class(body, mimetype=mimetype)
+        return jsonify(result) if json else result
+
+    # OMS filters are applied before the latest N runs are taken
+    run_query = db.session.query(db.Run).filter(
+        *[RUN_FILTERS[x][1](value) for x, value in run_filters.items()]
+    )
+    if delta:
+        runs = []  # runs of the new points, below
+    elif runs:
+        runs = run_query.filter(db.Run.id.in_(runs)).all()
+    elif from_run and to_run:
+        runs = run_query.where(db.Run.id >= from_run, db.Run.id <= to_run).all()
+    else:
+        runs = run_query.order_by(db.Run.id.desc()).limit(latest).all()
 
-    ### trends & configs
-    trends_and_configs = (
+    logger.debug(f"{[run.id for run in runs]}")
+
+    ### trends & configs, only the requested ones if trend ids or names are given
+    query = (
         db.session.query(db.Trend, db.Config)
         .where(db.Trend.dataset_id == dataset.id, db.Trend.subsystem == subsystem)
         .filter(db.Trend.config_id == db.Config.id)
-        .all()
     )
+    if trend_ids:
+        query = query.filter(db.Trend.id.in_(trend_ids))
+    if series:
+        query = query.filter(db.Config.name.in_(series))
+    trends_and_configs = query.all()
+
+    ### points of the requested trends and runs
+    trend_ids = [trend.id for trend, config in trends_and_configs]
+    if delta and trend_ids:
+        query = db.session.query(db.TrendPoint.run).filter(
+            db.TrendPoint.trend_id.in_(trend_ids)
+        )
+        if since_run != None:
+            query = query.filter(db.TrendPoint.run > since_run)
+        if since_generation != None:
+            query = query.filter(db.TrendPoint.generation > since_generation)
+        runs = run_query.filter(db.Run.id.in_(query.distinct()))
+        runs = runs.order_by(db.Run.id.desc()).all()
+    runs = [run for run in runs if run.rr_significant]
+    rows = []
+    query = None
+    if trend_ids and runs:
+        # plain rows, ORM objects of ~1e5 points are slow to build
+        query = db.session.query(
+            db.TrendPoint.trend_id,
+            db.TrendPoint.run,
+            db.TrendPoint.value,
+            db.TrendPoint.error,
+        ).filter(
+            db.TrendPoint.trend_id.in_(trend_ids),
+            db.TrendPoint.run.in_([run.id for run in runs]),
+        )
+        if since_generation != None:
+            query = query.filter(db.TrendPoint.generation > since_generation)
+        # primary key order, the columnar encodings need no sort then
+        query = query.order_by(db.TrendPoint.trend_id, db.TrendPoint.run)
+
+    if mimetype != columnar.JSON_MIMETYPE:
+        # straight from the DBAPI cursor into arrays, no Row object per point
+        if query is not None:
+            points = columnar.read_points(db.session.connection(), query.statement)
+        else:
+            points = []
+        body = get_data_columnar(
+            trends_and_configs, runs, points, mimetype, subsystem, pd, processing_string
+        )
+        data_cache.put(key, dataset.id, dataset.generation, (None, body))
+        return app.response_class(body, mimetype=mimetype)
 
     ### calc results
+    if query is not None:
+        rows = query.all()
+    points = defaultdict(dict)
+    for point in rows:
+        points[point.trend_id][point.run] = point
+    runs = list(reversed(runs))
+    if data_format == 2:
+        result = get_data_v2(
+            trends_and_configs, runs, points, subsystem, pd, processing_string
+        )
+        # token for the next delta, older than the points if the extractor
+        # committed meanwhile, deltas are then sent again but never lost
+        result["generation"] = dataset.generation
+        if delta:
+            result["delta"] = True
+    else:
+        result = get_data_v1(
+            trends_and_configs, runs, points, subsystem, pd, processing_string
+        )
+
+    if json:
+        response = jsonify(result)
+        data_cache.put(
+            key, dataset.id, dataset.generation, (result, response.get_data())
+        )
+        return response
+    data_cache.put(key, dataset.id, dataset.generation, (result, None))
+    return result
+
+
+def get_data_v1(trends_and_configs, runs, points, subsystem, pd, processing_string):
+    """
+    List of trends, each point with the full OMS info of its run
+    """
     result = []
     for trend, config in trends_and_configs:
-        if trend_id:
-            if trend.id != trend_id:
-                continue
-
-        points = eval(trend.points)
+        trend_points = points[trend.id]
         trends_data = []
 
-        for run in reversed(runs):
-            if not run.rr_significant:
-                continue
-
-            point = points.get(run.id, None)
+        for run in runs:
+            point = trend_points.get(run.id, None)
             if not point:
                 continue
 
             dat = {
                 "run": int(run.id),
-                "value": float(point[0]),
-                "error": float(point[1]),
-                "oms_info": eval(run.oms_data),
+                "value": float(point.value),
+                "error": float(point.error),
+                "oms_info": get_oms_info(run),
             }
             trends_data.append(dat)
 
@@ -153,105 +407,238 @@ def get_data(json=True):
 
         result += [
             {
-                "metadata": {
-                    "y_title": config.y_title,
-                    "plot_title": config.plot_title,
-                    "name": config.name,
-                    "subsystem": subsystem,
-                    "pd": pd,  ### why we return what we requested ???
-                    "processing_string": processing_string,
-                    "relative_path": config.relative_path,
-                    "histo1_path": config.histo1_path,
-                    "histo2_path": config.histo2_path,
-                    "reference_path": config.reference_path,
-                    "trend_id": trend.id,
-                },
+                "metadata": get_metadata(
+                    trend, config, subsystem, pd, processing_string
+                ),
                 "trends": trends_data,
             }
         ]
-
-    if json:
-        return jsonify(result)
     return result
 
 
-@app.route("/api/selection", methods=["GET"])
-def get_selections(json=True):
-    subsystems = db.session.query(db.Config.subsystem).distinct().all()
-    datasets = (
-        db.session.query(db.Dataset.id, db.Dataset.stream, db.Dataset.reco_path)
-        .distinct()
-        .all()
+def get_data_v2(trends_and_configs, runs, points, subsystem, pd, processing_string):
+    """
+    Table of the runs with points and their OMS info, sent once, and the trends as
+    arrays of indices in this table, values and errors
+    """
+    run_table = []
+    run_index = {}
+    series = []
+    for trend, config in trends_and_configs:
+        trend_points = points[trend.id]
+        indices, values, errors = [], [], []
+        for run in runs:
+            point = trend_points.get(run.id, None)
+            if not point:
+                continue
+            if run.id not in run_index:
+                run_index[run.id] = len(run_table)
+                run_table += [{"run": int(run.id), "oms_info": get_oms_info(run)}]
+            indices.append(run_index[run.id])
+            values.append(float(point.value))
+            errors.append(float(point.error))
+
+        series += [
+            {
+                "metadata": get_metadata(
+                    trend, config, subsystem, pd, processing_string
+                ),
+                "runs": indices,
+                "values": values,
+                "errors": errors,
+            }
+        ]
+    return {"format": 2, "runs": run_table, "series": series}
+
+
+def get_data_columnar(
+    trends_and_configs, runs, points, mimetype, subsystem, pd, processing_string
+):
+    """
+    Series as columnar arrays in a binary encoding, built from the (n, 4) array of
+    columnar.read_points() without an object per point
+    """
+    trends_and_configs = sorted(trends_and_configs, key=lambda x: x[0].id)
+    series = [
+        get_metadata(trend, config, subsystem, pd, processing_string)
+        for trend, config in trends_and_configs
+    ]
+    columns = columnar.get_columns([x["trend_id"] for x in series], points)
+    used_runs = set(columns[1].tolist())
+    oms_info = {run.id: get_oms_info(run) for run in runs if run.id in used_runs}
+    return columnar.ENCODERS[mimetype](series, oms_info, columns)
+
+
+EXPORT_YIELD_PER = 10000  # points fetched at once from the server side cursor
+
+
+@app.route("/api/export", methods=["GET"])
+def export_data():
+    """
+    All points of a dataset streamed a trend at a time, for offline studies.
+    Same parameters as /api/data except latest, all runs by default.
+    """
+    subsystem = request.args.get("subsystem")
+    pd = request.args.get("pd")
+    processing_string = request.args.get("processing_string")
+    from_run = request.args.get("from_run", type=int)
+    to_run = request.args.get("to_run", type=int)
+    export_format = request.args.get("format", "ndjson")
+
+    for name, value in [
+        ("subsystem", subsystem),
+        ("pd", pd),
+        ("processing_string", processing_string),
+    ]:
+        if value == None:
+            return jsonify({"message": "Please provide a %s parameter." % name}), 400
+
+    formats = export.get_formats()
+    if export_format == "parquet" and export_format not in formats:
+        return (
+            jsonify({"message": "Parquet export needs pyarrow, which is missing."}),
+            400,
+        )
+    if export_format not in formats:
+        return (
+            jsonify(
+                {
+                    "message": "Unknown format. Accepted values are: %s"
+                    % ",".join(formats)
+                }
+            ),
+            400,
+        )
+
+    run_filters = []
+    try:
+        runs = request.args.get("runs")
+        runs = parse_ints(runs) if runs else []
+        trend_ids = request.args.get("trend_id")
+        trend_ids = parse_ints(trend_ids) if trend_ids else []
+        for name, (parse, condition) in RUN_FILTERS.items():
+            value = request.args.get(name)
+            if value is not None:
+                run_filters += [condition(parse(value))]
+    except ValueError as error:
+        return jsonify({"message": "Invalid parameter: %s" % error}), 400
+    if runs:
+        run_filters += [db.Run.id.in_(runs)]
+    if from_run and to_run:
+        run_filters += [db.Run.id >= from_run, db.Run.id <= to_run]
+
+    query = (
+        db.session.query(db.Trend, db.Config)
+        .join(db.Dataset, db.Trend.dataset_id == db.Dataset.id)
+        .where(db.Dataset.stream == pd, db.Dataset.reco_path == processing_string)
+        .where(db.Trend.subsystem == subsystem)
+        .filter(db.Trend.config_id == db.Config.id)
     )
+    if trend_ids:
+        query = query.filter(db.Trend.id.in_(trend_ids))
+    if request.args.get("series"):
+        query = query.filter(db.Config.name.in_(request.args["series"].split(",")))
+    series = {
+        trend.id: get_metadata(trend, config, subsystem, pd, processing_string)
+        for trend, config in query.order_by(db.Trend.id)
+    }
 
-    trends = (
-        db.session.query(db.Trend.dataset_id, db.Trend.subsystem)
-        .where(db.Trend.points != "{}")
-        .all()
+    # points of significant runs, as in /api/data, in the primary key order
+    rows = (
+        db.session.query(
+            db.TrendPoint.trend_id,
+            db.TrendPoint.run,
+            db.TrendPoint.value,
+            db.TrendPoint.error,
+        )
+        .join(db.Run, db.TrendPoint.run == db.Run.id)
+        .filter(db.TrendPoint.trend_id.in_(list(series)), db.Run.rr_significant)
+        .filter(*run_filters)
+        .order_by(db.TrendPoint.trend_id, db.TrendPoint.run)
+        .yield_per(EXPORT_YIELD_PER)
     )
-    trends_dic = {}
-    for trend in trends:
-        trends_dic[str(trend.dataset_id) + "_" + str(trend.subsystem)] = 1
-
-    obj = defaultdict(lambda: defaultdict(list))
-    for s in subsystems:
-        for d in datasets:
-            key = str(d.id) + "_" + str(s.subsystem)
-            if key not in trends_dic:
-                continue
-            obj[s.subsystem][d.stream].append(d.reco_path)
 
-    if json:
-        return jsonify(obj)
-    return obj
+    mimetype, encoder = formats[export_format]
+    filename = "%s_%s_%s.%s" % (subsystem, pd, processing_string, export_format)
+    return app.response_class(
+        stream_with_context(encoder(series, rows)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": 'attachment; filename="%s"' % filename},
+    )
 
 
-@app.route("/api/plot_selection", methods=["GET"])
-def plot_selection(json=True):
-    # try:
-    subsystems = db.session.query(db.Config.subsystem).distinct().all()
-    datasets = (
-        db.session.query(db.Dataset.id, db.Dataset.stream, db.Dataset.reco_path)
-        .distinct()
-        .all()
-    )
-    configs = db.session.query(db.Config.id, db.Config.name).all()
+# selection documents built from the SelectionIndex table, reloaded on new commits
+selection_index = {"version": None}
+
+
+def get_datasets_version():
+    """
+    Sum of the dataset generations, it grows with every commit of the extractor
+    """
+    version = db.session.query(sqlalchemy.func.sum(db.Dataset.generation))
+    return version.scalar() or 0
+
 
-    trends = (
-        db.session.query(db.Trend.dataset_id, db.Trend.subsystem, db.Trend.config_id)
-        .where(db.Trend.points != "{}")
-        .all()
+def get_selection_index():
+    """
+    Selection documents of the trends with points, with their JSON bodies & ETags.
+    SelectionIndex rows are added with a generation bump of their dataset, so the
+    index is rebuilt when the sum of the generations changes.
+    """
+    global selection_index
+    version = get_datasets_version()
+    index = selection_index
+    if index["version"] == version:
+        return index
+
+    entries = db.session.query(db.SelectionEntry).order_by(
+        db.SelectionEntry.subsystem,
+        db.SelectionEntry.dataset_id,
+        db.SelectionEntry.config_id,
     )
-    trends_dic = defaultdict(dict)
-    for trend in trends:
-        trends_dic[str(trend.dataset_id) + "_" + str(trend.subsystem)][
-            trend.config_id
-        ] = trend.id
-
-    obj = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    for s in subsystems:
-        for d in datasets:
-            key = str(d.id) + "_" + str(s.subsystem)
-            if key not in trends_dic:
-                continue
+    selection = defaultdict(lambda: defaultdict(list))
+    plots = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    for entry in entries:
+        reco_paths = selection[entry.subsystem][entry.stream]
+        if entry.reco_path not in reco_paths:
+            reco_paths.append(entry.reco_path)
+        plots[entry.subsystem][entry.stream][entry.reco_path].append(
+            {"name": entry.name, "id": entry.trend_id}
+        )
+
+    index = {"version": version, "selection": selection, "plot_selection": plots}
+    for name in ["selection", "plot_selection"]:
+        body = jsonify(index[name]).get_data()
+        index[name + "_body"] = body
+        index[name + "_etag"] = hashlib.sha1(body).hexdigest()
+    # replaced at once, requests of other threads see the old or the new index
+    selection_index = index
+    return index
+
 
-            trend_n_cfg = trends_dic[key]
-            plots = [
-                {"name": cfg.name, "id": trend_n_cfg[cfg.id]}
-                for cfg in configs
-                if cfg.id in trend_n_cfg
-            ]
+def selection_response(name):
+    index = get_selection_index()
+    response = app.response_class(index[name + "_body"], mimetype="application/json")
+    response.set_etag(index[name + "_etag"])
+    return response.make_conditional(request)
 
-            obj[s.subsystem][d.stream][d.reco_path] = plots
 
+@app.route("/api/selection", methods=["GET"])
+def get_selections(json=True):
+    if json:
+        return selection_response("selection")
+    return get_selection_index()["selection"]
+
+
+@app.route("/api/plot_selection", methods=["GET"])
+def plot_selection(json=True):
     if json:
-        return jsonify(obj)
-    return obj
+        return selection_response("plot_selection")
+    return get_selection_index()["plot_selection"]
 
 
 @app.route("/api/runs", methods=["GET"])
 def get_runs(json=True):
-    db.create_session(db_path)
     runs = [r.id for r in db.session.query(db.Run.id).order_by(db.Run.id.asc())]
     if json:
         return jsonify(runs)
@@ -430,5 +817,6 @@ def create_app():
         port=os.environ.get("DB_PORT", 5432),
         db_name=os.environ.get("DB_NAME", "hdqm"),
     )
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_path
     db.create_session(db_path)
     return app
@@ -0,0 +1,132 @@
+"""
+Columnar encodings of /api/data responses.
+Points of all series are sent as flat arrays (runs int32, values & errors float64)
+sorted by series, with offsets marking the points of each series.
+msgpack and pyarrow are in requirements.txt, an encoding whose module can not be
+imported is not offered and the response falls back to JSON.
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+FETCH_SIZE = 10000  # rows fetched at once from the DBAPI cursor
+
+
+def get_mimetypes():
+    "response mimetypes in order of preference, JSON is the default"
+    mimetypes = [JSON_MIMETYPE]
+    if msgpack:
+        mimetypes += [MSGPACK_MIMETYPE]
+    if pyarrow:
+        mimetypes += [ARROW_MIMETYPE]
+    return mimetypes
+
+
+def read_points(connection, statement, size=FETCH_SIZE):
+    """
+    (trend_id, run, value, error) rows of a select as a (n, 4) float64 array.
+    Rows are fetched in chunks from the DBAPI cursor into a preallocated array,
+    without a SQLAlchemy Row per point.
+    """
+    result = connection.execute(statement)
+    try:
+        cursor = result.cursor
+        # number of rows with client side cursors, e.g. psycopg2, -1 for SQLite
+        points = np.empty((max(cursor.rowcount, size), 4), dtype=np.float64)
+        n = 0
+        while True:
+            chunk = cursor.fetchmany(size)
+            if not chunk:
+                break
+            if n + len(chunk) > len(points):
+                points = np.resize(points, (2 * len(points) + len(chunk), 4))
+            points[n : n + len(chunk)] = chunk
+            n += len(chunk)
+    finally:
+        result.close()
+    return points[:n]
+
+
+def get_columns(trend_ids, points):
+    """
+    Columns of (trend_id, run, value, error) points, e.g. from read_points().
+    Returns offsets, runs, values and errors with the points of trend_ids[i] in
+    [offsets[i], offsets[i+1]), sorted by run. trend_ids must be sorted.
+    Points are sorted here unless they come sorted by trend_id and run from the DB.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 4)
+    keys = points[:, 0] * 1e7 + points[:, 1]  # exact below 2**53
+    if np.any(keys[1:] < keys[:-1]):
+        points = points[np.argsort(keys, kind="stable")]
+    offsets = np.searchsorted(points[:, 0], np.append(trend_ids, np.inf))
+    return (
+        offsets.astype("<i4"),
+        points[:, 1].astype("<i4"),
+        np.ascontiguousarray(points[:, 2], dtype="<f8"),
+        np.ascontiguousarray(points[:, 3], dtype="<f8"),
+    )
+
+
+def encode_msgpack(series, oms_info, columns):
+    """
+    series - metadata of the series, oms_info - {run: OMS info}.
+    The arrays are little endian bytes, e.g. new Int32Array(runs.buffer) in JS.
+    """
+    offsets, runs, values, errors = columns
+    return msgpack.packb(
+        {
+            "format": "columnar",
+            "series": series,
+            "oms_info": oms_info,
+            "offsets": offsets.tobytes(),
+            "runs": runs.tobytes(),
+            "values": values.tobytes(),
+            "errors": errors.tobytes(),
+        },
+        use_bin_type=True,
+    )
+
+
+def encode_arrow(series, oms_info, columns):
+    """
+    IPC stream of a table with a row per series and list columns of the points.
+    Metadata of the series and OMS info are JSON in the schema metadata.
+    """
+    offsets, runs, values, errors = columns
+    offsets = pyarrow.array(offsets)
+    table = pyarrow.Table.from_arrays(
+        [
+            pyarrow.array(np.array([x["trend_id"] for x in series], dtype=np.int32)),
+            pyarrow.ListArray.from_arrays(offsets, pyarrow.array(runs)),
+            pyarrow.ListArray.from_arrays(offsets, pyarrow.array(values)),
+            pyarrow.ListArray.from_arrays(offsets, pyarrow.array(errors)),
+        ],
+        names=["trend_id", "runs", "values", "errors"],
+    )
+    table = table.replace_schema_metadata(
+        {
+            "series": json.dumps(series),
+            "oms_info": json.dumps({str(k): v for k, v in oms_info.items()}),
+        }
+    )
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {MSGPACK_MIMETYPE: encode_msgpack, ARROW_MIMETYPE: encode_arrow}
@@ -1,6 +1,10 @@
 # P.S.~Mandrik, IHEP, 2022, https://github.com/pmandrik
 
 import os
+import re
+import ast
+import math
+import datetime
 import logging
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
@@ -10,6 +14,7 @@ from sqlalchemy import (
     Column,
     String,
     Integer,
+    BigInteger,
     Float,
     DateTime,
     Boolean,
@@ -17,17 +22,27 @@ from sqlalchemy import (
     Enum,
     UniqueConstraint,
     Index,
+    JSON,
 )
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.sql import select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
+from sqlalchemy.sql import select, exists, and_
 
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
 # SQLite will be used if no production DB credentials will be found
+# session is a scoped_session: every thread gets its own session of the engine pool,
+# call session.remove() at the end of a request or job to release its connection
 session = None
 engine = None
+engine_pid = None
+
+# connection pool of the engine of each process
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 10))
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # seconds
 
 
 def get_formatted_db_uri(
@@ -44,19 +59,45 @@ def get_formatted_db_uri(
 
 
 def create_session(db_string=None):
+    """
+    Create the engine of this process and the thread local session registry.
+    Must be called again in forked processes, they can not share pooled connections.
+    """
     global session
     global engine
+    global engine_pid
+
+    if engine is not None and engine_pid == os.getpid():
+        session.remove()
+        engine.dispose()
+    elif engine is not None:
+        # forked, leave the connections of the parent process alone
+        engine.dispose(close=False)
 
     if not db_string:
         dir_path = os.path.dirname(os.path.realpath(__file__))
         db_string = "sqlite:///" + os.path.join(dir_path, "hdqm_v3.db")
         engine = sqlalchemy.create_engine(db_string + "?check_same_thread=False")
-        Session = sessionmaker(bind=engine)
-    else:
+    elif db_string.startswith("sqlite"):
         engine = sqlalchemy.create_engine(db_string)
-        Session = sessionmaker(bind=engine)
+    else:
+        engine = sqlalchemy.create_engine(
+            db_string,
+            pool_size=POOL_SIZE,
+            max_overflow=POOL_MAX_OVERFLOW,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    engine_pid = os.getpid()
+    session = scoped_session(sessionmaker(bind=engine))
+
 
-    session = Session()
+def check_process(db_string):
+    """
+    Create a new engine if this process was forked after create_session
+    """
+    if engine_pid != os.getpid():
+        create_session(db_string)
 
 
 # ~10k Files
@@ -73,11 +114,27 @@ class Run(Base):
     id = Column(Integer, primary_key=True, nullable=False)
     rr_run_class = Column(Text)
     rr_significant = Column(Boolean)
+    # legacy str(dict) of the OMS attributes, moved to oms by migrate_run_metadata()
     oms_data = Column(Text)
+    # OMS attributes, the ones used in filters also as typed columns
+    oms = Column(
+        JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+    )
+    fill_number = Column(Integer, index=True)
+    b_field = Column(Float, index=True)
+    energy = Column(Float, index=True)
+    stable_beam = Column(Boolean, index=True)
+    delivered_lumi = Column(Float)  # in the OMS units
+    recorded_lumi = Column(Float, index=True)
+    duration = Column(Integer)
 
 
 class GUIFile(Base):
     __tablename__ = "GUIFiles"
+    __table_args__ = (
+        Index("ix_GUIFiles_reco_path_stream_run", "reco_path", "stream", "run"),
+        Index("ix_GUIFiles_run", "run"),
+    )
     path = Column(String, primary_key=True, nullable=False)
     short_name = Column(String)
     version = Column(String)
@@ -90,9 +147,14 @@ class GUIFile(Base):
 # per dataset we have several trends (to be shown as plots)
 class Dataset(Base):
     __tablename__ = "Datasets"
+    __table_args__ = (
+        Index("ux_Datasets_stream_reco_path", "stream", "reco_path", unique=True),
+    )
     id = Column(Integer, primary_key=True, nullable=False)
     stream = Column(String)
     reco_path = Column(String)
+    # bumped with every commit changing the data of the dataset, API caches key on it
+    generation = Column(Integer, nullable=False, default=0, server_default="0")
     trends = relationship("Trend")
 
 
@@ -116,17 +178,197 @@ class Config(Base):
     trends = relationship("Trend")
 
 
-# table with trends, value+error point per run and metadata
+# table with trends metadata, value+error points are stored in TrendPoints
 class Trend(Base):
     __tablename__ = "Trends"
+    __table_args__ = (
+        Index("ix_Trends_dataset_id_subsystem", "dataset_id", "subsystem"),
+        Index("ix_Trends_config_id", "config_id"),
+        Index("ux_Trends_dataset_id_config_id", "dataset_id", "config_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, nullable=False)
     subsystem = Column(String)
     dataset_id = Column(Integer, ForeignKey("Datasets.id"))
     config_id = Column(Integer, ForeignKey("Configs.id"))
+    # legacy str(dict) of {run : [value, error]}, moved to TrendPoints by migrate_trend_points()
     points = Column(Text)
 
+    @classmethod
+    def has_points(cls):
+        return exists().where(TrendPoint.trend_id == cls.id)
+
+
+# table with value+error point per trend and run
+class TrendPoint(Base):
+    __tablename__ = "TrendPoints"
+    trend_id = Column(
+        Integer, ForeignKey("Trends.id"), primary_key=True, nullable=False
+    )
+    run = Column(Integer, primary_key=True, nullable=False)
+    value = Column(Float)
+    error = Column(Float)
+    # generation of the dataset the point was written with, for /api/data deltas
+    generation = Column(Integer)
+
+
+# trends with points, all /api/selection and /api/plot_selection need to know
+# rows are only added, by the extractor when a trend receives its first point
+class SelectionEntry(Base):
+    __tablename__ = "SelectionIndex"
+    trend_id = Column(
+        Integer, ForeignKey("Trends.id"), primary_key=True, nullable=False
+    )
+    subsystem = Column(String)
+    dataset_id = Column(Integer)
+    stream = Column(String)
+    reco_path = Column(String)
+    config_id = Column(Integer)
+    name = Column(String)
+
+
+# applied schema migrations, see MIGRATIONS
+class SchemaVersion(Base):
+    __tablename__ = "SchemaVersions"
+    version = Column(Integer, primary_key=True, nullable=False)
+    description = Column(String)
+    applied = Column(DateTime)
+
+
+# MEs missing in the last files of a dataset, see me_resolver.MissingMEs
+class MissingME(Base):
+    __tablename__ = "MissingMEs"
+    stream = Column(String, primary_key=True, nullable=False)
+    reco_path = Column(String, primary_key=True, nullable=False)
+    me = Column(String, primary_key=True, nullable=False)
+    misses = Column(Integer)  # consecutive files without the ME
+
+
+# table with the catalog of GUI files on EOS, one row per directory
+class CatalogDirectory(Base):
+    __tablename__ = "CatalogDirectories"
+    path = Column(String, primary_key=True, nullable=False)
+    mtime = Column(BigInteger)
+    files = Column(Text)  # "\n" separated file names
+
 
 ##################################### Helping functions
+OMS_COLUMNS = {
+    "fill_number": int,
+    "b_field": float,
+    "energy": float,
+    "stable_beam": bool,
+    "delivered_lumi": float,
+    "recorded_lumi": float,
+    "duration": int,
+}
+# integrated luminosity columns, stored in pb^-1 whatever the OMS units
+LUMI_COLUMNS = ["delivered_lumi", "recorded_lumi"]
+# pb^-1 per inverse barn unit of OMS, by prefix, e.g. "fb^{-1}"
+LUMI_UNITS = {
+    "f": 1e3,
+    "p": 1.0,
+    "n": 1e-3,
+    "u": 1e-6,
+    "\u03bc": 1e-6,
+    "\u00b5": 1e-6,
+    "m": 1e-9,
+    "": 1e-12,
+}
+LUMI_UNITS_PATTERN = re.compile(r"^\s*(\S?)b\^\{?-1\}?\s*$")
+
+
+def get_lumi_scale(units):
+    """
+    Factor from OMS integrated luminosity units to pb^-1, None if unknown.
+    Values without units are taken as pb^-1, the units of the OMS runs.
+    """
+    if not units:
+        return 1.0
+    match = LUMI_UNITS_PATTERN.match(units)
+    return LUMI_UNITS.get(match.group(1), None) if match else None
+
+
+def set_run_oms(run, oms_data):
+    """
+    Set the OMS attributes dict of a run and its typed columns.
+    Lumis come as "<value> x <units>" strings from oms_extractor, the lumi columns
+    are converted to pb^-1, e.g. for the min_lumi filter of /api/data.
+    """
+    run.oms = oms_data
+    for column, cast in OMS_COLUMNS.items():
+        value = oms_data.get(column, None)
+        scale = 1.0
+        if isinstance(value, str):
+            value, _, units = value.partition(" x ")
+            if column in LUMI_COLUMNS:
+                scale = get_lumi_scale(units.strip())
+        try:
+            value = cast(value) if value is not None else None
+        except ValueError:
+            value = None
+        if value is not None and scale is None:
+            logger.warning(
+                'Unknown units "%s" of %s of run %s, not stored'
+                % (units, column, run.id)
+            )
+            value = None
+        elif value is not None and scale != 1.0:
+            value *= scale
+        setattr(run, column, value)
+
+
+def get_run_oms(run):
+    """
+    OMS attributes dict of a run, from the legacy oms_data if not migrated yet
+    """
+    if run.oms is not None:
+        return run.oms
+    if run.oms_data:
+        return ast.literal_eval(run.oms_data)
+    return {}
+
+
+def migrate_run_metadata():
+    """
+    Move OMS attributes from the legacy Runs.oms_data strings into the oms
+    and typed columns. Can be interrupted and run again.
+    """
+    logger.info("Migrate run metadata to the typed & JSON columns ...")
+    runs = session.query(Run).where(
+        Run.oms == None, Run.oms_data != None, Run.oms_data != ""
+    )
+    n_runs = 0
+    for run in runs.all():
+        try:
+            set_run_oms(run, ast.literal_eval(run.oms_data))
+        except Exception as error_log:
+            logger.warning("Failed to parse OMS data of run %s, skip" % run.id)
+            logger.warning("Error ... %s " % error_log)
+            continue
+        n_runs += 1
+        if n_runs % 1000 == 0:
+            session.commit()
+    session.commit()
+    logger.info("Migrate run metadata ... ok, %s runs" % n_runs)
+
+
+def convert_run_lumis():
+    """
+    Lumi columns of the runs in pb^-1, they were stored in the OMS units
+    """
+    logger.info("Convert the run lumis to pb^-1 ...")
+    n_runs = 0
+    for run in session.query(Run).where(Run.oms != None).all():
+        set_run_oms(run, dict(run.oms))
+        n_runs += 1
+    # the min_lumi filters of all datasets change
+    session.execute(
+        Dataset.__table__.update().values(generation=Dataset.generation + 1)
+    )
+    session.commit()
+    logger.info("Convert the run lumis to pb^-1 ... ok, %s runs" % n_runs)
+
+
 def get_runs():
     runs = session.query(Run).all()
     return runs
@@ -230,17 +472,25 @@ def get_trends(dataset):
 
 
 def add_dataset(stream, reco_path):
+    """
+    Changes are not committed, the dataset is written with the WriteBatch of its
+    first points
+    """
     logger.info('Add new dataset ("%s", "%s") to the DB ...' % (stream, reco_path))
     dataset = Dataset()
     dataset.stream = stream
     dataset.reco_path = reco_path
     session.add(dataset)
-    session.commit()
+    session.flush()  # to have an id
     logger.info("Add new dataset ... ok")
     return dataset
 
 
 def add_trends(dataset, trend_cfgs):
+    """
+    Changes are not committed, the trends are written with the WriteBatch of their
+    first points
+    """
     logger.info(
         'Add new trends of dataset ("%s", "%s") to the DB ...'
         % (dataset.stream, dataset.reco_path)
@@ -254,10 +504,182 @@ def add_trends(dataset, trend_cfgs):
         trend.points = "{}"
         trends_to_add += [trend]
     session.bulk_save_objects(trends_to_add)
-    session.commit()
     logger.info("Add new trends ... ok")
 
 
+def get_insert(table):
+    """
+    INSERT statement of the current DB dialect, supports ON CONFLICT clauses
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def add_trend_points(points):
+    """
+    Insert or update (trend_id, run) points with one executemany statement.
+    points is a list of dicts with trend_id, run, value, error and optionally
+    generation keys.
+    Changes are not committed.
+    """
+    if not points:
+        return
+    stmt = get_insert(TrendPoint.__table__)
+    columns = ["value", "error", "generation"]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["trend_id", "run"],
+        set_={x: getattr(stmt.excluded, x) for x in columns if x in points[0]},
+    )
+    session.execute(stmt, points)
+
+
+def parse_trend_points(points):
+    """
+    Parse legacy str(dict) points blob of a trend
+    """
+    return eval(points, {"__builtins__": {}}, {"inf": math.inf, "nan": math.nan})
+
+
+def migrate_trend_points():
+    """
+    Move points from the legacy Trend.points blobs into the TrendPoints table.
+    Every trend is migrated in its own transaction and its blob is reset to "{}",
+    so the migration can be interrupted and run again.
+    """
+    logger.info("Migrate trend points to the TrendPoints table ...")
+    trend_ids = [
+        x.id
+        for x in session.query(Trend.id).where(
+            Trend.points != None, Trend.points != "{}"
+        )
+    ]
+    logger.info("Found %s trends to migrate" % len(trend_ids))
+
+    n_points = 0
+    for trend_id in trend_ids:
+        trend = session.query(Trend).where(Trend.id == trend_id).first()
+        try:
+            points = parse_trend_points(trend.points)
+        except Exception as error_log:
+            logger.warning("Failed to parse points of trend %s, skip" % trend_id)
+            logger.warning("Error ... %s " % error_log)
+            continue
+
+        add_trend_points(
+            [
+                {"trend_id": trend_id, "run": int(run), "value": x[0], "error": x[1]}
+                for run, x in points.items()
+            ]
+        )
+        trend.points = "{}"
+        session.commit()
+        n_points += len(points)
+
+    logger.info("Migrate trend points ... ok, %s points" % n_points)
+    if n_points:
+        rebuild_selection_index()
+
+
+def get_selection_trend_ids():
+    return set(x.trend_id for x in session.query(SelectionEntry.trend_id))
+
+
+def rebuild_selection_index():
+    """
+    Fill the SelectionIndex from all trends with points, once for existing DBs.
+    The generation of all datasets is bumped, so the API reloads the selections.
+    """
+    logger.info("Rebuild the selection index ...")
+    rows = (
+        session.query(
+            Trend.id, Trend.subsystem, Dataset.id, Dataset.stream, Dataset.reco_path
+        )
+        .add_columns(Config.id, Config.name)
+        .filter(Trend.dataset_id == Dataset.id, Trend.config_id == Config.id)
+        .where(Trend.has_points())
+        .all()
+    )
+    session.query(SelectionEntry).delete()
+    entries = [dict(zip(SELECTION_ATTRIBUTES, row)) for row in rows]
+    if entries:
+        session.execute(SelectionEntry.__table__.insert(), entries)
+    session.execute(
+        Dataset.__table__.update().values(generation=Dataset.generation + 1)
+    )
+    session.commit()
+    logger.info("Rebuild the selection index ... ok, %s trends" % len(entries))
+
+
+def get_catalog():
+    """
+    Catalog directories as {path : (mtime, [file names])}
+    """
+    return {
+        x.path: (x.mtime, x.files.split("\n") if x.files else [])
+        for x in session.query(CatalogDirectory).all()
+    }
+
+
+def get_missing_mes():
+    """
+    Missing MEs as {(stream, reco_path) : {ME : misses}}
+    """
+    records = {}
+    for x in session.query(MissingME).all():
+        records.setdefault((x.stream, x.reco_path), {})[x.me] = x.misses
+    return records
+
+
+def update_missing_mes(records):
+    """
+    Replace the missing MEs of the {(stream, reco_path) : {ME : misses}} datasets
+    """
+    logger.info("Update missing MEs of %s datasets in the DB ..." % len(records))
+    for (stream, reco_path), mes in records.items():
+        session.query(MissingME).filter(
+            MissingME.stream == stream, MissingME.reco_path == reco_path
+        ).delete(synchronize_session=False)
+        if mes:
+            session.execute(
+                MissingME.__table__.insert(),
+                [
+                    {"stream": stream, "reco_path": reco_path, "me": x, "misses": n}
+                    for x, n in mes.items()
+                ],
+            )
+    session.commit()
+    logger.info("Update missing MEs ... ok")
+
+
+def update_catalog(changed, removed):
+    logger.info(
+        "Update catalog in the DB, %s changed & %s removed directories ..."
+        % (len(changed), len(removed))
+    )
+    if changed:
+        stmt = get_insert(CatalogDirectory.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["path"],
+            set_={"mtime": stmt.excluded.mtime, "files": stmt.excluded.files},
+        )
+        session.execute(
+            stmt,
+            [
+                {"path": path, "mtime": mtime, "files": "\n".join(files)}
+                for path, (mtime, files) in changed.items()
+            ],
+        )
+    if removed:
+        session.query(CatalogDirectory).filter(
+            CatalogDirectory.path.in_(removed)
+        ).delete(synchronize_session=False)
+    session.commit()
+    logger.info("Update catalog ... ok")
+
+
 def add_gui_file(file):
     logger.info('Add processed gui file ("%s") to the DB ...' % (file.path))
     f = GUIFile(path=file.path)
@@ -269,12 +691,379 @@ def add_gui_file(file):
     logger.info("Add gui file ... ok")
 
 
+def get_gui_file_paths():
+    """
+    Iterate over paths of all processed GUI files without loading the ORM objects
+    """
+    result = session.execute(
+        select(GUIFile.path).execution_options(stream_results=True, yield_per=10000)
+    )
+    return result.scalars()
+
+
 def check_gui_file(file):
     files = session.query(GUIFile).where(GUIFile.path == file.path).first()
     return files
 
 
+##################################### Batched writes
+RUN_ATTRIBUTES = ["id", "rr_run_class", "rr_significant", "oms_data", "oms"]
+RUN_ATTRIBUTES += list(OMS_COLUMNS)
+GUI_FILE_ATTRIBUTES = ["path", "short_name", "version", "run", "stream", "reco_path"]
+SELECTION_ATTRIBUTES = [
+    "trend_id",
+    "subsystem",
+    "dataset_id",
+    "stream",
+    "reco_path",
+    "config_id",
+    "name",
+]
+
+
+class WriteBatch:
+    """
+    Collects trend points, processed GUI files and run metadata of several files
+    and writes them in a single transaction with executemany statements.
+    A file is marked as processed only in the same transaction as its points,
+    so a crash in the middle of a batch leaves nothing of it in the DB.
+    """
+
+    def __init__(self, size=1):
+        self.size = size  # number of files per transaction
+        self.indexed = None  # trend ids in the SelectionIndex
+        self.clear()
+
+    def clear(self):
+        self.points = {}
+        self.gui_files = {}
+        self.runs = {}
+        self.datasets = {}  # trend_id: dataset_id
+        self.selection = {}
+        self.n_files = 0
+
+    def add_points(self, points, dataset_id=None):
+        """
+        dataset_id - dataset of the trends, its generation is bumped by the flush
+        and the points are written with the new generation
+        """
+        for point in points:
+            self.points[(point["trend_id"], point["run"])] = point
+            if dataset_id is not None:
+                self.datasets[point["trend_id"]] = dataset_id
+
+    def add_selection_entries(self, entries):
+        """
+        SelectionIndex entries of trends receiving points, only trends
+        not in the index yet are written
+        """
+        if self.indexed is None:
+            self.indexed = get_selection_trend_ids()
+        for entry in entries:
+            if entry["trend_id"] not in self.indexed:
+                self.selection[entry["trend_id"]] = entry
+
+    def add_gui_file(self, file):
+        self.gui_files[file.path] = {
+            attr: str(getattr(file, attr)) for attr in GUI_FILE_ATTRIBUTES
+        }
+
+    def add_run(self, run):
+        self.runs[run.id] = {attr: getattr(run, attr) for attr in RUN_ATTRIBUTES}
+
+    def file_done(self):
+        """
+        Count a file as complete, the batch is written once it has size files
+        """
+        self.n_files += 1
+        if self.n_files >= self.size:
+            self.flush()
+
+    def flush(self):
+        if not (self.n_files or self.points or self.selection or self.runs):
+            return
+
+        logger.info(
+            "Write batch of %s files, %s points, %s runs to the DB ..."
+            % (len(self.gui_files), len(self.points), len(self.runs))
+        )
+        try:
+            # first, so the datasets of the runs below include the files of the batch
+            if self.gui_files:
+                stmt = get_insert(GUIFile.__table__)
+                stmt = stmt.on_conflict_do_nothing(index_elements=["path"])
+                session.execute(stmt, list(self.gui_files.values()))
+
+            # run metadata is part of the responses of the datasets with the runs
+            # the update also locks the datasets until the commit
+            dataset_ids = set(self.datasets.values())
+            # new selection entries change the selections served by the API
+            dataset_ids.update(x["dataset_id"] for x in self.selection.values())
+            moves_windows = bool(self.runs) and moves_run_windows(self.runs)
+            run_dataset_ids = get_run_dataset_ids(self.runs) if self.runs else []
+            dataset_ids.update(run_dataset_ids)
+            if moves_windows:
+                dataset_ids = None
+            if dataset_ids is None or dataset_ids:
+                stmt = Dataset.__table__.update()
+                if dataset_ids is not None:
+                    stmt = stmt.where(Dataset.id.in_(dataset_ids))
+                session.execute(stmt.values(generation=Dataset.generation + 1))
+            generations = dict(
+                session.query(Dataset.id, Dataset.generation).where(
+                    Dataset.id.in_(set(self.datasets.values()))
+                )
+            )
+            add_trend_points(
+                [
+                    dict(x, generation=generations.get(self.datasets.get(key[0])))
+                    for key, x in self.points.items()
+                ]
+            )
+            if run_dataset_ids:
+                # points of the runs are sent again by since_generation deltas
+                update_point_generations(self.runs, run_dataset_ids)
+
+            if self.runs:
+                stmt = get_insert(Run.__table__)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["id"],
+                    set_={
+                        attr: getattr(stmt.excluded, attr)
+                        for attr in RUN_ATTRIBUTES
+                        if attr != "id"
+                    },
+                )
+                session.execute(stmt, list(self.runs.values()))
+
+            if self.selection:
+                stmt = get_insert(SelectionEntry.__table__)
+                stmt = stmt.on_conflict_do_nothing(index_elements=["trend_id"])
+                session.execute(stmt, list(self.selection.values()))
+
+            session.commit()
+            if self.indexed is not None:
+                self.indexed.update(self.selection)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self.clear()
+        logger.info("Write batch ... ok")
+
+
 ##################################### DB API
+def moves_run_windows(runs):
+    """
+    True if runs are new or get their OMS data. The latest N runs and the OMS
+    filters of /api/data are taken over all runs, so the responses of every
+    dataset change, not only of the datasets with files of the runs.
+    """
+    # the batch runs may be changed objects of the session, not flushed yet
+    with session.no_autoflush:
+        known = session.query(Run.id, Run.oms).where(Run.id.in_(list(runs)))
+        known = dict(known)
+    return any(
+        x not in known or (known[x] is None and run["oms"] is not None)
+        for x, run in runs.items()
+    )
+
+
+def update_point_generations(runs, dataset_ids):
+    """
+    Points of the runs in the datasets get the generation of their dataset
+    """
+    generation = (
+        select(Dataset.generation)
+        .where(Dataset.id == Trend.dataset_id, Trend.id == TrendPoint.trend_id)
+        .scalar_subquery()
+    )
+    trend_ids = select(Trend.id).where(Trend.dataset_id.in_(dataset_ids))
+    session.execute(
+        TrendPoint.__table__.update()
+        .where(TrendPoint.trend_id.in_(trend_ids), TrendPoint.run.in_(list(runs)))
+        .values(generation=generation)
+    )
+
+
+def get_run_dataset_ids(runs):
+    """
+    Ids of the datasets with processed GUI files of the runs
+    """
+    query = (
+        session.query(Dataset.id)
+        .join(
+            GUIFile,
+            and_(
+                GUIFile.stream == Dataset.stream, GUIFile.reco_path == Dataset.reco_path
+            ),
+        )
+        .where(GUIFile.run.in_([str(x) for x in runs]))
+        .distinct()
+    )
+    return [x for x, in query]
+
+
+# columns added to existing tables, create_all() only creates missing tables
+# the lists of the applied migrations must not change, new columns get a new one
+DATASET_RUN_COLUMNS = [("Datasets", "generation"), ("Runs", "oms")]
+DATASET_RUN_COLUMNS += [
+    ("Runs", x)
+    for x in [
+        "fill_number",
+        "b_field",
+        "energy",
+        "stable_beam",
+        "delivered_lumi",
+        "recorded_lumi",
+        "duration",
+    ]
+]
+TREND_POINT_COLUMNS = [("TrendPoints", "generation")]
+
+
+def add_new_columns(columns):
+    inspector = sqlalchemy.inspect(engine)
+    for table, column in columns:
+        if column in [x["name"] for x in inspector.get_columns(table)]:
+            continue
+        logger.info('Add column "%s" to table "%s" ...' % (column, table))
+        model = Base.metadata.tables[table].c[column]
+        definition = model.type.compile(dialect=engine.dialect)
+        if model.server_default is not None:
+            definition += " NOT NULL DEFAULT %s" % model.server_default.arg
+        session.execute(
+            sqlalchemy.text(
+                'ALTER TABLE "%s" ADD COLUMN %s %s' % (table, column, definition)
+            )
+        )
+        session.commit()
+    # indexes of the new columns
+    for table, column in columns:
+        for index in Base.metadata.tables[table].indexes:
+            if column in index.columns:
+                index.create(bind=engine, checkfirst=True)
+
+
+def add_dataset_run_columns():
+    add_new_columns(DATASET_RUN_COLUMNS)
+
+
+def add_trend_point_columns():
+    add_new_columns(TREND_POINT_COLUMNS)
+
+
+# indexes of the /api/data, /api/expand_url and extractor lookups
+QUERY_INDEXES = [
+    "ix_GUIFiles_reco_path_stream_run",
+    "ux_Datasets_stream_reco_path",
+    "ix_Trends_dataset_id_subsystem",
+    "ix_Trends_config_id",
+    "ux_Trends_dataset_id_config_id",
+]
+# runs of the GUI files, datasets of the runs with updated metadata
+GUI_FILE_RUN_INDEXES = ["ix_GUIFiles_run"]
+
+
+def get_index(name):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+
+def add_indexes(names):
+    for index in map(get_index, names):
+        if index.unique:
+            # rows breaking the constraint have to be merged by hand
+            columns = list(index.columns)
+            duplicates = (
+                session.query(*columns)
+                .group_by(*columns)
+                .having(sqlalchemy.func.count() > 1)
+                .limit(10)
+                .all()
+            )
+            if duplicates:
+                raise RuntimeError(
+                    'Can not create unique index "%s", duplicated rows %s'
+                    % (index.name, duplicates)
+                )
+        logger.info('Create index "%s" ...' % index.name)
+        index.create(bind=engine, checkfirst=True)
+
+
+def add_query_indexes():
+    add_indexes(QUERY_INDEXES)
+
+
+def add_gui_file_run_index():
+    add_indexes(GUI_FILE_RUN_INDEXES)
+
+
+# versioned schema changes of existing DBs, applied in order by migrate_schema()
+# a migration only applies its own change and is never edited once released
+# new DBs get the full schema from create_all() and only record the versions
+MIGRATIONS = [
+    (1, "Dataset generation and typed OMS run columns", add_dataset_run_columns),
+    (2, "Indexes and unique constraints of the API queries", add_query_indexes),
+    (3, "Generation of the trend points", add_trend_point_columns),
+    (4, "Index of the GUI files by run", add_gui_file_run_index),
+    (5, "Selection index of the trends with points", rebuild_selection_index),
+    (6, "Run lumis in pb^-1", convert_run_lumis),
+]
+
+
+def get_schema_version():
+    SchemaVersion.__table__.create(bind=engine, checkfirst=True)
+    version = session.query(sqlalchemy.func.max(SchemaVersion.version)).scalar()
+    return version or 0
+
+
+def migrate_schema(target=None):
+    """
+    Apply the migrations newer than the DB schema version, up to target
+    """
+    version = get_schema_version()
+    for migration_version, description, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        if target is not None and migration_version > target:
+            break
+        logger.info(
+            "Migrate schema to version %s: %s ..." % (migration_version, description)
+        )
+        migration()
+        add_schema_version(migration_version, description)
+        session.commit()
+        logger.info("Migrate schema to version %s ... ok" % migration_version)
+
+
+def add_schema_version(version, description):
+    session.add(
+        SchemaVersion(
+            version=version,
+            description=description,
+            applied=datetime.datetime.utcnow(),
+        )
+    )
+
+
+def create_schema():
+    """
+    Full schema for a new DB with all migrations recorded, pending migrations
+    applied to an existing DB
+    """
+    if sqlalchemy.inspect(engine).get_table_names():
+        Base.metadata.create_all(engine)
+        migrate_schema()
+        return
+    logger.info("Create schema version %s ..." % MIGRATIONS[-1][0])
+    Base.metadata.create_all(engine)
+    for version, description, migration in MIGRATIONS:
+        add_schema_version(version, description)
+    session.commit()
 
 
 # setup DB
@@ -292,13 +1081,33 @@ def setup_db(db_path):
             print("Database already exists")
         else:
             raise err
-    Base.metadata.create_all(engine)
+    create_schema()
 
 
 if __name__ == "__main__":
     ### get path to the db
+    import argparse
     from dotenv import load_dotenv
 
+    parser = argparse.ArgumentParser(description="HDQM DB setup.")
+    parser.add_argument(
+        "--migrate-points",
+        action="store_true",
+        help="Move points from the legacy Trend.points column to TrendPoints",
+    )
+    parser.add_argument(
+        "--migrate-runs",
+        action="store_true",
+        help="Move OMS data from the legacy Runs.oms_data column to typed columns",
+    )
+    parser.add_argument(
+        "--build-selection-index",
+        action="store_true",
+        help="Fill the SelectionIndex table from all trends with points",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
     load_dotenv()
     db_path = get_formatted_db_uri(
         username=os.getenv("DB_USERNAME"),
@@ -309,3 +1118,9 @@ if __name__ == "__main__":
     )
     create_session(db_path)
     setup_db(db_path)
+    if args.migrate_points:
+        migrate_trend_points()
+    if args.migrate_runs:
+        migrate_run_metadata()
+    if args.build_selection_index:
+        rebuild_selection_index()
@@ -6,21 +6,27 @@ import os
 import db
 import re
 import sys
-import ROOT
 import math
 import logging
+import functools
+import multiprocessing
 from logging.handlers import TimedRotatingFileHandler
 import argparse
 from configparser import RawConfigParser
 from glob import glob
 from collections import defaultdict
 
+from file_catalog import FileCatalog
+from me_resolver import MEResolver, MissingMEs
+from readers import READERS, ROOTReader
+from pipeline import Pipeline, Stage
+from staging_cache import StagingCache
 from extra import (
     TrendCfg,
     DQMFile,
+    ProcessedFiles,
     compare_configs,
-    add_point_to_trend,
-    get_plot_path,
+    expand_family,
     nostdout,
 )
 
@@ -29,15 +35,18 @@ from backend import oms_extractor
 from backend import rr_extractor
 
 from metrics import basic, fits, muon_metrics, L1T_metrics, hcal_metrics
+from metrics.histogram import HistogramView
 
 LOGLEVEL = logging.DEBUG
 LOGPATH = "./dqm_extractor.log"
 CFGFILES = "backend/cfg/*/*.ini"
 NLOGS = 10
 GUIDATADIR = "/eos/cms/store/group/comm_dqm/DQMGUI_data"
-GUIDATADIR = "/eos/cms/store/group/comm_dqm/DQMGUI_data/Run2022/MinimumBias/0003557xx/"
-GUIDATADIR = "/eos/cms/store/group/comm_dqm/DQMGUI_data/*/*/*/"
+GUIDATADEPTH = 3  # GUIDATADIR/<era>/<pd>/<runs>/
 GUIDATAPATTERN = "DQM_V*DQMIO.root"
+CATALOGTHREADS = 16
+PIPELINE_STATS_FILES = 100  # log the pipeline stage counters every N files
+STAGING_SAVE_FILES = 10  # save the staging cache index every N staged files
 PDPATTERN = re.compile("DQM_V\d+_R\d+__(.+__.+__.+)[.]root")  # PD inside the file name
 VERSIONPATTERN = re.compile("(DQM_V)(\d+)(.+[.]root)")
 RUNPATTERN = re.compile("DQM_V\d+_R0+(\d+)__.+[.]root")
@@ -68,7 +77,13 @@ def read_cfgs(cfg_files):
             if not subsystem:
                 subsystem = "Unknown"
 
+            sections = []
             for section in parser:
+                if section.startswith("family:"):
+                    sections += expand_family(
+                        cfg_file, section, parser[section], METRICS_MAP
+                    )
+                    continue
                 if not section.startswith("plot:"):
                     if section != "DEFAULT":
                         logger.info(
@@ -76,6 +91,9 @@ def read_cfgs(cfg_files):
                             % (cfg_file, section)
                         )
                     continue
+                sections += [(section, parser[section], None, None)]
+
+            for section, data, family, output in sections:
                 if not PLOTNAMEPATTERN.match(section.lstrip("plot:")):
                     logger.info(
                         "Invalid plot name: '%s:%s' Plot names can contain only: [a-zA-Z0-9_+-]"
@@ -83,7 +101,8 @@ def read_cfgs(cfg_files):
                     )
                     continue
 
-                trend = TrendCfg(cfg_file, section, parser[section], subsystem)
+                trend = TrendCfg(cfg_file, section, data, subsystem)
+                trend.family, trend.output = family, output
 
                 pars = ["metric", "relativePath", "yTitle"]  # mandatory parameters
                 for par in pars:
@@ -119,50 +138,144 @@ def read_cfgs(cfg_files):
     return trend_cfgs, mes_set
 
 
-def process_gui_root(file, trend_cfgs, mes):
-    logger.info('Process "%s"' % file.path)
-
-    ### get dataset & trends for type of root file name
-    dataset = db.get_dataset(file.stream, file.reco_path)
-    if not dataset:
-        dataset = db.add_dataset(file.stream, file.reco_path)
-
-    logger.info(
-        'Process Dataset %s "%s" "%s"' % (dataset.id, dataset.stream, dataset.reco_path)
-    )
-
-    trends = db.get_trends(dataset)
-    if not trends:
-        db.add_trends(dataset, trend_cfgs)
-        trends = db.get_trends(dataset)
-
-    trends = sorted(trends, key=lambda x: x.config_id)
-
-    ### read all MEs from root file
+def get_view(views, me_dic, me):
+    """
+    HistogramView of an ME, made on the first request. None if the ME can not be viewed
+    """
+    if me not in views:
+        if isinstance(me_dic[me], HistogramView):
+            views[me] = me_dic[me]  # read by the uproot reader
+            return views[me]
+        try:
+            views[me] = HistogramView.from_root(me_dic[me])
+        except Exception as error_log:
+            logger.debug('No HistogramView of "%s": %s' % (me, error_log))
+            views[me] = None
+    return views[me]
+
+
+def calculate_metric(metric_func, me_paths, me_dic, views, multi=False):
+    """
+    Evaluate a metric on the HistogramViews of the MEs if the metric supports them,
+    on the ROOT histograms otherwise.
+    me_paths are the main histogram, histo1, histo2 and reference paths.
+    multi - evaluate all outputs of a MultiMetric
+    """
+    if multi:
+        calculate = metric_func.calculateAll
+        calculate_view = metric_func.calculateAllView
+    else:
+        calculate = metric_func.calculate
+        calculate_view = metric_func.calculateView
+    setters = [
+        metric_func.setOptionalHisto1,
+        metric_func.setOptionalHisto2,
+        metric_func.setReference,
+    ]
+    if metric_func.supportsView():
+        hviews = [get_view(views, me_dic, x) if x else None for x in me_paths]
+        if all(view is not None for view, x in zip(hviews, me_paths) if x):
+            for setter, view, x in zip(setters, hviews[1:], me_paths[1:]):
+                if x:
+                    setter(view)
+            try:
+                return calculate_view(hviews[0])
+            except NotImplementedError:
+                pass
+
+    for setter, x in zip(setters, me_paths[1:]):
+        if x:
+            setter(get_histo(me_dic[x]))
+    return calculate(get_histo(me_dic[me_paths[0]]))
+
+
+def get_histo(me):
+    "ROOT histogram of an ME, ROOT is imported here by the uproot reader"
+    return me.to_root() if isinstance(me, HistogramView) else me
+
+
+def calculate_output(metric_func, me_paths, me_dic, views, results):
+    """
+    Output of a MultiMetric for one trend. All outputs are evaluated on the first
+    request and shared with the other trends of the family reading the same MEs.
+    """
+    key = (id(metric_func.family), tuple(me_paths))
+    if key not in results:
+        try:
+            results[key] = calculate_metric(
+                metric_func.family, me_paths, me_dic, views, multi=True
+            )
+        except Exception as error_log:
+            results[key] = error_log
+    if isinstance(results[key], Exception):
+        raise results[key]
+    return results[key][metric_func.output]
+
+
+def extract_trend_points(file, trend_cfgs, mes, fit_cache=None, skip=(), reader=None):
+    """
+    Read all MEs from a GUI ROOT file and evaluate the trend metrics on them.
+    Nothing is written to the DB here, so this can run in a worker process.
+    Returns (status, points) with points as a list of (config db_id, value, error).
+    mes - MEResolver of the MEs of the trends, or the ME paths
+    fit_cache - fits.FitCache to seed the fits with the previous run of the trend
+    skip - MEs not to look up, missing in the last files of the dataset
+    reader - one of READERS, ROOTReader by default
+    """
+    resolver = mes if isinstance(mes, MEResolver) else MEResolver(mes)
+    reader = reader or ROOTReader()
+    tdirectory = open_gui_file(file, reader)
+    if tdirectory is None:
+        return 1, []
+
+    me_dic = resolver.resolve(tdirectory, file.run, skip)
+    log_me_stats(resolver.n_mes, resolver.stats)
+    points = calculate_trend_points(file, trend_cfgs, me_dic, fit_cache, skip)
+    reader.close(tdirectory)
+    return 0, points
+
+
+def open_gui_file(file, reader):
+    """
+    The file opened by the reader, None if it can not be read
+    """
     logger.info('Extract MEs from "%s"' % file.path)
     try:
-        tdirectory = ROOT.TFile.Open(file.path)
+        tdirectory = reader.open(file.local_path or file.path)
         if tdirectory == None:
             logger.warning("Unable to open file: '%s', skip" % file.path)
-            return 1
+        return tdirectory
     except Exception as error_log:
         logger.warning("Unable to read file: '%s', skip" % file.path)
         logger.warning("Error ... %s " % error_log)
-        return 1
+        return None
 
-    me_dic = {}
-    for me in mes:
-        plot = tdirectory.Get(get_plot_path(me, file.run))
-        if not plot:
-            logger.debug('No MEs "%s" available in "%s"' % (me, file.path))
-            continue
-        me_dic[me] = plot
-    logger.info("Available/Requested MEs = %s/%s" % (len(me_dic), len(mes)))
 
-    ### calculate all trends based on MEs from root file
+def log_me_stats(n_mes, stats):
+    logger.info(
+        "Available/Requested/Skipped MEs = %s/%s/%s, folders read/missing = %s/%s "
+        "in %.3f s"
+        % (
+            stats["hits"],
+            n_mes,
+            stats["skipped"],
+            stats["folders"],
+            stats["missing_folders"],
+            stats["seconds"],
+        )
+    )
+
+
+def calculate_trend_points(file, trend_cfgs, me_dic, fit_cache=None, skip=()):
+    """
+    Evaluate the trend metrics on the MEs read from a file,
+    returns the points as a list of (config db_id, value, error)
+    """
     logger.info('Calculating trends for "%s"' % file.path)
-    processed_trends = []
-    for trend_cfg, trend in zip(trend_cfgs, trends):
+    points = []
+    views = {}  # ME -> HistogramView, shared by all trends of the ME
+    family_results = {}  # (MultiMetric, MEs) -> outputs
+    for trend_cfg in trend_cfgs:
         metric_func = trend_cfg.metric_func
         if not metric_func:
             logger.info(
@@ -171,43 +284,37 @@ def process_gui_root(file, trend_cfgs, mes):
             )
             continue
 
-        is_ok = True
-        if trend_cfg.histo1_path:
-            hist = me_dic.get(trend_cfg.histo1_path, None)
-            if hist:
-                metric_func.setOptionalHisto1(hist)
-            else:
-                is_ok = False
-
-        if trend_cfg.histo2_path:
-            hist = me_dic.get(trend_cfg.histo2_path, None)
-            if hist:
-                metric_func.setOptionalHisto2(hist)
-            else:
-                is_ok = False
-
-        if trend_cfg.reference_path:
-            hist = me_dic.get(trend_cfg.reference_path, None)
-            if hist:
-                metric_func.setReference(hist)
-            else:
-                is_ok = False
-
-        main_hist = me_dic.get(trend_cfg.relative_path, None)
-        if not main_hist:
-            is_ok = False
-
-        if not is_ok:
+        me_paths = [
+            trend_cfg.relative_path,
+            trend_cfg.histo1_path,
+            trend_cfg.histo2_path,
+            trend_cfg.reference_path,
+        ]
+        if not all(me_dic.get(x, None) for x in me_paths if x):
+            if any(x in skip for x in me_paths):
+                continue
             logger.debug(
                 "Unable to get an monitor element for trend/cfg %s/%s, skip"
                 % (trend_cfg.name, trend_cfg.cfg_path)
             )
             continue
 
+        if fit_cache is not None and isinstance(metric_func, fits.FitMetric):
+            metric_func.setFitCache(
+                fit_cache, (trend_cfg.db_id, file.stream, file.reco_path), file.run
+            )
+
         # Calculate
         try:
             with nostdout():  # supress metrics stdout & stderr
-                value, error = metric_func.calculate(main_hist)
+                if isinstance(metric_func, basic.MetricOutput):
+                    value, error = calculate_output(
+                        metric_func, me_paths, me_dic, views, family_results
+                    )
+                else:
+                    value, error = calculate_metric(
+                        metric_func, me_paths, me_dic, views
+                    )
         except Exception as error_log:
             logger.warning(
                 "Unable to calculate the metric for trend/cfg %s/%s, skip"
@@ -216,6 +323,17 @@ def process_gui_root(file, trend_cfgs, mes):
             logger.warning("Error ... %s " % error_log)
             continue
 
+        if isinstance(metric_func, fits.FitMetric):
+            logger.debug(
+                "Fit of trend/cfg %s/%s: status %s after %s iterations"
+                % (
+                    trend_cfg.name,
+                    trend_cfg.cfg_path,
+                    metric_func.fitStatus,
+                    metric_func.fitIterations,
+                )
+            )
+
         if math.isinf(value):
             logger.warning(
                 "Inf metric responce value for trend/cfg %s/%s, skip"
@@ -230,28 +348,279 @@ def process_gui_root(file, trend_cfgs, mes):
             )
             continue
 
-        # add new [run , value, error ] point to the trend
-        # if we reprocessing the same run as in DB we updating points values
-        add_point_to_trend(trend, dataset, trend_cfg, file.run, value, error)
+        points += [(trend_cfg.db_id, value, error)]
+
+    logger.info(
+        "Processed/Requested Trends = %s/%s" % (len(points), len(trend_cfgs))
+    )
+    return points
 
-        processed_trends += [trend]
+
+def store_trend_points(file, trend_cfgs, points, batch):
+    """
+    Add [run, value, error] points calculated for a file to the trends of its dataset.
+    Points, and the dataset & trends created for them, are written to the DB when
+    the batch is flushed.
+    Must only be called from the single writer (the main process).
+    """
+    ### get dataset & trends for type of root file name
+    dataset = db.get_dataset(file.stream, file.reco_path)
+    if not dataset:
+        dataset = db.add_dataset(file.stream, file.reco_path)
 
     logger.info(
-        "Processed/Requested Trends = %s/%s" % (len(processed_trends), len(trend_cfgs))
+        'Process Dataset %s "%s" "%s"' % (dataset.id, dataset.stream, dataset.reco_path)
     )
-    logger.info("Updating trends in the DB ...")
-    db.session.commit()
 
-    tdirectory.Close()
+    trends = {trend.config_id: trend for trend in db.get_trends(dataset)}
+    missing_cfgs = [x for x in trend_cfgs if x.db_id not in trends]
+    if missing_cfgs:
+        db.add_trends(dataset, missing_cfgs)
+        trends = {trend.config_id: trend for trend in db.get_trends(dataset)}
+
+    # add new [run , value, error ] points to the trends
+    # if we reprocessing the same run as in DB we updating points values
+    batch.add_points(
+        [
+            {
+                "trend_id": trends[config_id].id,
+                "run": file.run,
+                "value": value,
+                "error": error,
+            }
+            for config_id, value, error in points
+        ],
+        dataset.id,
+    )
+
+    # trends with their first point become selectable in the web application
+    names = {x.db_id: x.name for x in trend_cfgs}
+    batch.add_selection_entries(
+        [
+            {
+                "trend_id": trends[config_id].id,
+                "subsystem": trends[config_id].subsystem,
+                "dataset_id": dataset.id,
+                "stream": dataset.stream,
+                "reco_path": dataset.reco_path,
+                "config_id": config_id,
+                "name": names[config_id],
+            }
+            for config_id, value, error in points
+        ]
+    )
+
+
+def process_gui_root(file, trend_cfgs, mes):
+    logger.info('Process "%s"' % file.path)
+    result, points = extract_trend_points(file, trend_cfgs, mes)
+    if result:
+        return result
+    batch = db.WriteBatch()
+    store_trend_points(file, trend_cfgs, points, batch)
+    batch.flush()
     return 0
 
 
+### process pool workers
+# Workers are forked from the main process and inherit the trend configs with
+# their metrics. They only read ROOT files and evaluate metrics, all DB writes
+# are done by the main process so two files of one dataset never race on a trend.
+# Without workers the main process runs the read and compute stages in threads.
+WORKER_STATE = {}
+
+
+def init_worker(trend_cfgs, mes, fit_warm_start, missing_mes, reader):
+    fit_cache = fits.FitCache() if fit_warm_start else None
+    set_worker_state(trend_cfgs, mes, fit_cache, missing_mes, reader)
+
+
+def set_worker_state(trend_cfgs, mes, fit_cache, missing_mes, reader, threaded=False):
+    WORKER_STATE["trend_cfgs"] = trend_cfgs
+    WORKER_STATE["mes"] = MEResolver(mes)
+    WORKER_STATE["fit_cache"] = fit_cache
+    WORKER_STATE["reader"] = READERS[reader](threaded)
+    # own copy, updated with the files of this worker only
+    WORKER_STATE["missing_mes"] = missing_mes.copy()
+
+
+def log_pipeline_stats(pipeline, cache):
+    for stats in pipeline.stats:
+        logger.info("Pipeline stage %s" % stats)
+    if cache:
+        logger.info("Staging cache %s" % cache)
+
+
+def stage_file(cache, file):
+    """
+    Stage stage: copies the file to the staging cache ahead of the read stage
+    """
+    file.local_path = cache.stage(file.path)
+    return file
+
+
+def extract_file(file):
+    """
+    Returns the file, the status and the points of extract_trend_points()
+    and the MEResolver stats of the file, None if it was not read
+    """
+    logger.info('Process "%s"' % file.path)
+    resolver = WORKER_STATE["mes"]
+    missing_mes = WORKER_STATE["missing_mes"]
+    resolver.stats = {}
+    try:
+        result, points = extract_trend_points(
+            file,
+            WORKER_STATE["trend_cfgs"],
+            resolver,
+            WORKER_STATE["fit_cache"],
+            missing_mes.get_skipped(file.stream, file.reco_path),
+            WORKER_STATE["reader"],
+        )
+    except Exception as error_log:
+        logger.warning("Worker failed to process file: '%s', skip" % file.path)
+        logger.warning("Error ... %s " % error_log)
+        result, points = 1, []
+    stats = resolver.stats or None
+    if stats:
+        missing_mes.update(file.stream, file.reco_path, stats["missing"])
+    return file, result, points, stats
+
+
+def read_file(file):
+    """
+    Read stage: opens the file and reads its MEs ahead of the compute stage.
+    Returns the file, the opened file, the MEs, the skipped MEs and the MEResolver
+    stats, the opened file is None if the file was not read
+    """
+    logger.info('Process "%s"' % file.path)
+    resolver = WORKER_STATE["mes"]
+    missing_mes = WORKER_STATE["missing_mes"]
+    tdirectory = open_gui_file(file, WORKER_STATE["reader"])
+    if tdirectory is None:
+        return file, None, {}, set(), None
+    try:
+        skip = missing_mes.get_skipped(file.stream, file.reco_path)
+        me_dic, stats = resolver.resolve_with_stats(tdirectory, file.run, skip)
+    except Exception as error_log:
+        logger.warning("Failed to read MEs of file: '%s', skip" % file.path)
+        logger.warning("Error ... %s " % error_log)
+        WORKER_STATE["reader"].close(tdirectory)
+        return file, None, {}, set(), None
+    log_me_stats(resolver.n_mes, stats)
+    missing_mes.update(file.stream, file.reco_path, stats["missing"])
+    return file, tdirectory, me_dic, skip, stats
+
+
+def compute_file(item):
+    """
+    Compute stage: evaluates the metrics on the MEs of read_file() and closes the
+    file, returns the same as extract_file()
+    """
+    file, tdirectory, me_dic, skip, stats = item
+    if tdirectory is None:
+        return file, 1, [], stats
+    try:
+        points = calculate_trend_points(
+            file,
+            WORKER_STATE["trend_cfgs"],
+            me_dic,
+            WORKER_STATE["fit_cache"],
+            skip,
+        )
+        result = 0
+    except Exception as error_log:
+        logger.warning("Failed to process file: '%s', skip" % file.path)
+        logger.warning("Error ... %s " % error_log)
+        result, points = 1, []
+    # ROOT histograms are owned by their file
+    WORKER_STATE["reader"].close(tdirectory)
+    return file, result, points, stats
+
+
 if __name__ == "__main__":
     from dotenv import load_dotenv
 
     ### setup
     load_dotenv()
     parser = argparse.ArgumentParser(description="HDQM trend calculation.")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to read GUI files and evaluate metrics. "
+        "DB writes are always done by the main process.",
+    )
+    parser.add_argument(
+        "--read-threads",
+        type=int,
+        default=1,
+        help="Number of threads opening the next GUI files and reading their MEs "
+        "while the metrics of the previous files are evaluated. Used without workers, "
+        "workers read and evaluate their files themselves.",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=4,
+        help="Number of files waiting in front of each stage of the extraction "
+        "pipeline (read, compute/extract, write).",
+    )
+    parser.add_argument(
+        "--staging-dir",
+        default=os.environ.get("STAGING_DIR", None),
+        help="Local scratch directory, e.g. on an SSD, caching the GUI files "
+        "read from EOS. Files are copied ahead of the read stage and reused by the "
+        "next runs. Off by default.",
+    )
+    parser.add_argument(
+        "--staging-gb",
+        type=float,
+        default=100,
+        help="Size of the staging cache in GB, the least recently used files are "
+        "removed to make room.",
+    )
+    parser.add_argument(
+        "--staging-threads",
+        type=int,
+        default=2,
+        help="Number of threads copying the next GUI files to the staging cache.",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=10,
+        help="Number of GUI files written to the DB in one transaction.",
+    )
+    parser.add_argument(
+        "--reader",
+        choices=list(READERS),
+        default="root",
+        help="Reader of the GUI files. uproot reads histograms into NumPy arrays "
+        "without ROOT, ROOT is loaded only for metrics needing it, e.g. fits.",
+    )
+    parser.add_argument(
+        "--missing-me-files",
+        type=int,
+        default=5,
+        help="Do not look up MEs missing in this number of consecutive files of "
+        "a dataset, 0 to look up all MEs in every file.",
+    )
+    parser.add_argument(
+        "--missing-me-probe",
+        type=int,
+        default=50,
+        help="Look up the missing MEs of a dataset again every this number of files.",
+    )
+    parser.add_argument(
+        "--fit-warm-start",
+        action="store_true",
+        help="Seed the fit metrics with the converged parameters of the previous "
+        "run of the trend and stop fitting once the fit converged.",
+    )
+    args = parser.parse_args()
     log = logging.getLogger(__file__)
     logger.setLevel(LOGLEVEL)
     formatter = logging.Formatter(
@@ -274,9 +643,6 @@ if __name__ == "__main__":
     logger.info("Start " + str(__file__))
     logger.info("Create %s log file" % LOGPATH)
 
-    ### some metrics pop up canvases -_-
-    ROOT.gROOT.SetBatch(True)
-
     ### get path to the db
     db_path = db.get_formatted_db_uri(
         username=os.environ.get("DB_USERNAME", "postgres"),
@@ -349,7 +715,10 @@ if __name__ == "__main__":
     metric_dic = defaultdict(int)
     for trend in trend_cfgs:
         try:
-            metric = eval(trend.data["metric"], METRICS_MAP)
+            if trend.family:
+                metric = trend.family[trend.output]
+            else:
+                metric = eval(trend.data["metric"], METRICS_MAP)
             trend.SetMetric(metric)
             metric_str = trend.data["metric"]
             metric_dic[metric_str.split("(")[0]] += 1
@@ -426,25 +795,26 @@ if __name__ == "__main__":
     logger.info("Get known runs from the DB ...")
     db_runs = db.get_runs()
     db_runs_dic = {run.id: run for run in db_runs}
+    for run in db_runs:
+        # runs are updated through the write batch, not by the session
+        db.session.expunge(run)
     logger.info("Found %s known runs ..." % len(db_runs))
 
     ### get list if root files
-    root_files = []
-    logger.info("The process was restarted, so, we need to check all new files")
-    logger.info("Find all GUI ROOT files on EOS (several minutes ...)")
-
-    import subprocess
-
-    command = "find " + GUIDATADIR + " -name " + GUIDATAPATTERN
-    logger.info('Execute "%s"' % command)
+    # only directories modified since the previous start are listed again
+    logger.info("Update catalog of GUI ROOT files on EOS ...")
     try:
-        output = subprocess.check_output(command, shell=True)
-        output = output.decode("utf-8").split("\n")
-        root_files = output
-        if len(root_files) and not root_files[-1]:
-            root_files.pop()  # remove last empty entries from find return
+        catalog = FileCatalog(
+            GUIDATADIR,
+            GUIDATAPATTERN,
+            GUIDATADEPTH,
+            db.get_catalog(),
+            CATALOGTHREADS,
+        )
+        root_files = catalog.update()
+        db.update_catalog(catalog.changed, catalog.removed)
     except Exception as error_log:
-        logger.info('find failed with error "%s"' % error_log)
+        logger.info('catalog update failed with error "%s"' % error_log)
         exit()
 
     logger.info("Find %s GUI files" % len(root_files))
@@ -482,49 +852,139 @@ if __name__ == "__main__":
     # logger.info('Number of GUI files after filtering %s' % nfiles )
 
     ### process files
+    logger.info("Get processed GUI files from the DB ...")
+    processed_files = ProcessedFiles(db.get_gui_file_paths())
+    logger.info("Found %s processed GUI files" % len(processed_files))
+
     logger.info("Start extraction of MEs from files")
-    good_files = 0
+    files_to_process = []
     for subdir, files in dqm_files.items():
         logger.info(
-            'Process directory "%s" with %s files' % (subdir, len(files.values()))
+            'Check directory "%s" with %s files' % (subdir, len(files.values()))
         )
-        files_tot = len(files.values())
-        for n, file in enumerate(files.values()):
-            logger.info("File number = %s/%s" % (n, files_tot))
-            if db.check_gui_file(file):
-                logger.info("Skip file already in the DB %s" % file.path)
+        for file in files.values():
+            if file.path in processed_files:
+                logger.debug("Skip file already in the DB %s" % file.path)
                 continue
+            files_to_process += [file]
 
-            result = process_gui_root(file, trend_cfgs, mes)
-            if not result:
-                good_files += 1
-
-            # add file as procecced to the DB
-            db.add_gui_file(file)
-
-            # if run is not known - update OMS and RR data
-            db_run = db_runs_dic.get(file.run, None)
-            if not db_run:
-                db_run = db.add_run(file.run)
-                db_runs_dic[file.run] = db_run
-
-            if not db_run.oms_data:
-                oms_data = oms_extractor.get_oms_run(db_run.id)
-                if oms_data:
-                    logger.info("Update oms run info for run %s" % db_run.id)
-                    db_run.oms_data = str(oms_data)
-                    db.session.commit()
-                else:
-                    logger.info("No OMS data for run %s" % db_run.id)
-
-            if not db_run.rr_run_class:
-                rr_data = rr_extractor.get_rr_run(file.run)
-                if rr_data:
-                    logger.info("Update RR run info for run %s" % db_run.id)
-                    db_run.rr_run_class = str(rr_data["rr_run_class"])
-                    db_run.rr_significant = bool(rr_data["rr_significant"])
-                    db.session.commit()
-                else:
-                    logger.info("No RR data for run %s" % db_run.id)
+    files_tot = len(files_to_process)
+    logger.info("Found %s new GUI files to process" % files_tot)
+
+    fit_cache = None
+    if args.fit_warm_start:
+        # consecutive runs of a trend are nearly identical
+        files_to_process.sort(key=lambda x: x.run)
+        fit_cache = fits.FitCache()
+
+    # record of all files, workers skip MEs using their own copies
+    missing_mes = MissingMEs(
+        db.get_missing_mes(), args.missing_me_files, args.missing_me_probe
+    )
+    # stages connected by bounded queues, the main thread is the single DB writer
+    pool = None
+    if args.workers > 1:
+        logger.info("Use a pool of %s worker processes" % args.workers)
+        pool = multiprocessing.get_context("fork").Pool(
+            args.workers,
+            initializer=init_worker,
+            initargs=(
+                trend_cfgs,
+                mes,
+                args.fit_warm_start,
+                missing_mes,
+                args.reader,
+            ),
+        )
+        # a thread per worker keeps one file in each worker
+        stages = [
+            Stage("extract", lambda x: pool.apply(extract_file, (x,)), args.workers)
+        ]
+    else:
+        set_worker_state(
+            trend_cfgs,
+            mes,
+            fit_cache,
+            missing_mes,
+            args.reader,
+            threaded=True,
+        )
+        # metrics keep their histograms between calls, so one compute thread
+        stages = [
+            Stage("read", read_file, args.read_threads),
+            Stage("compute", compute_file),
+        ]
+    cache = None
+    if args.staging_dir:
+        cache = StagingCache(
+            args.staging_dir, int(args.staging_gb * 1e9), STAGING_SAVE_FILES
+        )
+        logger.info("Stage GUI files in %s, %s" % (args.staging_dir, cache))
+        stage = functools.partial(stage_file, cache)
+        stages.insert(0, Stage("stage", stage, args.staging_threads))
+    pipeline = Pipeline(files_to_process, stages, args.queue_depth)
+
+    batch = db.WriteBatch(args.batch_size)
+    good_files = 0
+    me_stats = defaultdict(int)
+    for n, (file, result, points, stats) in enumerate(pipeline.results("write")):
+        logger.info("File number = %s/%s" % (n, files_tot))
+        if n and not n % PIPELINE_STATS_FILES:
+            log_pipeline_stats(pipeline, cache)
+        if cache:
+            cache.release(file.path)
+        if stats:
+            missing_mes.update(file.stream, file.reco_path, stats["missing"])
+            for x in ["hits", "misses", "skipped"]:
+                me_stats[x] += stats[x]
+        if not result:
+            store_trend_points(file, trend_cfgs, points, batch)
+            good_files += 1
+
+        # add file as procecced to the DB
+        batch.add_gui_file(file)
+        processed_files.add(file.path)
+
+        # if run is not known - update OMS and RR data
+        db_run = db_runs_dic.get(file.run, None)
+        if not db_run:
+            logger.info('Add new run "%s" to the DB ...' % file.run)
+            db_run = db.Run(id=file.run)
+            db_runs_dic[file.run] = db_run
+            batch.add_run(db_run)
+
+        if db_run.oms is None and not db_run.oms_data:
+            oms_data = oms_extractor.get_oms_run(db_run.id)
+            if oms_data and isinstance(oms_data, dict):
+                logger.info("Update oms run info for run %s" % db_run.id)
+                db.set_run_oms(db_run, oms_data)
+                batch.add_run(db_run)
+            else:
+                logger.info("No OMS data for run %s" % db_run.id)
+
+        if not db_run.rr_run_class:
+            rr_data = rr_extractor.get_rr_run(file.run)
+            if rr_data:
+                logger.info("Update RR run info for run %s" % db_run.id)
+                db_run.rr_run_class = str(rr_data["rr_run_class"])
+                db_run.rr_significant = bool(rr_data["rr_significant"])
+                batch.add_run(db_run)
+            else:
+                logger.info("No RR data for run %s" % db_run.id)
+
+        batch.file_done()
+    batch.flush()
+
+    if pool:
+        pool.close()
+        pool.join()
+    db.update_missing_mes(missing_mes.pop_changed())
 
     logger.info("Number of processed GUI files %s" % good_files)
+    log_pipeline_stats(pipeline, cache)
+    if cache:
+        cache.save()
+    logger.info(
+        "ME lookups found/missing = %s/%s, skipped lookups of missing MEs = %s"
+        % (me_stats["hits"], me_stats["misses"], me_stats["skipped"])
+    )
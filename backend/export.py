@@ -0,0 +1,138 @@
+"""
+Streaming exports of whole datasets for /api/export.
+Points come as (trend_id, run, value, error) rows sorted by trend and run, from a
+server side cursor, and are encoded a trend at a time so that memory use does not
+depend on the size of the export.
+Parquet needs pyarrow, which is in requirements.txt, it is offered only if it
+is installed.
+"""
+
+import io
+import csv
+import json
+from itertools import groupby
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+CSV_MIMETYPE = "text/csv"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+CSV_COLUMNS = ["trend_id", "name", "run", "value", "error"]
+PARQUET_ROW_GROUP = 100000  # points
+
+
+def group_trends(rows):
+    "(trend_id, [(run, value, error), ...]) of rows sorted by trend_id"
+    for trend_id, points in groupby(rows, key=lambda x: x[0]):
+        yield trend_id, [(x[1], x[2], x[3]) for x in points]
+
+
+def export_ndjson(series, rows):
+    """
+    A line per trend with points:
+    {"metadata": {...}, "runs": [...], "values": [...], "errors": [...]}
+    """
+    for trend_id, points in group_trends(rows):
+        runs, values, errors = zip(*points)
+        line = {
+            "metadata": series[trend_id],
+            "runs": runs,
+            "values": values,
+            "errors": errors,
+        }
+        yield json.dumps(line) + "\n"
+
+
+def export_csv(series, rows):
+    "A line per point with the trend id and name"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+    for trend_id, points in group_trends(rows):
+        name = series[trend_id]["name"]
+        writer.writerows((trend_id, name) + point for point in points)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Writable file keeping the bytes written until they are popped,
+    ParquetWriter output is sent while the file is written
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_parquet(series, rows):
+    """
+    Parquet file with a row per point and a row group per ~PARQUET_ROW_GROUP points.
+    Metadata of the series is JSON in the schema metadata.
+    """
+    schema = pyarrow.schema(
+        [
+            ("trend_id", pyarrow.int32()),
+            ("name", pyarrow.string()),
+            ("run", pyarrow.int32()),
+            ("value", pyarrow.float64()),
+            ("error", pyarrow.float64()),
+        ],
+        metadata={"series": json.dumps(list(series.values()))},
+    )
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    columns = {x: [] for x in schema.names}
+
+    def write_row_group():
+        writer.write_table(pyarrow.table(columns, schema=schema))
+        for column in columns.values():
+            column.clear()
+        return sink.pop()
+
+    for trend_id, points in group_trends(rows):
+        columns["trend_id"] += [trend_id] * len(points)
+        columns["name"] += [series[trend_id]["name"]] * len(points)
+        for column, values in zip(["run", "value", "error"], zip(*points)):
+            columns[column] += values
+        if len(columns["run"]) >= PARQUET_ROW_GROUP:
+            yield write_row_group()
+    if columns["run"]:
+        yield write_row_group()
+    writer.close()
+    yield sink.pop()
+
+
+def get_formats():
+    "export formats: (mimetype, encoder)"
+    formats = {
+        "ndjson": (NDJSON_MIMETYPE, export_ndjson),
+        "csv": (CSV_MIMETYPE, export_csv),
+    }
+    if pyarrow:
+        formats["parquet"] = (PARQUET_MIMETYPE, export_parquet)
+    return formats
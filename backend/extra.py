@@ -1,8 +1,13 @@
 # P.S.~Mandrik, IHEP, 2022, https://github.com/pmandrik
 
+import re
 import sys
+import hashlib
 import logging
 import contextlib
+from configparser import RawConfigParser
+from array import array
+from bisect import bisect_left
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +29,9 @@ class TrendCfg:
         self.threshold = data.get("threshold", None)
         self.metric_func = None
         self.db_id = None
+        # MultiMetric & its output for the trends of a [family:] section
+        self.family = None
+        self.output = None
 
     def SetMetric(self, metric_func):
         self.metric_func = metric_func
@@ -40,6 +48,48 @@ class TrendCfg:
         return [x for x in answer if x]
 
 
+def expand_family(cfg_file, section, data, metrics):
+    """
+    Plot sections of a [family:NAME] section. The family metric is a MultiMetric,
+    evaluated once per file for all its outputs, and every output is a trend:
+        metric = hcal_metrics.RBXMeans((1, 2, 0))
+        plotName = MeanTime-{output}-depth12
+        yTitle = Mean time - {output} - depth12
+        outputs = HBM01, HBM02    (optional, all outputs of the metric by default)
+    {output} in plotName, yTitle & plotTitle is replaced by the output name, other
+    parameters are the same for all trends.
+    metrics - modules the metric expressions are evaluated with.
+    Returns a list of (plot section name, section, family metric, output).
+    """
+    try:
+        family = eval(data["metric"], metrics)
+        outputs = data.get("outputs", None)
+        if outputs:
+            outputs = [x for x in re.split("[\\s,]+", outputs) if x]
+        else:
+            outputs = family.outputs()
+        plot_name = data["plotName"]
+    except Exception as error_log:
+        logger.info("Invalid family section: %s:%s, skipping." % (cfg_file, section))
+        logger.info("Error ... %s " % error_log)
+        return []
+
+    sections = []
+    parser = RawConfigParser()
+    for output in outputs:
+        name = "plot:" + plot_name.format(output=output)
+        parser.add_section(name)
+        for key, value in data.items():
+            if key in ("outputs", "plotname"):
+                continue
+            if key in ("ytitle", "plottitle"):
+                value = value.format(output=output)
+            parser.set(name, key, value)
+        parser.set(name, "metric", "%s[%r]" % (data["metric"], output))
+        sections += [(name, parser[name], family, output)]
+    return sections
+
+
 class DQMFile:
     def __init__(self, path, folder, name, short_name, version, run, stream, reco_path):
         self.path = path
@@ -50,6 +100,40 @@ class DQMFile:
         self.run = run
         self.stream = stream
         self.reco_path = reco_path
+        # local copy in the staging cache, read instead of path if set
+        self.local_path = None
+
+
+### set of processed files
+def path_hash(path):
+    digest = hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class ProcessedFiles:
+    """
+    Compact set of GUI file paths already stored in the DB.
+    Paths are kept as a sorted array of 64 bit hashes (8 bytes per file) built once
+    at startup, files added later go to a small python set.
+    With 1M files the chance of a hash collision is ~1e-8.
+    """
+
+    def __init__(self, paths=()):
+        self.hashes = array("q", sorted(path_hash(x) for x in paths))
+        self.added = set()
+
+    def add(self, path):
+        self.added.add(path_hash(path))
+
+    def __contains__(self, path):
+        h = path_hash(path)
+        if h in self.added:
+            return True
+        i = bisect_left(self.hashes, h)
+        return i < len(self.hashes) and self.hashes[i] == h
+
+    def __len__(self):
+        return len(self.hashes) + len(self.added)
 
 
 ### no STDOUT & STDERR hack
@@ -100,24 +184,3 @@ def get_plot_path(path, run):
     return str(
         "DQMData/Run %s/%s/Run summary/%s" % (run, parts[0], "/".join(parts[1:]))
     )
-
-
-### update trends informations with data points
-# import bisect
-
-
-def add_point_to_trend(trend, dataset, trend_cfg, run, value, error):
-    trend.points.replace("inf", "0")
-    try:
-        points = eval(trend.points)
-        # logger.info('Run %s duplicate point in trend "%s" dataset "%s" "%s" config "%s" "%s"' % (str(run), trend.subsystem, dataset.stream, dataset.reco_path, trend_cfg.name, trend_cfg.plot_title) )
-        points[run] = [value, error]
-    except Exception as error_log:
-        logger.info(
-            "Failed to add point to trend %s/%s" % (trend_cfg.name, trend_cfg.cfg_path)
-        )
-        logger.info("Trend points %s" % (str(trend.points)))
-        logger.info("Error ... %s " % error_log)
-        return False
-    trend.points = str(points)
-    return True
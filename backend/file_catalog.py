@@ -0,0 +1,105 @@
+import os
+import fnmatch
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def list_subdirs(path):
+    try:
+        with os.scandir(path) as entries:
+            return [x.path for x in entries if x.is_dir()]
+    except OSError as error_log:
+        logger.warning('Unable to list directory "%s", skip' % path)
+        logger.warning("Error ... %s " % error_log)
+        return []
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def list_files(path, pattern):
+    try:
+        with os.scandir(path) as entries:
+            return sorted(
+                x.name
+                for x in entries
+                if fnmatch.fnmatchcase(x.name, pattern) and x.is_file()
+            )
+    except OSError as error_log:
+        logger.warning('Unable to list directory "%s", skip' % path)
+        logger.warning("Error ... %s " % error_log)
+        return None
+
+
+class FileCatalog:
+    """
+    Catalog of the files matching pattern in the directories depth levels below root.
+    Remembers the mtime and the files of every directory, so an update only lists
+    the directories whose mtime changed since the previous one.
+    Directories are walked with os.scandir from a pool of threads.
+    """
+
+    def __init__(self, root, pattern, depth=3, directories=None, nthreads=16):
+        self.root = root
+        self.pattern = pattern
+        self.depth = depth
+        self.nthreads = nthreads
+        # path -> (mtime, [file names])
+        self.directories = dict(directories) if directories else {}
+        # directories added, updated or removed by the last update
+        self.changed = {}
+        self.removed = []
+
+    def update(self):
+        with ThreadPoolExecutor(self.nthreads) as executor:
+            dirs = [self.root]
+            for _ in range(self.depth):
+                dirs = [x for subdirs in executor.map(list_subdirs, dirs) for x in subdirs]
+
+            mtimes = dict(zip(dirs, executor.map(get_mtime, dirs)))
+            to_scan = [
+                path
+                for path, mtime in mtimes.items()
+                if mtime is not None
+                and self.directories.get(path, (None, None))[0] != mtime
+            ]
+            scanned = executor.map(lambda x: list_files(x, self.pattern), to_scan)
+
+            self.changed = {}
+            for path, files in zip(to_scan, scanned):
+                if files is None:
+                    continue
+                self.changed[path] = (mtimes[path], files)
+
+        self.removed = [x for x in self.directories if mtimes.get(x, None) is None]
+        for path in self.removed:
+            del self.directories[path]
+        self.directories.update(self.changed)
+
+        logger.info(
+            "Catalog of %s: %s directories, %s rescanned, %s removed, %s files"
+            % (
+                self.root,
+                len(self.directories),
+                len(self.changed),
+                len(self.removed),
+                len(self),
+            )
+        )
+        return self.files()
+
+    def files(self):
+        return [
+            os.path.join(path, name)
+            for path, (mtime, files) in sorted(self.directories.items())
+            for name in files
+        ]
+
+    def __len__(self):
+        return sum(len(files) for mtime, files in self.directories.values())
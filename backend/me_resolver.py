@@ -0,0 +1,145 @@
+import time
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def split_me_path(me):
+    """
+    "Subsystem/folder/name" -> ("Subsystem", "folder", "name"),
+    the folder is relative to "DQMData/Run N/Subsystem/Run summary"
+    """
+    parts = me.split("/")
+    return parts[0], "/".join(parts[1:-1]), parts[-1]
+
+
+class MEResolver:
+    """
+    Reads the requested MEs of a GUI ROOT file by folders.
+    Every folder of the requested MEs is looked up once per file and its keys are
+    listed together, MEs of subsystems or folders missing in the file cost a
+    single failed lookup instead of one TDirectory.Get per ME.
+    """
+
+    def __init__(self, mes):
+        # subsystem -> folder -> {key name: ME}
+        self.index = defaultdict(lambda: defaultdict(dict))
+        for me in mes:
+            subsystem, folder, name = split_me_path(me)
+            self.index[subsystem][folder][name] = me
+        self.n_mes = len(set(mes))
+        # of the last resolve()
+        self.stats = {}
+
+    def resolve(self, tdirectory, run, skip=()):
+        """
+        {ME: object} of the MEs present in the file,
+        tdirectory - the opened TFile, run - run of the file,
+        skip - MEs not to look up, e.g. MissingMEs.get_skipped()
+        stats["missing"] are the MEs not found or skipped
+        """
+        me_dic, self.stats = self.resolve_with_stats(tdirectory, run, skip)
+        return me_dic
+
+    def resolve_with_stats(self, tdirectory, run, skip=()):
+        """
+        (MEs, stats) of resolve(), for resolvers shared by several threads
+        """
+        start = time.perf_counter()
+        stats = {
+            "hits": 0,
+            "misses": 0,
+            "skipped": 0,
+            "folders": 0,
+            "missing_folders": 0,
+            "missing": [],
+        }
+        me_dic = {}
+        run_dir = tdirectory.GetDirectory("DQMData/Run %s" % run)
+        for subsystem, folders in self.index.items():
+            summary = None
+            for folder, names in folders.items():
+                skipped = [me for me in names.values() if me in skip]
+                if skipped:
+                    stats["skipped"] += len(skipped)
+                    stats["missing"] += skipped
+                    names = {x: me for x, me in names.items() if me not in skip}
+                    if not names:
+                        continue
+                if summary is None:
+                    summary = False
+                    if run_dir:
+                        summary = run_dir.GetDirectory("%s/Run summary" % subsystem)
+                directory = None
+                if summary:
+                    directory = summary.GetDirectory(folder) if folder else summary
+                if not directory:
+                    stats["missing_folders"] += 1
+                    stats["misses"] += len(names)
+                    stats["missing"] += list(names.values())
+                    continue
+                stats["folders"] += 1
+                # the first key of a name is its highest cycle, as for Get
+                keys = {}
+                for key in directory.GetListOfKeys():
+                    keys.setdefault(key.GetName(), key)
+                for name, me in names.items():
+                    key = keys.get(name, None)
+                    if key is None:
+                        logger.debug('No MEs "%s" available' % me)
+                        stats["misses"] += 1
+                        stats["missing"].append(me)
+                        continue
+                    obj = key.ReadObj()
+                    if not obj:
+                        # not readable, e.g. not a histogram for the uproot reader
+                        logger.debug('ME "%s" can not be read' % me)
+                        stats["misses"] += 1
+                        stats["missing"].append(me)
+                        continue
+                    me_dic[me] = obj
+                    stats["hits"] += 1
+        stats["seconds"] = time.perf_counter() - start
+        return me_dic, stats
+
+
+class MissingMEs:
+    """
+    MEs missing in the last files of every (stream, reco_path) dataset.
+    An ME missing in `files` consecutive files of a dataset is not looked up in
+    its next files, but for every `probe`-th one, so MEs added later are found.
+    """
+
+    def __init__(self, records=None, files=5, probe=50):
+        self.files = files
+        self.probe = probe
+        # (stream, reco_path) -> {ME: number of consecutive files without it}
+        self.records = {key: dict(x) for key, x in (records or {}).items()}
+        # datasets updated since the last pop_changed()
+        self.changed = set()
+
+    def copy(self):
+        return MissingMEs(self.records, self.files, self.probe)
+
+    def get_skipped(self, stream, reco_path):
+        if self.files <= 0:
+            return set()
+        return {
+            me
+            for me, misses in self.records.get((stream, reco_path), {}).items()
+            if misses >= self.files and (self.probe <= 0 or misses % self.probe)
+        }
+
+    def update(self, stream, reco_path, missing):
+        """
+        missing - MEs not found or skipped in a file of the dataset
+        """
+        record = self.records.get((stream, reco_path), {})
+        self.records[(stream, reco_path)] = {x: record.get(x, 0) + 1 for x in missing}
+        self.changed.add((stream, reco_path))
+
+    def pop_changed(self):
+        changed = {key: self.records[key] for key in self.changed}
+        self.changed = set()
+        return changed
@@ -1,6 +1,33 @@
+from math import sqrt
+
+import numpy as np
+
 VERBOSE = False
 
 
+def viewBin(view, name):
+    "bin number of a bin label in a HistogramView"
+    if not type(name) == type(""):
+        return name
+    binNr = view.find_bin(name)
+    if binNr is None:
+        # ROOT may extend the axis with a new label, leave it to calculate
+        raise NotImplementedError("no bin labelled '%s' in %s" % (name, view.name))
+    return binNr
+
+
+def meanOfNonZero(values):
+    "mean and error on the mean of the non zero values, as ProfileMean"
+    values = values[values != 0].astype(np.float64)
+    count = values.size
+    if count == 0:
+        return (0, 0)
+    summy = float(values.sum())
+    sumSquare = float((values * values).sum())
+    rms = sqrt(sumSquare / count - (summy * summy / (count * count)))
+    return (summy / count, rms / sqrt(count))
+
+
 class BaseMetric:
     "baseclass for all metrics. should not be used on its own"
 
@@ -83,6 +110,101 @@ class BaseMetric:
             "you should not use the baseclass as a metric. Use the derived classes!",
         )
 
+    def calculateView(self, view):
+        """same as calculate, on a HistogramView of the histogram.
+        The optional histos and the reference are HistogramViews as well.
+        Raises NotImplementedError when calculate has to be used instead."""
+        raise NotImplementedError(
+            "%s has no HistogramView implementation" % self.__class__.__name__
+        )
+
+    def supportsView(self):
+        return type(self).calculateView is not BaseMetric.calculateView
+
+
+class MultiMetric(BaseMetric):
+    """baseclass for metrics with many outputs, e.g. one per bin or per RBX, evaluated
+    at once on the same histograms. calculateAll returns a dictionary
+    output -> (value, error), metric[output] is the metric of a single trend.
+    Used by the [family:] config sections."""
+
+    def outputs(self):
+        "outputs of a [family:] section which does not list them"
+        return []
+
+    def calculateAll(self, histo):
+        raise NotImplementedError(
+            "%s has no calculateAll implementation" % self.__class__.__name__
+        )
+
+    def calculateAllView(self, view):
+        raise NotImplementedError(
+            "%s has no HistogramView implementation" % self.__class__.__name__
+        )
+
+    def supportsView(self):
+        return type(self).calculateAllView is not MultiMetric.calculateAllView
+
+    def __getitem__(self, output):
+        return MetricOutput(self, output)
+
+
+class MetricOutput(BaseMetric):
+    "one output of a MultiMetric"
+
+    def __init__(self, family, output):
+        BaseMetric.__init__(self)
+        self.family = family
+        self.output = output
+
+    def setReference(self, histo):
+        self.family.setReference(histo)
+
+    def setOptionalHisto1(self, histo):
+        self.family.setOptionalHisto1(histo)
+
+    def setOptionalHisto2(self, histo):
+        self.family.setOptionalHisto2(histo)
+
+    def calculate(self, histo):
+        return self.family.calculateAll(histo)[self.output]
+
+    def calculateView(self, view):
+        return self.family.calculateAllView(view)[self.output]
+
+    def supportsView(self):
+        return self.family.supportsView()
+
+
+class MetricFamily(MultiMetric):
+    """the given metrics on the same histograms, as one family
+    metrics - dictionary output -> metric"""
+
+    def __init__(self, metrics):
+        BaseMetric.__init__(self)
+        self.__metrics = metrics
+
+    def outputs(self):
+        return list(self.__metrics)
+
+    def __setHistos(self, metric):
+        metric.setReference(self._reference)
+        metric.setOptionalHisto1(self._histo1)
+        metric.setOptionalHisto2(self._histo2)
+        return metric
+
+    def calculateAll(self, histo):
+        return {
+            output: self.__setHistos(metric).calculate(histo)
+            for output, metric in self.__metrics.items()
+        }
+
+    def calculateAllView(self, view):
+        return {
+            output: self.__setHistos(metric).calculateView(view)
+            for output, metric in self.__metrics.items()
+        }
+
 
 class SummaryMapPartition(BaseMetric):
     def __init__(self, binx, nbinsy):
@@ -98,6 +220,12 @@ class SummaryMapPartition(BaseMetric):
         value /= self.__nbinsy
         return (value, 0)
 
+    def calculateView(self, view):
+        ybins = np.arange(1, self.__nbinsy + 1)
+        value = float(view.take(self.__binx, ybins).sum())
+        value /= self.__nbinsy
+        return (value, 0)
+
 
 class AverageYwithXCut(BaseMetric):
     def __init__(self, nbinx):
@@ -122,6 +250,9 @@ class Mean(BaseMetric):
     def calculate(self, histo):
         return (histo.GetMean(), histo.GetMeanError())
 
+    def calculateView(self, view):
+        return (view.mean(), view.mean_error())
+
 
 class MeanEntries(BaseMetric):
     def calculate(self, histo):
@@ -130,6 +261,9 @@ class MeanEntries(BaseMetric):
             histo.GetMeanError() * histo.GetEntries(),
         )
 
+    def calculateView(self, view):
+        return (view.mean() * view.entries, view.mean_error() * view.entries)
+
 
 class PixelEfficiency(BaseMetric):
     def calculate(self, histo):
@@ -148,6 +282,19 @@ class PixelEfficiency(BaseMetric):
             eres = sqrt(res * (1 - res) / den)
         return (res, eres)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        num = view.mean() * view.entries
+        den = num + self._histo1.mean() * self._histo1.entries
+        if den == 0:
+            res = 0
+            eres = 0
+        else:
+            res = num / den
+            eres = sqrt(res * (1 - res) / den)
+        return (res, eres)
+
 
 class PixelDigiPerClusterPix(BaseMetric):
     def calculate(self, histo):
@@ -186,11 +333,17 @@ class MeanRMS(BaseMetric):
         # if VERBOSE: print 'mean:',histo.GetMean(), histo.GetMeanError()
         return (histo.GetMean(), histo.GetRMS())
 
+    def calculateView(self, view):
+        return (view.mean(), view.std_dev())
+
 
 class StdDev(BaseMetric):
     def calculate(self, histo):
         return (histo.GetStdDev(), histo.GetStdDevError())
 
+    def calculateView(self, view):
+        return (view.std_dev(), view.std_dev_error())
+
 
 class MeanY(BaseMetric):
     def calculate(self, histo):
@@ -203,6 +356,9 @@ class MeanYAxis(BaseMetric):
     def calculate(self, histo):
         return (histo.GetMean(2), histo.GetMeanError(2))
 
+    def calculateView(self, view):
+        return (view.mean(2), view.mean_error(2))
+
 
 class MeanZAxis(BaseMetric):
     def calculate(self, histo):
@@ -213,11 +369,17 @@ class RMSXAxis(BaseMetric):
     def calculate(self, histo):
         return (histo.GetRMS(1), histo.GetRMSError(1))
 
+    def calculateView(self, view):
+        return (view.std_dev(1), view.std_dev_error(1))
+
 
 class RMSYAxis(BaseMetric):
     def calculate(self, histo):
         return (histo.GetRMS(2), histo.GetRMSError(2))
 
+    def calculateView(self, view):
+        return (view.std_dev(2), view.std_dev_error(2))
+
 
 class ProfileMean(BaseMetric):
     def calculate(self, histo):
@@ -239,6 +401,12 @@ class ProfileMean(BaseMetric):
         rms = sqrt(sumSquare / count - (summy * summy / (count * count)))
         return (summy / count, rms / sqrt(count))
 
+    def calculateView(self, view):
+        values = view.take(
+            np.arange(1, view.nbinsx + 1)[:, None], np.arange(1, view.nbinsy + 1)
+        )
+        return meanOfNonZero(values)
+
 
 class ProfileMeanBPixModules(BaseMetric):
     def __init__(self, modNum):
@@ -271,6 +439,16 @@ class ProfileMeanBPixModules(BaseMetric):
         rms = sqrt(sumSquare / count - (summy * summy / (count * count)))
         return (summy / count, rms / sqrt(count))
 
+    def calculateView(self, view):
+        ybins = np.arange(1, view.nbinsy + 1)
+        values = np.concatenate(
+            (
+                view.take(1 + self.__modCounter, ybins),
+                view.take(view.nbinsx - self.__modCounter, ybins),
+            )
+        )
+        return meanOfNonZero(values)
+
 
 # class WeightedMeanY(BaseMetric):
 #    def calculate(self, histo):
@@ -290,6 +468,9 @@ class Count(BaseMetric):
     def calculate(self, histo):
         return (histo.GetEntries(), 0)
 
+    def calculateView(self, view):
+        return (view.entries, 0)
+
 
 class MaxBin(BaseMetric):
     def calculate(self, histo):
@@ -327,6 +508,15 @@ class BinCount(BaseMetric):
             error = sqrt(histo.GetBinContent(binNr))
         return (histo.GetBinContent(binNr), error)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        binNr = viewBin(view, self.__name)
+        error = 0
+        if not self.__noError:
+            error = sqrt(view.bin_content(binNr))
+        return (view.bin_content(binNr), error)
+
 
 class ROCfraction(BaseMetric):
     def __init__(self, name, tot, noError=False):
@@ -345,6 +535,15 @@ class ROCfraction(BaseMetric):
             error = 100 * sqrt(histo.GetBinContent(binNr)) / self.__tot
         return (100 * histo.GetBinContent(binNr) / self.__tot, error)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        binNr = viewBin(view, self.__name)
+        error = 0
+        if not self.__noError:
+            error = 100 * sqrt(view.bin_content(binNr)) / self.__tot
+        return (100 * view.bin_content(binNr) / self.__tot, error)
+
 
 class FED25ErrorFraction(BaseMetric):
     def __init__(self, thr, norm, normErr=True):
@@ -369,6 +568,20 @@ class FED25ErrorFraction(BaseMetric):
             err = sqrt(res * (1 - res) / (nbinx * nbiny))
         return (100 * res, 100 * err)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        ref = view.maximum * self.__thr
+        nbinx = view.nbinsx
+        nbiny = view.nbinsy
+        values = view.take(np.arange(1, nbinx + 1)[:, None], np.arange(1, nbiny + 1))
+        count = int(np.count_nonzero(values > ref))
+        res = float(count) / self.__norm
+        err = 0
+        if self.__normErr:
+            err = sqrt(res * (1 - res) / (nbinx * nbiny))
+        return (100 * res, 100 * err)
+
 
 class StripFEDErrorFraction(BaseMetric):
     def __init__(self, fedId, errorType):
@@ -388,6 +601,19 @@ class StripFEDErrorFraction(BaseMetric):
             err = sqrt(res * (1 - res) / den)
         return (100 * res, 100 * err)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        den = self._histo1.maximum
+        num = view.bin_content(self.__fedId + 1 - 50, self.__type)
+        if den == 0:
+            res = 0
+            err = 0
+        else:
+            res = num / den
+            err = sqrt(res * (1 - res) / den)
+        return (100 * res, 100 * err)
+
 
 class StripBadComponent(BaseMetric):
     def __init__(self, binsx, biny, norm):
@@ -404,6 +630,10 @@ class StripBadComponent(BaseMetric):
         error = 0
         return (100 * num / self.__norm, error)
 
+    def calculateView(self, view):
+        num = float(view.take(list(self.__binsx), self.__biny).sum())
+        return (100 * num / self.__norm, 0)
+
 
 class EntriesCount(BaseMetric):
     def __init__(self, startValue):
@@ -417,6 +647,15 @@ class EntriesCount(BaseMetric):
             sum += histo.GetBinContent(bin)
         return (sum, sqrt(1 / sum) * sum if sum else 0)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        view.check_dim(1)
+        sum = float(
+            view.take(np.arange(view.find_bin(self.__loVal), view.nbinsx + 1)).sum()
+        )
+        return (sum, sqrt(1 / sum) * sum if sum else 0)
+
 
 class EntriesRate(BaseMetric):
     def __init__(self, startValue):
@@ -438,6 +677,23 @@ class EntriesRate(BaseMetric):
         else:
             return (0, 0)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        view.check_dim(1)
+        trksum = float(
+            view.take(np.arange(view.find_bin(self.__loVal), view.nbinsx + 1)).sum()
+        )
+        nLS = int(
+            np.count_nonzero(
+                self._histo1.take(np.arange(1, self._histo1.nbinsx + 1)) > 0
+            )
+        )
+        if nLS:
+            return (trksum / (nLS * 23), sqrt(trksum) / (nLS * 23))
+        else:
+            return (0, 0)
+
 
 class RecoFraction(BaseMetric):
     def __init__(self, name, noError=False):
@@ -463,6 +719,23 @@ class RecoFraction(BaseMetric):
             eres = enum / den
         return (res, eres)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        binNr = viewBin(view, self.__name)
+        enum = 0
+        if not self.__noError:
+            enum = sqrt(view.bin_content(binNr))
+        num = view.bin_content(binNr)
+        den = self._histo1.entries
+        if den == 0:
+            res = 0
+            eres = 0
+        else:
+            res = num / den
+            eres = enum / den
+        return (res, eres)
+
 
 class BinsCount(BaseMetric):
     def __init__(self, startBin):
@@ -476,6 +749,12 @@ class BinsCount(BaseMetric):
             sum += histo.GetBinContent(bin)
         return (sum, sqrt(1 / sum) * sum if sum else 0)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        sum = float(view.take(np.arange(self.__loBin, view.nbinsx + 1)).sum())
+        return (sum, sqrt(1 / sum) * sum if sum else 0)
+
 
 class NormBinCount(BaseMetric):
     def __init__(self, name, norm=None):
@@ -548,6 +827,18 @@ class Ratio(BaseMetric):
             sqrt(s + s * s / B) / B if s and B else 1 / B if B else 0,
         )
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        view.check_dim(1)
+        s = view.integral(view.find_bin(self.__low), view.find_bin(self.__high))
+        T = view.integral()
+        B = T - s
+        return (
+            s / B if B else 0,
+            sqrt(s + s * s / B) / B if s and B else 1 / B if B else 0,
+        )
+
 
 class Ratio1(BaseMetric):
     def __init__(self, low, high):
@@ -566,6 +857,18 @@ class Ratio1(BaseMetric):
             sqrt(B + B * B / s) / s if s and B else 1 / s if s else 0,
         )
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        view.check_dim(1)
+        s = view.integral(view.find_bin(self.__low), view.find_bin(self.__high))
+        T = view.integral(0, view.nbinsx + 2)
+        B = T - s
+        return (
+            B / s if s else 0,
+            sqrt(B + B * B / s) / s if s and B else 1 / s if s else 0,
+        )
+
 
 class Fraction(BaseMetric):
     def __init__(self, low, high):
@@ -582,6 +885,17 @@ class Fraction(BaseMetric):
             sqrt(1 / s + 1 / T) * (s / T) if s and T else 1 / sqrt(T) if T else 0,
         )
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        view.check_dim(1)
+        s = view.integral(view.find_bin(self.__low), view.find_bin(self.__high))
+        T = view.entries
+        return (
+            s / T if T else 0,
+            sqrt(1 / s + 1 / T) * (s / T) if s and T else 1 / sqrt(T) if T else 0,
+        )
+
 
 class Fraction1(BaseMetric):
     def __init__(self, low, high):
@@ -603,6 +917,18 @@ class Fraction1(BaseMetric):
             sqrt(s * s * B + B * B * s) / (T * T) if s and B else 1 / T if T else 0,
         )
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        view.check_dim(1)
+        s = view.integral(view.find_bin(self.__low), view.find_bin(self.__high))
+        T = view.integral(0, view.nbinsx + 2)
+        B = T - s
+        return (
+            B / T if T else 0,
+            sqrt(s * s * B + B * B * s) / (T * T) if s and B else 1 / T if T else 0,
+        )
+
 
 class FractionInBin(BaseMetric):
     def __init__(self, bin):
@@ -615,6 +941,13 @@ class FractionInBin(BaseMetric):
         T = histo.GetEntries()
         return (s / T if T else 0, sqrt(1 / T + 1 / s) * s / T if T else 0)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        s = view.bin_content(self.__bin)
+        T = view.entries
+        return (s / T if T else 0, sqrt(1 / T + 1 / s) * s / T if T else 0)
+
 
 class FractionInBinArray(BaseMetric):
     def __init__(self, binsnum, binsden):
@@ -636,6 +969,16 @@ class FractionInBinArray(BaseMetric):
             sqrt(1 / num + 1 / den) * num / den if den and num else 0,
         )
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        num = float(view.take(list(self.__binsnum)).sum())
+        den = float(view.take(list(self.__binsden)).sum())
+        return (
+            num / den if den else 0,
+            sqrt(1 / num + 1 / den) * num / den if den and num else 0,
+        )
+
 
 class MeanYRange(BaseMetric):
     def __init__(self, ymin, ymax):
@@ -664,6 +1007,16 @@ class Mean2D(BaseMetric):
             return (0, 0)
         return (sum / count, 0)
 
+    def calculateView(self, view):
+        nbinx = view.nbinsx
+        nbiny = view.nbinsy
+        count = nbinx * nbiny
+        if count == 0:
+            return (0, 0)
+        # bins 0 .. nbins - 1, as in calculate
+        sum = float(view.take(np.arange(nbinx)[:, None], np.arange(nbiny)).sum())
+        return (sum / count, 0)
+
 
 class BinRatio2D(BaseMetric):
     def __init__(self, Nxbin, Nybin, Dxbin, Dybin):
@@ -685,6 +1038,17 @@ class BinRatio2D(BaseMetric):
             res = num / den
         return (res, res * sqrt((1.0 / den) + (1.0 / num)))
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        num = view.bin_content(self.__Nxbin, self.__Nybin)
+        den = view.bin_content(self.__Dxbin, self.__Dybin)
+        if den == 0:
+            return (0, 0)
+        else:
+            res = num / den
+        return (res, res * sqrt((1.0 / den) + (1.0 / num)))
+
 
 class BinCount2D(BaseMetric):
     def __init__(self, xbin, ybin, normErr=True):
@@ -701,6 +1065,15 @@ class BinCount2D(BaseMetric):
             err = err / sqrt(histo.GetEntries())
         return (res, err)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        res = view.bin_content(self.__xbin, self.__ybin)
+        err = view.bin_error(self.__xbin, self.__ybin)
+        if self.__normErr:
+            err = err / sqrt(view.entries)
+        return (res, err)
+
 
 class Bin2DRatio(BaseMetric):
     def __init__(self, xbin, ybin, normEntries=True):
@@ -727,6 +1100,25 @@ class Bin2DRatio(BaseMetric):
             err = err / den
         return (res, err)
 
+    def calculateView(self, view):
+        from math import sqrt
+
+        num = view.bin_content(self.__xbin, self.__ybin)
+        den = self._histo1.bin_content(self.__xbin, self.__ybin)
+        if self.__normE:
+            num = num * view.entries
+            den = den * self._histo1.entries
+            err = sqrt(num)
+        else:
+            err = view.bin_error(self.__xbin, self.__ybin) / sqrt(view.entries)
+        if den == 0:
+            res = 0
+            err = 0
+        else:
+            res = num / den
+            err = err / den
+        return (res, err)
+
 
 class MeanYForXBin(BaseMetric):
     def __init__(self, xbin):
@@ -742,6 +1134,13 @@ class MeanYForXBin(BaseMetric):
             return (0, 0)
         return (sum / count, 0)
 
+    def calculateView(self, view):
+        count = view.nbinsy
+        if count == 0:
+            return (0, 0)
+        values = view.take(self.__xbin, np.arange(1, count + 1))
+        return (float(values[values >= 0].sum()) / count, 0)
+
 
 class MeanPosOnly(BaseMetric):
     def calculate(self, histo):
@@ -754,6 +1153,13 @@ class MeanPosOnly(BaseMetric):
             return (0, 0)
         return (sum / count, 0)
 
+    def calculateView(self, view):
+        count = view.nbinsx
+        if count == 0:
+            return (0, 0)
+        values = view.take(np.arange(1, count + 1), 1)
+        return (float(values[values >= 0].sum()) / count, 0)
+
 
 class MeanXRange(BaseMetric):
     def __init__(self, xmin, xmax):
@@ -771,6 +1177,16 @@ class MeanXRange(BaseMetric):
             return (0, 0)
         return (sum / count, 0)
 
+    def calculateView(self, view):
+        values = view.take(
+            np.arange(self.__xmin, self.__xmax)[:, None],
+            np.arange(1, view.nbinsy + 1),
+        )
+        count = values.size
+        if count == 0:
+            return (0, 0)
+        return (float(values[values >= 0].sum()) / count, 0)
+
 
 class Quantile(BaseMetric):
     def __init__(self, frac=0.95):
@@ -1,15 +1,164 @@
 from .basic import BaseMetric
+from .histogram import import_root
 
 import os
-import ROOT
-from ROOT import TF1
+import hashlib
+from collections import OrderedDict
 
 VERBOSE = False
+LANGAU_PATH = os.path.join(os.path.dirname(__file__), "langau.c")
+FIT_PASSES = 3  # fits of a metric, "to stabilise minimization"
+FIT_TOLERANCE = 1e-3  # parameter change, in units of its error, taken as converged
 
+# C macros compiled with ACLiC in this process:
+# path -> [(mtime, size), source hash, {function name: TF1 prototype}]
+compiled_macros = {}
 
-class LanGau(BaseMetric):
-    def __init__(self, diseredParameter, minVal, maxVal, controlVal, paramDefaults):
+
+def TF1(*args):
+    "ROOT.TF1, ROOT is imported by the first fit"
+    return import_root().TF1(*args)
+
+
+def get_macro_function(path, function, npar):
+    """
+    TF1 prototype of a function from a C macro, copy it to fit: TF1(prototype).
+    The macro is compiled & loaded once per process, and again only if its source
+    changes. A stat of the source is all it costs afterwards.
+    """
+    ROOT = import_root()
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    macro = compiled_macros.get(path, None)
+    if macro is None or macro[0] != stamp:
+        with open(path, "rb") as source:
+            digest = hashlib.sha1(source.read()).hexdigest()
+        if macro is None or macro[1] != digest:
+            if ROOT.gSystem.CompileMacro(path, "k-") != 1:
+                raise RuntimeError("Unable to compile %s" % path)
+            macro = [stamp, digest, {}]
+        macro[0] = stamp
+        compiled_macros[path] = macro
+
+    prototypes = macro[2]
+    if function not in prototypes:
+        prototypes[function] = TF1(
+            function + "_prototype", getattr(ROOT, function), 0, 1, npar
+        )
+    return prototypes[function]
+
+
+def getParameters(fit):
+    return [fit.GetParameter(i) for i in range(fit.GetNpar())]
+
+
+class FitCache:
+    """
+    Last converged fit parameters of each trend, to seed the fit of the next run.
+    The least recently used trends are dropped above size entries.
+    Parameters are kept with their run, a fit is only seeded from an earlier run
+    and a later run is not replaced by an earlier one.
+    The cache is in memory, every worker process has its own one: with --workers
+    a fit is seeded from the last earlier run fitted by the same worker.
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        # key -> (run, parameters)
+        self.parameters = OrderedDict()
+
+    def get(self, key, run=None):
+        entry = self.parameters.get(key, None)
+        if entry is None:
+            return None
+        self.parameters.move_to_end(key)
+        if run is not None and entry[0] is not None and entry[0] >= run:
+            return None
+        return entry[1]
+
+    def put(self, key, parameters, run=None):
+        entry = self.parameters.get(key, None)
+        if entry and run is not None and entry[0] is not None and entry[0] > run:
+            return
+        self.parameters[key] = (run, parameters)
+        self.parameters.move_to_end(key)
+        while len(self.parameters) > self.size:
+            self.parameters.popitem(last=False)
+
+
+class FitMetric(BaseMetric):
+    """
+    baseclass of the metrics fitting a TF1. With a FitCache set the fit starts from
+    the parameters of the previous run of the trend. fitStatus and fitIterations
+    of the last fit are kept for the caller.
+    """
+
+    def __init__(self):
         BaseMetric.__init__(self)
+        self._fitCache = None
+        self._fitKey = None
+        self._fitRun = None
+        self._seeded = False
+        self.fitStatus = None
+        self.fitIterations = 0
+
+    def setFitCache(self, cache, key, run=None):
+        self._fitCache = cache
+        self._fitKey = key
+        self._fitRun = run
+
+    def seedFit(self, fit):
+        "set the last converged parameters of the trend, False if there are none"
+        self._seeded = False
+        if self._fitCache is None:
+            return False
+        parameters = self._fitCache.get(self._fitKey, self._fitRun)
+        if parameters is None or len(parameters) != fit.GetNpar():
+            return False
+        fit.SetParameters(*parameters)
+        self._seeded = True
+        return True
+
+    def resetFit(self, fit, parameters):
+        "start the fit from the given parameters, fitted FIT_PASSES times"
+        fit.SetParameters(*parameters)
+        self._seeded = False
+
+    def fitHisto(self, histo, fit, option, *fitRange):
+        """
+        Fit FIT_PASSES times. A fit seeded by seedFit stops as soon as it converges
+        without moving the parameters by more than FIT_TOLERANCE of their errors.
+        """
+        previous = getParameters(fit)
+        for iteration in range(1, FIT_PASSES + 1):
+            if fitRange:
+                status = int(histo.Fit(fit, option, "", *fitRange))
+            else:
+                status = int(histo.Fit(fit, option))
+            current = getParameters(fit)
+            if (
+                self._seeded
+                and status == 0
+                and all(
+                    abs(x - y) <= FIT_TOLERANCE * fit.GetParError(i)
+                    for i, (x, y) in enumerate(zip(current, previous))
+                )
+            ):
+                break
+            previous = current
+        self.fitStatus = status
+        self.fitIterations = iteration
+        return status
+
+    def storeFit(self, fit):
+        "keep the parameters of a converged fit for the next run of the trend"
+        if self._fitCache is not None and self.fitStatus == 0:
+            self._fitCache.put(self._fitKey, getParameters(fit), self._fitRun)
+
+
+class LanGau(FitMetric):
+    def __init__(self, diseredParameter, minVal, maxVal, controlVal, paramDefaults):
+        FitMetric.__init__(self)
         self.range = [minVal, maxVal]
         self.parameters = paramDefaults
         assert diseredParameter in [0, 1, 2], (
@@ -19,19 +168,18 @@ class LanGau(BaseMetric):
         self.controlVal = controlVal
 
     def calculate(self, histo):
-        langauPath = os.path.join(os.path.dirname(__file__), "langau.c")
-        ROOT.gSystem.CompileMacro(langauPath, "k-")
-        ROOT.gSystem.Load(langauPath)
-        fit = TF1("langau", langaufun, self.range[0], self.range[1], 4)
+        fit = TF1(get_macro_function(LANGAU_PATH, "langaufun", 4))
+        fit.SetName("langau")
+        fit.SetRange(self.range[0], self.range[1])
         if histo.GetEntries() < 150:
-            histo.Rebin(2)
-        fit.SetParameters(*(self.parameters))
-        if histo.GetBinCenter(histo.GetMaximumBin()) > self.range[0]:
-            fit.SetParameter(1, histo.GetBinCenter(histo.GetMaximumBin()))
-        fit.SetParameter(2, histo.Integral())
-        histo.Fit(fit, "QOR")
-        histo.Fit(fit, "QOR")
-        histo.Fit(fit, "QOR")
+            # rebinned copy, the ME is shared with other trends
+            histo = histo.Rebin(2, histo.GetName() + "_rebin")
+        if not self.seedFit(fit):
+            fit.SetParameters(*(self.parameters))
+            if histo.GetBinCenter(histo.GetMaximumBin()) > self.range[0]:
+                fit.SetParameter(1, histo.GetBinCenter(histo.GetMaximumBin()))
+            fit.SetParameter(2, histo.Integral())
+        self.fitHisto(histo, fit, "QOR")
         control = 0
         while control < 5:
             if (
@@ -40,27 +188,26 @@ class LanGau(BaseMetric):
             ):
                 if VERBOSE:
                     print("########### REFIT #######")
-                fit.SetParameters(*(self.parameters))
+                self.resetFit(fit, self.parameters)
                 if histo.GetBinCenter(histo.GetMaximumBin()) > self.range[0]:
                     fit.SetParameter(1, histo.GetBinCenter(histo.GetMaximumBin()))
                 fit.SetParameter(2, histo.Integral() * (5 + control) / 5)
                 fit.SetParameter(4, self.parameters[3] * (control + 1))
-                histo.Fit(fit, "QO", "", self.range[0] - 2, self.range[1])
-                histo.Fit(fit, "QO", "", self.range[0] - 2, self.range[1])
-                histo.Fit(fit, "QO", "", self.range[0] - 2, self.range[1])
+                self.fitHisto(histo, fit, "QO", self.range[0] - 2, self.range[1])
                 control = control + 1
             else:
                 if VERBOSE:
                     print("##### GOOD #####")
+                self.storeFit(fit)
                 control = 5
         result = (fit.GetMaximumX(), fit.GetParError(self.desired))
         del fit
         return result
 
 
-class GauLand(BaseMetric):
+class GauLand(FitMetric):
     def __init__(self, diseredParameter, minVal, maxVal, paramDefaults):
-        BaseMetric.__init__(self)
+        FitMetric.__init__(self)
         self.range = [minVal, maxVal]
         self.parameters = paramDefaults
         assert diseredParameter in [0, 1, 2], (
@@ -74,21 +221,20 @@ class GauLand(BaseMetric):
             "[2]*TMath::Landau(x,[0],[1],0)+[4]*TMath::Gaus(x,[0],[3])",
             *(self.range)
         )
-        fit.SetParameters(*(self.parameters))
-        fit.SetParameter(2, histo.GetMaximum() / 2)
-        fit.SetParameter(4, histo.GetMaximum() / 2)
-        # 3x to stabilise minimization
-        histo.Fit(fit, "QOR")
-        histo.Fit(fit, "QOR")
-        histo.Fit(fit, "QOR")
+        if not self.seedFit(fit):
+            fit.SetParameters(*(self.parameters))
+            fit.SetParameter(2, histo.GetMaximum() / 2)
+            fit.SetParameter(4, histo.GetMaximum() / 2)
+        self.fitHisto(histo, fit, "QOR")
+        self.storeFit(fit)
         result = (fit.GetParameter(self.desired), fit.GetParError(self.desired))
         del fit
         return result
 
 
-class Landau(BaseMetric):
+class Landau(FitMetric):
     def __init__(self, diseredParameter, minVal, maxVal, paramDefaults):
-        BaseMetric.__init__(self)
+        FitMetric.__init__(self)
         self.range = [minVal, maxVal]
         self.parameters = paramDefaults
         assert diseredParameter in [0, 1, 2], (
@@ -98,11 +244,10 @@ class Landau(BaseMetric):
 
     def calculate(self, histo):
         fit = TF1("landau", "[2]*TMath::Landau(x,[0],[1],0)", *(self.range))
-        fit.SetParameters(*(self.parameters))
-        # 3x to stabilise minimization
-        histo.Fit(fit, "QOR")
-        histo.Fit(fit, "QOR")
-        histo.Fit(fit, "QOR")
+        if not self.seedFit(fit):
+            fit.SetParameters(*(self.parameters))
+        self.fitHisto(histo, fit, "QOR")
+        self.storeFit(fit)
         if fit.GetParameter(self.desired) > 0:
             result = (fit.GetParameter(self.desired), fit.GetParError(self.desired))
         else:
@@ -181,9 +326,9 @@ class LandauAroundMaxBin(BaseMetric):
         return result
 
 
-class LandauAroundMax(BaseMetric):
+class LandauAroundMax(FitMetric):
     def __init__(self, diseredParameter, lowFrac, highFrac, hLimit):
-        BaseMetric.__init__(self)
+        FitMetric.__init__(self)
         assert diseredParameter in [0, 1, 2], (
             "can only get parameter 0, 1 or 2 not '%s'" % desiredParameter
         )
@@ -202,13 +347,12 @@ class LandauAroundMax(BaseMetric):
         self.range = [maxbincenter * self.lowF, maxbincenter * self.highF]
         # print maxbincenter
         fit = TF1("landau", "[2]*TMath::Landau(x,[0],[1],0)", *(self.range))
-        fit.SetParameter(0, maxbincenter)
-        fit.SetParameter(1, maxbincenter / 10.0)
-        fit.SetParameter(2, histo.GetMaximum())
-        # 3x to stabilise minimization
-        histo.Fit(fit, "QOR", "", *(self.range))
-        histo.Fit(fit, "QOR", "", *(self.range))
-        histo.Fit(fit, "QOR", "", *(self.range))
+        if not self.seedFit(fit):
+            fit.SetParameter(0, maxbincenter)
+            fit.SetParameter(1, maxbincenter / 10.0)
+            fit.SetParameter(2, histo.GetMaximum())
+        self.fitHisto(histo, fit, "QOR", *(self.range))
+        self.storeFit(fit)
         if (
             fit.GetParameter(self.desired) > 0
             and fit.GetParameter(self.desired) < self.cut
@@ -1,4 +1,8 @@
-from .basic import BaseMetric
+from collections import OrderedDict
+
+import numpy as np
+
+from .basic import BaseMetric, MultiMetric
 #find the map at http://cmsdoc.cern.ch/cms/HCALdocs/document/Mapping/Yuan/2020-feb-12/Lmap
 #HCAL map, rbx -> (eta, phi, depth) 
 hcal_map = {
@@ -131,6 +135,78 @@ hcal_map = {
 
 
 
+class RBXFamily:
+    """
+    All RBXs of the map evaluated at once on the depth histograms.
+    The (eta, phi, depth) lists of every RBX are flattened into index arrays once,
+    the bins of each depth histogram are gathered with one fancy-index operation and
+    summed/counted per RBX with np.bincount, in the order of the map like the loops.
+    Results of the recent (depth, histograms) are kept, so the RBX trends of a file
+    evaluate each set of depth histograms once whatever the order of the trends.
+    """
+    def __init__(self, rbx_map, cache_size=32):
+        self.names = list(rbx_map)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        channels = np.array(
+            [(i, eta, phi, dep) for i, name in enumerate(self.names) for eta, phi, dep in rbx_map[name]],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+        eta, phi = channels[:, 1], channels[:, 2]
+        channels = channels[(eta > 0) & (eta < 85) & (phi > 0) & (phi < 73)]
+        self.rbx, self.eta, self.phi, self.dep = channels.T
+        self.cache_size = cache_size
+        # (depth, histogram ids) -> (histograms, result), the histograms are kept
+        # referenced so their ids can not be reused while cached
+        self.__results = OrderedDict()
+
+    def evaluate(self, depth, histo, histo1=None, histo2=None):
+        """
+        depth - the depths of histo, histo1 & histo2; histograms are HistogramViews
+        returns arrays of the sum of histo over the channels with a non zero content
+        in their depth histogram and of the number of such channels, for every RBX
+        """
+        histos = (histo, histo1, histo2)
+        key = (tuple(depth),) + tuple(id(x) for x in histos)
+        if key in self.__results:
+            self.__results.move_to_end(key)
+            return self.__results[key][1]
+
+        # only the first matching depth counts, as in the if/elif of the loops
+        counted = np.zeros(self.dep.size, dtype=bool)
+        for dep, hist in zip(depth, (histo, histo1, histo2)):
+            todo = (self.dep == dep) & ~counted
+            if not todo.any():
+                continue
+            counted[todo] = hist.take(self.eta[todo], self.phi[todo]) != 0
+        values = histo.take(self.eta[counted], self.phi[counted])
+        nrbx = len(self.names)
+        sums = np.bincount(self.rbx[counted], weights=values, minlength=nrbx)
+        counts = np.bincount(self.rbx[counted], minlength=nrbx)
+
+        self.__results[key] = (histos, (sums, counts))
+        if len(self.__results) > self.cache_size:
+            self.__results.popitem(last=False)
+        return sums, counts
+
+    def mean(self, name, depth, histo, histo1=None, histo2=None):
+        if name not in self.index:
+            return (0, 0)
+        sums, counts = self.evaluate(depth, histo, histo1, histo2)
+        i = self.index[name]
+        if counts[i] == 0:
+            return (0, 0)
+        return (float(sums[i]) / int(counts[i]), 0)
+
+    def count(self, name, depth, histo, histo1=None, histo2=None):
+        if name not in self.index:
+            return (0, 0)
+        sums, counts = self.evaluate(depth, histo, histo1, histo2)
+        return (int(counts[self.index[name]]), 0)
+
+
+rbx_family = RBXFamily(hcal_map)
+
+
 #calculate the mean of rbx in a 2D histgram according to the map above (only for nonzero bins)
 class RBXMean(BaseMetric):
     def __init__(self,  name, depth):
@@ -158,6 +234,10 @@ class RBXMean(BaseMetric):
             hsum /= hentry
             result = (hsum, 0)
         return result
+    def calculateView(self, view):
+        return rbx_family.mean(self.__name, self.__dep, view, *self.__optionalHistos())
+    def __optionalHistos(self):
+        return [getattr(self, '_histo1', None), getattr(self, '_histo2', None)]
 
 
 #count the number of nonzero bins 
@@ -180,3 +260,46 @@ class RBXCountNonZeroChan(BaseMetric):
                             hentry+=1
         return (hentry, 0)
     
+    def calculateView(self, view):
+        return rbx_family.count(self.__name, self.__dep, view, *self.__optionalHistos())
+    def __optionalHistos(self):
+        return [getattr(self, '_histo1', None), getattr(self, '_histo2', None)]
+
+
+#mean (RBXMean) and number of nonzero channels (RBXCountNonZeroChan) of all rbx, for [family:] configs
+class RBXMeans(MultiMetric):
+    def __init__(self, depth):
+        BaseMetric.__init__(self)
+        self.__dep = depth
+    def outputs(self):
+        return list(hcal_map)
+    def calculateAll(self, histo):
+        result = {}
+        for name in hcal_map:
+            metric = RBXMean(name, self.__dep)
+            metric.setOptionalHisto1(self._histo1)
+            metric.setOptionalHisto2(self._histo2)
+            result[name] = metric.calculate(histo)
+        return result
+    def calculateAllView(self, view):
+        sums, counts = rbx_family.evaluate(self.__dep, view, self._histo1, self._histo2)
+        return {name: (float(sums[i]) / int(counts[i]), 0) if counts[i] else (0, 0) for i, name in enumerate(rbx_family.names)}
+
+
+class RBXCountsNonZeroChan(MultiMetric):
+    def __init__(self, depth):
+        BaseMetric.__init__(self)
+        self.__dep = depth
+    def outputs(self):
+        return list(hcal_map)
+    def calculateAll(self, histo):
+        result = {}
+        for name in hcal_map:
+            metric = RBXCountNonZeroChan(name, self.__dep)
+            metric.setOptionalHisto1(self._histo1)
+            metric.setOptionalHisto2(self._histo2)
+            result[name] = metric.calculate(histo)
+        return result
+    def calculateAllView(self, view):
+        sums, counts = rbx_family.evaluate(self.__dep, view, self._histo1, self._histo2)
+        return {name: (int(counts[i]), 0) for i, name in enumerate(rbx_family.names)}
@@ -0,0 +1,474 @@
+from math import sqrt
+
+import numpy as np
+
+# ROOT statistics array: sumw, sumw2, sumwx, sumwx2, sumwy, sumwy2, sumwxy, sumwz, ...
+NSTATS = 13
+STATS_AXIS = {1: 2, 2: 4, 3: 7}
+# members of the statistics array, the ones of the histogram class in this order
+STATS_MEMBERS = [
+    "fTsumw",
+    "fTsumw2",
+    "fTsumwx",
+    "fTsumwx2",
+    "fTsumwy",
+    "fTsumwy2",
+    "fTsumwxy",
+    "fTsumwz",
+    "fTsumwz2",
+]
+AXIS_RANGE_BIT = 1 << 11  # TAxis::kAxisRange
+
+# last letter of the histogram class -> type of the bin contents buffer
+ROOT_DTYPES = {
+    "C": np.int8,
+    "S": np.int16,
+    "I": np.int32,
+    "L": np.int64,
+    "F": np.float32,
+    "D": np.float64,
+}
+
+
+class HistogramView:
+    """
+    NumPy arrays of a TH1/TH2/TProfile, read once per ME and shared by all metrics.
+    Bins are numbered like in ROOT, including under/overflow:
+        contents[0], contents[nbinsx + 1] - underflow & overflow of a 1D histogram
+        contents[xbin, ybin]              - bin of a 2D histogram
+    Bin accessors clamp out of range bins and accept global bin numbers the same way
+    TH1::GetBinContent does, statistics follow the TH1 definitions based on GetStats().
+    """
+
+    def __init__(
+        self,
+        contents,
+        errors=None,
+        xedges=None,
+        yedges=None,
+        entries=None,
+        stats=None,
+        effective_entries=None,
+        maximum=None,
+        xrange=None,
+        yrange=None,
+        xlabels=None,
+        fixed_xbins=False,
+        name="",
+        class_name="TH1D",
+        histo=None,
+    ):
+        self.contents = np.asarray(contents)
+        self.ndim = self.contents.ndim
+        self.errors = (
+            np.sqrt(np.abs(self.contents)) if errors is None else np.asarray(errors)
+        )
+        self.nbinsx = self.contents.shape[0] - 2
+        self.nbinsy = self.contents.shape[1] - 2 if self.ndim > 1 else 1
+        self.xedges = (
+            np.arange(self.nbinsx + 1, dtype=float)
+            if xedges is None
+            else np.asarray(xedges, dtype=float)
+        )
+        self.yedges = None
+        if self.ndim > 1:
+            self.yedges = (
+                np.arange(self.nbinsy + 1, dtype=float)
+                if yedges is None
+                else np.asarray(yedges, dtype=float)
+            )
+        self.fixed_xbins = fixed_xbins
+        # first & last bin of the x axis range, like TAxis::GetFirst/GetLast
+        self.xrange = xrange if xrange else (1, self.nbinsx)
+        self.yrange = yrange if yrange else (1, self.nbinsy)
+
+        self.stats = np.zeros(NSTATS)
+        if stats is None:
+            stats = self.stats_from_bins()
+        self.stats[: len(stats)] = stats
+        self.entries = float(self.stats[0] if entries is None else entries)
+        if effective_entries is None:
+            effective_entries = (
+                self.stats[0] ** 2 / self.stats[1]
+                if self.stats[1]
+                else abs(self.stats[0])
+            )
+        self.effective_entries = float(effective_entries)
+        if maximum is None:
+            # TH1::GetMaximum, the largest bin content in the axis ranges
+            x1, x2 = self.xrange
+            contents = self.contents[x1 : x2 + 1]
+            if self.ndim > 1:
+                y1, y2 = self.yrange
+                contents = contents[:, y1 : y2 + 1]
+            maximum = contents.max() if contents.size else 0
+        self.maximum = float(maximum)
+
+        self.xlabels = xlabels
+        self.name = name
+        self.class_name = class_name
+        # ROOT object the view was made from, it owns the zero-copy buffers,
+        # or the ROOT copy made by to_root()
+        self.histo = histo
+
+    @classmethod
+    def from_root(cls, histo):
+        """
+        Make a view of a ROOT histogram. Contents and errors of TH1/TH2 are read
+        without a copy from the histogram buffers, so the histogram must not be
+        modified (rebinned, reset, ...) while the view is in use.
+        Profiles have no buffer of bin means and are read bin by bin once.
+        """
+        ndim = histo.GetDimension()
+        if ndim > 2:
+            raise ValueError("only 1D and 2D histograms are supported")
+
+        class_name = histo.ClassName()
+        xaxis = histo.GetXaxis()
+        nx = xaxis.GetNbins()
+        ny = histo.GetNbinsY()
+        ncells = histo.GetNcells()
+        if histo.InheritsFrom("TProfile") or histo.InheritsFrom("TProfile2D"):
+            contents = np.array([histo.GetBinContent(i) for i in range(ncells)])
+            errors = np.array([histo.GetBinError(i) for i in range(ncells)])
+        else:
+            contents = np.frombuffer(
+                get_buffer(histo.GetArray(), ncells),
+                dtype=ROOT_DTYPES[class_name[-1]],
+                count=ncells,
+            )
+            sumw2 = histo.GetSumw2()
+            if sumw2.GetSize():
+                errors = np.sqrt(
+                    np.frombuffer(
+                        get_buffer(sumw2.GetArray(), ncells),
+                        dtype=np.float64,
+                        count=ncells,
+                    )
+                )
+            else:
+                errors = np.sqrt(np.abs(contents))
+
+        stats = np.zeros(NSTATS)
+        histo.GetStats(stats)
+
+        xlabels = None
+        if xaxis.GetLabels():
+            xlabels = [xaxis.GetBinLabel(i) for i in range(1, nx + 1)]
+
+        if ndim > 1:
+            # ROOT global bin = xbin + (nx + 2) * ybin
+            contents = contents.reshape(ny + 2, nx + 2).T
+            errors = errors.reshape(ny + 2, nx + 2).T
+
+        return cls(
+            contents,
+            errors,
+            get_edges(xaxis),
+            get_edges(histo.GetYaxis()) if ndim > 1 else None,
+            entries=histo.GetEntries(),
+            stats=stats,
+            effective_entries=histo.GetEffectiveEntries(),
+            maximum=histo.GetMaximum(),
+            xrange=(xaxis.GetFirst(), xaxis.GetLast()),
+            yrange=(histo.GetYaxis().GetFirst(), histo.GetYaxis().GetLast()),
+            xlabels=xlabels,
+            fixed_xbins=not xaxis.GetXbins().GetSize(),
+            name=histo.GetName(),
+            class_name=class_name,
+            histo=histo,
+        )
+
+    @classmethod
+    def from_uproot(cls, histo):
+        """
+        Make a view of a histogram read by uproot, no ROOT needed.
+        Profiles are viewed with the bin means and errors, as by from_root.
+        """
+        class_name = histo.classname
+        if class_name.startswith(("TH3", "TProfile3D")) or not class_name.startswith(
+            ("TH1", "TH2", "TProfile")
+        ):
+            raise ValueError("only 1D and 2D histograms are supported")
+        members = histo.all_members
+
+        contents = histo.values(flow=True)
+        if class_name.startswith("TProfile"):
+            errors = histo.errors(flow=True)
+        else:
+            errors = np.sqrt(np.abs(histo.variances(flow=True)))
+
+        xaxis = members["fXaxis"]
+        yaxis = members["fYaxis"]
+        nx = xaxis.member("fNbins")
+        xrange = yrange = None
+        if xaxis.member("@fBits") & AXIS_RANGE_BIT:
+            xrange = (xaxis.member("fFirst"), xaxis.member("fLast"))
+        if contents.ndim > 1 and yaxis.member("@fBits") & AXIS_RANGE_BIT:
+            yrange = (yaxis.member("fFirst"), yaxis.member("fLast"))
+
+        # TH1::GetStats recomputes the stored statistics from the bins in the axis
+        # ranges if a range is set or if they were reset
+        stats = None
+        if xrange or yrange or not members["fTsumw"] and members["fEntries"]:
+            if class_name.startswith("TProfile"):
+                stats = profile_stats(histo, xrange, yrange)
+        else:
+            stats = [members[x] for x in STATS_MEMBERS if x in members]
+        xlabels = None
+        if xaxis.member("fLabels"):
+            # bin numbers are the unique ids of the labels
+            xlabels = [""] * nx
+            for label in xaxis.member("fLabels"):
+                xlabels[label.member("@fUniqueID") - 1] = str(label)
+
+        maximum = members["fMaximum"]
+        return cls(
+            contents,
+            errors,
+            xaxis.edges(),
+            yaxis.edges() if contents.ndim > 1 else None,
+            entries=members["fEntries"],
+            stats=stats,
+            maximum=None if maximum == -1111 else maximum,
+            xrange=xrange,
+            yrange=yrange,
+            xlabels=xlabels,
+            fixed_xbins=not len(xaxis.member("fXbins")),
+            name=members["fName"],
+            class_name=class_name,
+        )
+
+    def to_root(self):
+        """
+        ROOT histogram of the view, for metrics without a HistogramView implementation.
+        Made once per view, ROOT is imported by the first call.
+        Profiles become TH1D/TH2D of the bin means.
+        """
+        if self.histo is not None:
+            return self.histo
+        ROOT = import_root()
+        if self.ndim == 1:
+            histo = ROOT.TH1D(self.name, self.name, self.nbinsx, self.xedges)
+            contents, errors = self.contents, self.errors
+        else:
+            histo = ROOT.TH2D(
+                self.name, self.name, self.nbinsx, self.xedges, self.nbinsy, self.yedges
+            )
+            # ROOT global bin = xbin + (nx + 2) * ybin
+            contents, errors = self.contents.T.ravel(), self.errors.T.ravel()
+        histo.SetDirectory(0)
+        for i, label in enumerate(self.xlabels or [], 1):
+            if label:
+                histo.GetXaxis().SetBinLabel(i, label)
+        for i, (content, error) in enumerate(zip(contents.tolist(), errors.tolist())):
+            histo.SetBinContent(i, content)
+            histo.SetBinError(i, error)
+        if self.xrange != (1, self.nbinsx):
+            histo.GetXaxis().SetRange(*self.xrange)
+        if self.ndim > 1 and self.yrange != (1, self.nbinsy):
+            histo.GetYaxis().SetRange(*self.yrange)
+        histo.PutStats(np.array(self.stats, dtype=np.float64))
+        histo.SetEntries(self.entries)
+        self.histo = histo
+        return histo
+
+    def stats_from_bins(self):
+        """
+        Statistics of the bins in the axis ranges as computed by TH1::GetStats,
+        used when the histogram has none
+        """
+        x1, x2 = self.xrange
+        x = ((self.xedges[1:] + self.xedges[:-1]) / 2)[x1 - 1 : x2]
+        if self.ndim == 1:
+            w = self.contents[x1 : x2 + 1]
+            e = self.errors[x1 : x2 + 1]
+            return [w.sum(), (e ** 2).sum(), (w * x).sum(), (w * x * x).sum()]
+        y1, y2 = self.yrange
+        w = self.contents[x1 : x2 + 1, y1 : y2 + 1]
+        e = self.errors[x1 : x2 + 1, y1 : y2 + 1]
+        x = x[:, None]
+        y = ((self.yedges[1:] + self.yedges[:-1]) / 2)[None, y1 - 1 : y2]
+        return [
+            w.sum(),
+            (e ** 2).sum(),
+            (w * x).sum(),
+            (w * x * x).sum(),
+            (w * y).sum(),
+            (w * y * y).sum(),
+            (w * x * y).sum(),
+        ]
+
+    ### bins
+    def check_dim(self, ndim):
+        """
+        Metrics call it when their array path only reproduces ROOT for ndim histograms
+        """
+        if self.ndim != ndim:
+            raise NotImplementedError(
+                "%s: %sD histogram expected, got %sD" % (self.name, ndim, self.ndim)
+            )
+
+    def _index(self, xbins, ybins):
+        xbins = np.asarray(xbins, dtype=np.int64)
+        if self.ndim == 1:
+            # the y bin is ignored for 1D histograms
+            if ybins is not None:
+                xbins = np.broadcast_arrays(xbins, np.asarray(ybins))[0]
+            return np.clip(xbins, 0, self.nbinsx + 1)
+        if ybins is None:
+            # global bin numbers
+            glob = np.clip(xbins, 0, self.contents.size - 1)
+            return glob % (self.nbinsx + 2), glob // (self.nbinsx + 2)
+        return (
+            np.clip(xbins, 0, self.nbinsx + 1),
+            np.clip(np.asarray(ybins, dtype=np.int64), 0, self.nbinsy + 1),
+        )
+
+    def take(self, xbins, ybins=None):
+        """
+        Contents of many bins at once, xbins and ybins are broadcast together
+        """
+        return self.contents[self._index(xbins, ybins)]
+
+    def bin_content(self, xbin, ybin=None):
+        return float(self.take(xbin, ybin))
+
+    def bin_error(self, xbin, ybin=None):
+        return float(self.errors[self._index(xbin, ybin)])
+
+    def find_bin(self, x):
+        """
+        TAxis::FindBin of the x axis for a value, or the bin of a label.
+        Returns None for an unknown label, ROOT might add it to the axis.
+        """
+        if isinstance(x, str):
+            if self.xlabels and x in self.xlabels:
+                return self.xlabels.index(x) + 1
+            return None
+        xmin, xmax = self.xedges[0], self.xedges[-1]
+        if x < xmin:
+            return 0
+        if not x < xmax:
+            return self.nbinsx + 1
+        if self.fixed_xbins:
+            return 1 + int(self.nbinsx * (x - xmin) / (xmax - xmin))
+        return int(np.searchsorted(self.xedges, x, side="right"))
+
+    def integral(self, xbin1=None, xbin2=None):
+        """
+        TH1::Integral of a 1D histogram, the x axis range by default
+        """
+        if xbin1 is None:
+            xbin1, xbin2 = self.xrange
+        ncells = self.nbinsx + 2
+        xbin1 = max(xbin1, 0)
+        if xbin2 >= ncells or xbin2 < xbin1:
+            xbin2 = ncells - 1
+        return float(self.contents[xbin1 : xbin2 + 1].sum())
+
+    def in_range(self):
+        if self.ndim == 1:
+            return self.contents[1:-1]
+        return self.contents[1:-1, 1:-1]
+
+    ### statistics
+    def mean(self, axis=1):
+        if axis not in STATS_AXIS or not self.stats[0]:
+            return 0.0
+        return float(self.stats[STATS_AXIS[axis]] / self.stats[0])
+
+    def std_dev(self, axis=1):
+        if axis not in STATS_AXIS or not self.stats[0]:
+            return 0.0
+        i = STATS_AXIS[axis]
+        x = float(self.stats[i] / self.stats[0])
+        return sqrt(max(self.stats[i + 1] / self.stats[0] - x * x, 0.0))
+
+    def mean_error(self, axis=1):
+        neff = self.effective_entries
+        return self.std_dev(axis) / sqrt(neff) if neff > 0 else 0.0
+
+    def std_dev_error(self, axis=1):
+        neff = self.effective_entries
+        return self.std_dev(axis) / sqrt(2 * neff) if neff > 0 else 0.0
+
+
+def profile_stats(histo, xrange=None, yrange=None):
+    """
+    TProfile::GetStats of an uproot profile computed from the bins in the axis
+    ranges, the bin sums of y (z for 2D) are the TArrayD of the profile
+    """
+    sums = np.asarray(histo.bases[0].bases[-1], dtype=np.float64)
+    entries = np.asarray(histo.member("fBinEntries"), dtype=np.float64)
+    sumw2 = np.asarray(histo.member("fSumw2"), dtype=np.float64)
+    bin_sumw2 = np.asarray(histo.member("fBinSumw2"), dtype=np.float64)
+    if not bin_sumw2.size:
+        bin_sumw2 = entries
+    xaxis = histo.member("fXaxis")
+    x1, x2 = xrange if xrange else (1, xaxis.member("fNbins"))
+    x = xaxis.centers()[x1 - 1 : x2]
+    if not histo.classname.startswith("TProfile2D"):
+        w = entries[x1 : x2 + 1]
+        return [
+            w.sum(),
+            bin_sumw2[x1 : x2 + 1].sum(),
+            (w * x).sum(),
+            (w * x * x).sum(),
+            sums[x1 : x2 + 1].sum(),
+            sumw2[x1 : x2 + 1].sum(),
+        ]
+    yaxis = histo.member("fYaxis")
+    y1, y2 = yrange if yrange else (1, yaxis.member("fNbins"))
+    y = yaxis.centers()[None, y1 - 1 : y2]
+    x = x[:, None]
+    shape = (yaxis.member("fNbins") + 2, xaxis.member("fNbins") + 2)
+
+    def in_range(array):
+        # ROOT global bin = xbin + (nx + 2) * ybin
+        return array.reshape(shape).T[x1 : x2 + 1, y1 : y2 + 1]
+
+    w = in_range(entries)
+    return [
+        w.sum(),
+        in_range(bin_sumw2).sum(),
+        (w * x).sum(),
+        (w * x * x).sum(),
+        (w * y).sum(),
+        (w * y * y).sum(),
+        (w * x * y).sum(),
+        in_range(sums).sum(),
+        in_range(sumw2).sum(),
+    ]
+
+
+def import_root():
+    """
+    ROOT in batch mode, imported on the first use so that metrics with
+    HistogramView implementations run without it
+    """
+    import ROOT
+
+    ROOT.gROOT.SetBatch(True)
+    return ROOT
+
+
+def get_buffer(array, size):
+    """
+    Set the size of a C array returned by PyROOT, so numpy can read it
+    """
+    if hasattr(array, "reshape"):
+        array.reshape((size,))
+    else:
+        array.SetSize(size)
+    return array
+
+
+def get_edges(axis):
+    nbins = axis.GetNbins()
+    bins = axis.GetXbins()
+    if bins.GetSize():
+        return np.frombuffer(
+            get_buffer(bins.GetArray(), nbins + 1), dtype=np.float64, count=nbins + 1
+        ).copy()
+    return np.linspace(axis.GetXmin(), axis.GetXmax(), nbins + 1)
@@ -1,3 +1,5 @@
+import numpy as np
+
 from .basic import BaseMetric
 
 
@@ -14,6 +16,12 @@ class NOutsideRange(BaseMetric):
         B = T - s
         return (B, 0)
 
+    def calculateView(self, view):
+        view.check_dim(1)
+        s = view.integral(view.find_bin(self.__low), view.find_bin(self.__high))
+        T = view.integral()
+        return (T - s, 0)
+
 
 class MeanCh(BaseMetric):
     def __init__(self, ch):
@@ -30,3 +38,8 @@ class MeanCh(BaseMetric):
             return (0, 0)
 
         return (tot / float(count), 0)
+
+    def calculateView(self, view):
+        count = view.nbinsx + 1
+        tot = float(view.take(np.arange(0, count), self.__ch).sum())
+        return (tot / float(count), 0)
@@ -0,0 +1,171 @@
+"""
+Stages of dqm_extractor.py connected by bounded queues.
+Every stage runs in its own threads, so reading the next GUI files, evaluating the
+metrics of the current one and writing the previous ones to the DB overlap.
+The queues are bounded, a slow stage blocks the stages before it instead of
+piling up opened files in memory.
+Counters of every stage show which one is the bottleneck:
+    busy    - seconds spent in the stage function
+    idle    - seconds waiting for input, the stages before are too slow
+    blocked - seconds waiting for room in the output queue, the stages after are too slow
+    depth   - mean / max number of items waiting in the input queue
+"""
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# end of the items, put once for every thread of the next stage
+DONE = object()
+
+
+class StageStats:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.lock = threading.Lock()
+
+    def add(self, busy=0.0, idle=0.0, blocked=0.0, depth=None):
+        with self.lock:
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+            if depth is not None:
+                self.items += 1
+                self.depth_sum += depth
+                self.depth_max = max(self.depth_max, depth)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "busy": self.busy,
+            "idle": self.idle,
+            "blocked": self.blocked,
+            "depth_mean": self.depth_sum / self.items if self.items else 0.0,
+            "depth_max": self.depth_max,
+        }
+
+    def __str__(self):
+        return (
+            "%(name)s: %(workers)s threads, %(items)s items, busy/idle/blocked = "
+            "%(busy).1f/%(idle).1f/%(blocked).1f s, input queue mean/max = "
+            "%(depth_mean).1f/%(depth_max)s" % self.as_dict()
+        )
+
+
+class Stage:
+    """
+    func(item) -> the item of the next stage, None to drop it.
+    func should handle its own errors, the first exception is raised by
+    Pipeline.results() once the other items went through.
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+class Pipeline:
+    """
+    Runs the stages over the items, results() yields the outputs of the last stage.
+    depth - size of the queue in front of every stage and of the results
+    """
+
+    def __init__(self, items, stages, depth=4):
+        self.items = items
+        self.stages = stages
+        self.depth = max(1, depth)
+        # input queue of every stage, the last one holds the results
+        self.queues = [queue.Queue(self.depth) for _ in range(len(stages) + 1)]
+        self.stats = [StageStats(x.name, x.workers) for x in stages]
+        self.error = None
+        self.running = {}  # stage index -> threads not done yet
+        self.lock = threading.Lock()
+
+    def put(self, index, item, stats=None):
+        start = time.perf_counter()
+        self.queues[index].put(item)
+        if stats is not None:
+            stats.add(blocked=time.perf_counter() - start)
+
+    def put_done(self, index):
+        workers = self.stages[index].workers if index < len(self.stages) else 1
+        for _ in range(workers):
+            self.put(index, DONE)
+
+    def feed(self):
+        try:
+            for item in self.items:
+                self.put(0, item)
+        except Exception as error_log:
+            self.fail(error_log)
+        self.put_done(0)
+
+    def work(self, index):
+        stage, stats = self.stages[index], self.stats[index]
+        while True:
+            start = time.perf_counter()
+            depth = self.queues[index].qsize()
+            item = self.queues[index].get()
+            stats.add(idle=time.perf_counter() - start)
+            if item is DONE:
+                break
+            start = time.perf_counter()
+            try:
+                output = stage.func(item)
+            except Exception as error_log:
+                logger.exception('Stage "%s" failed' % stage.name)
+                self.fail(error_log)
+                output = None
+            stats.add(busy=time.perf_counter() - start, depth=depth)
+            if output is not None:
+                self.put(index + 1, output, stats)
+        with self.lock:
+            self.running[index] -= 1
+            last = not self.running[index]
+        if last:
+            self.put_done(index + 1)
+
+    def fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+
+    def results(self, name="write"):
+        """
+        Starts the stages and yields the outputs of the last one in this thread,
+        the consumer is counted as the stage `name`, e.g. the single DB writer.
+        Raises the first exception of a stage once the pipeline is drained.
+        """
+        for index, stage in enumerate(self.stages):
+            self.running[index] = stage.workers
+            for _ in range(stage.workers):
+                threading.Thread(target=self.work, args=(index,), daemon=True).start()
+        threading.Thread(target=self.feed, daemon=True).start()
+
+        stats = StageStats(name, 1)
+        self.stats.append(stats)
+        results = self.queues[-1]
+        while True:
+            start = time.perf_counter()
+            depth = results.qsize()
+            item = results.get()
+            stats.add(idle=time.perf_counter() - start)
+            if item is DONE:
+                break
+            start = time.perf_counter()
+            yield item
+            stats.add(busy=time.perf_counter() - start, depth=depth)
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,96 @@
+"""
+Readers of the GUI ROOT files, selected with dqm_extractor.py --reader.
+A reader opens a file as a directory with the TDirectory interface MEResolver uses
+(GetDirectory, GetListOfKeys, keys with GetName & ReadObj).
+    root   - PyROOT, MEs are ROOT histograms
+    uproot - uproot, MEs are read into HistogramViews without ROOT. ROOT is imported
+             only if a metric without a HistogramView implementation (the fits)
+             needs a ROOT copy of a histogram.
+"""
+import logging
+
+from metrics.histogram import HistogramView, import_root
+
+logger = logging.getLogger(__name__)
+
+
+class ROOTReader:
+    name = "root"
+
+    def __init__(self, threaded=False):
+        """
+        threaded - files are opened and histograms read in several threads
+        """
+        self.ROOT = import_root()
+        if threaded:
+            self.ROOT.EnableThreadSafety()
+
+    def open(self, path):
+        "the TFile, None if it can not be opened"
+        tfile = self.ROOT.TFile.Open(path)
+        return tfile if tfile else None
+
+    def close(self, tfile):
+        tfile.Close()
+
+
+class UprootKey:
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+
+    def GetName(self):
+        return self.name
+
+    def ReadObj(self):
+        "HistogramView of the histogram, None for other objects"
+        try:
+            return HistogramView.from_uproot(self.directory[self.name])
+        except Exception as error_log:
+            logger.debug('No HistogramView of "%s": %s' % (self.name, error_log))
+            return None
+
+
+class UprootDirectory:
+    "TDirectory interface of an uproot directory"
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def GetDirectory(self, path):
+        try:
+            directory = self.directory[path]
+        except KeyError:
+            return None
+        if not hasattr(directory, "keys"):
+            return None
+        return UprootDirectory(directory)
+
+    def GetListOfKeys(self):
+        return [
+            UprootKey(self.directory, x)
+            for x in self.directory.keys(recursive=False, cycle=False)
+        ]
+
+
+class UprootReader:
+    name = "uproot"
+
+    def __init__(self, threaded=False):
+        import uproot
+
+        self.uproot = uproot
+
+    def open(self, path):
+        "the file as an UprootDirectory, None if it can not be opened"
+        try:
+            return UprootDirectory(self.uproot.open(path))
+        except (OSError, ValueError) as error_log:
+            logger.warning('Unable to open file "%s": %s' % (path, error_log))
+            return None
+
+    def close(self, directory):
+        directory.directory.close()
+
+
+READERS = {x.name: x for x in [ROOTReader, UprootReader]}
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of API responses of a dataset.
+    Every entry is stored with the generation of its dataset. The extractor bumps
+    the generation in the DB with every commit, so the first lookup with a newer
+    generation drops all entries of the dataset.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = OrderedDict()  # key -> (dataset id, generation, response)
+        self.generations = {}  # dataset id -> newest known generation
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check_generation(self, dataset_id, generation):
+        if self.generations.get(dataset_id, generation) < generation:
+            for key in [k for k, x in self.entries.items() if x[0] == dataset_id]:
+                del self.entries[key]
+        self.generations[dataset_id] = max(
+            generation, self.generations.get(dataset_id, generation)
+        )
+
+    def get(self, key, dataset_id, generation):
+        with self.lock:
+            self.check_generation(dataset_id, generation)
+            entry = self.entries.get(key, None)
+            if entry is None or entry[1] != generation:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, dataset_id, generation, response):
+        with self.lock:
+            self.check_generation(dataset_id, generation)
+            if generation < self.generations[dataset_id]:
+                return
+            self.entries[key] = (dataset_id, generation, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+
+    def __len__(self):
+        return len(self.entries)
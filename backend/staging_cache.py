@@ -0,0 +1,207 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+
+
+def get_local_name(path):
+    digest = hashlib.blake2b(path.encode("utf-8"), digest_size=16).hexdigest()
+    return digest + ".root"
+
+
+class StagingCache:
+    """
+    Read-through cache of GUI files in a local scratch directory, e.g. on an SSD.
+    A file is copied from EOS once and reopened from the local copy as long as
+    its size and mtime on EOS do not change. Once the copies would take more than
+    max_bytes, the least recently used files are removed. Files being processed
+    are pinned and never removed.
+    The index of the copies is saved in the directory, so the next runs of the
+    extractor reuse them. It is also saved every save_every staged files, a crash
+    then loses at most these copies. Files are staged from several threads.
+    """
+
+    def __init__(self, directory, max_bytes, save_every=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.save_every = save_every
+        self.unsaved = 0  # files staged since the last save
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        # path on EOS -> {"size", "mtime", "name"}, least recently used first
+        self.entries = OrderedDict()
+        # path on EOS -> number of stage() calls not released yet
+        self.pinned = defaultdict(int)
+        # of the copies and of the copies in progress
+        self.used_bytes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "bytes_saved": 0,
+            "bytes_staged": 0,
+            "evicted": 0,
+            "errors": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """
+        Read the index, drop the entries without a complete copy and remove the
+        files not in the index, e.g. copies interrupted by a crash
+        """
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME)) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        for path, entry in entries:
+            try:
+                size = os.stat(os.path.join(self.directory, entry["name"])).st_size
+            except OSError:
+                continue
+            if size == entry["size"]:
+                self.entries[path] = entry
+                self.used_bytes += size
+        names = {x["name"] for x in self.entries.values()}
+        for name in os.listdir(self.directory):
+            if name != INDEX_NAME and name not in names:
+                self.remove_file(name)
+        self.make_room(0)
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                entries = list(self.entries.items())
+                self.unsaved = 0
+            path = os.path.join(self.directory, INDEX_NAME)
+            with open(path + ".tmp", "w") as f:
+                json.dump(entries, f)
+            os.replace(path + ".tmp", path)
+
+    def stage(self, path):
+        """
+        Path of the local copy of a file, copied now if it is not staged yet.
+        None if the file can not be staged, it is then read from EOS.
+        The file stays pinned until release().
+        """
+        try:
+            stat = os.stat(path)
+        except OSError as error_log:
+            logger.warning('Unable to stat file "%s", not staged' % path)
+            logger.warning("Error ... %s " % error_log)
+            with self.lock:
+                self.stats["errors"] += 1
+            return None
+        size, mtime = stat.st_size, stat.st_mtime_ns
+
+        with self.lock:
+            entry = self.entries.get(path, None)
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                self.entries.move_to_end(path)
+                self.pinned[path] += 1
+                self.stats["hits"] += 1
+                self.stats["bytes_saved"] += size
+                return os.path.join(self.directory, entry["name"])
+            self.stats["misses"] += 1
+            if entry:
+                logger.info('File "%s" changed on EOS, stage it again' % path)
+                self.evict(path)
+            if not self.make_room(size):
+                logger.info('No room in the staging cache for "%s"' % path)
+                return None
+            # reserved until the copy is done
+            self.used_bytes += size
+            self.pinned[path] += 1
+
+        name = get_local_name(path)
+        local_path = os.path.join(self.directory, name)
+        tmp_path = "%s.%s.tmp" % (local_path, threading.get_ident())
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, local_path)
+        except OSError as error_log:
+            logger.warning('Unable to stage file "%s"' % path)
+            logger.warning("Error ... %s " % error_log)
+            self.remove_file(os.path.basename(tmp_path))
+            with self.lock:
+                self.used_bytes -= size
+                self.unpin(path)
+                self.stats["errors"] += 1
+            return None
+
+        with self.lock:
+            if path in self.entries:
+                # staged by another thread meanwhile, to the same local path
+                self.used_bytes -= self.entries.pop(path)["size"]
+            self.entries[path] = {"size": size, "mtime": mtime, "name": name}
+            self.stats["bytes_staged"] += size
+            self.unsaved += 1
+            save = self.save_every and self.unsaved >= self.save_every
+        if save:
+            self.save()
+        return local_path
+
+    def release(self, path):
+        """
+        The file is processed, its copy can be removed to make room
+        """
+        with self.lock:
+            self.unpin(path)
+
+    def unpin(self, path):
+        self.pinned[path] -= 1
+        if self.pinned[path] <= 0:
+            del self.pinned[path]
+
+    def make_room(self, size):
+        """
+        Remove the least recently used copies not pinned until size bytes fit,
+        False if they do not. Called with the lock held.
+        """
+        if size > self.max_bytes:
+            return False
+        for path in list(self.entries):
+            if self.used_bytes + size <= self.max_bytes:
+                break
+            if path not in self.pinned:
+                self.evict(path)
+        return self.used_bytes + size <= self.max_bytes
+
+    def evict(self, path):
+        entry = self.entries.pop(path)
+        self.used_bytes -= entry["size"]
+        self.stats["evicted"] += 1
+        # a reader still holding the file open keeps reading it
+        self.remove_file(entry["name"])
+
+    def remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def __str__(self):
+        stats = self.stats
+        lookups = stats["hits"] + stats["misses"]
+        return (
+            "hits/misses = %s/%s (%.0f%%), saved/staged = %.2f/%.2f GB, "
+            "evicted %s files, used %.2f/%.2f GB"
+            % (
+                stats["hits"],
+                stats["misses"],
+                100.0 * stats["hits"] / lookups if lookups else 0,
+                stats["bytes_saved"] / 1e9,
+                stats["bytes_staged"] / 1e9,
+                stats["evicted"],
+                self.used_bytes / 1e9,
+                self.max_bytes / 1e9,
+            )
+        )
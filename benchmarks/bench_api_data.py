@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Payload size and time of /api/data in response format 1 and 2.
+Fills an in-memory SQLite DB with one subsystem of N trends over M runs with
+OMS info and requests the latest M runs in both formats, the response cache
+is cleared before every request.
+
+python3 benchmarks/bench_api_data.py --trends 300 --runs 500
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from backend import db, api
+from tests.test_data import RUN_REGISTRY_RUN_355556_DATA
+
+URL = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco&latest=%s"
+
+
+def fill_db(ntrends, nruns):
+    oms_data = RUN_REGISTRY_RUN_355556_DATA["oms_attributes"]
+    db.session.add(db.Dataset(id=1, stream="ZeroBias", reco_path="PromptReco"))
+    for i in range(1, ntrends + 1):
+        db.session.add(db.Config(id=i, subsystem="CSC", name="Trend%s" % i))
+        db.session.add(db.Trend(id=i, subsystem="CSC", dataset_id=1, config_id=i))
+    runs = [355000 + i for i in range(nruns)]
+    db.session.execute(
+        db.Run.__table__.insert(),
+        [
+            {"id": run, "rr_significant": True, "oms_data": str(oms_data)}
+            for run in runs
+        ],
+    )
+    db.add_trend_points(
+        [
+            {"trend_id": i, "run": run, "value": 1.0 * run, "error": 0.1}
+            for i in range(1, ntrends + 1)
+            for run in runs
+        ]
+    )
+    db.session.commit()
+
+
+def request(client, url, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        api.data_cache.clear()
+        size = len(client.get(url).get_data())
+    return size, (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--trends", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+    fill_db(args.trends, args.runs)
+    client = api.app.test_client()
+
+    url = URL % args.runs
+    for data_format in api.DATA_FORMATS:
+        size, seconds = request(client, url + "&format=%s" % data_format, args.repeat)
+        print(
+            "format %s : %8.2f MB %8.1f ms"
+            % (data_format, size / 1024.0 ** 2, seconds * 1e3)
+        )
+
+    api.data_cache.clear()
+    client.get(url + "&format=2")
+    start = time.perf_counter()
+    client.get(url + "&format=2")
+    print("cached   : %20.1f ms" % ((time.perf_counter() - start) * 1e3))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Encode time and size of the /api/data response encodings.
+Encodes N trends x M runs of points, as read from the DB, as format 2 JSON and
+as the columnar msgpack & Arrow IPC encodings if the modules are installed.
+
+python3 benchmarks/bench_columnar.py --trends 3000 --runs 1000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from collections import defaultdict, namedtuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from backend import api, columnar
+from tests.test_data import RUN_REGISTRY_RUN_355556_DATA
+
+Row = namedtuple("Row", ["trend_id", "run", "value", "error"])
+Run = namedtuple("Run", ["id", "oms", "oms_data"])
+Trend = namedtuple("Trend", ["id"])
+Config = namedtuple(
+    "Config",
+    [
+        "y_title",
+        "plot_title",
+        "name",
+        "relative_path",
+        "histo1_path",
+        "histo2_path",
+        "reference_path",
+    ],
+)
+
+
+def make_data(ntrends, nruns):
+    oms_data = str(RUN_REGISTRY_RUN_355556_DATA["oms_attributes"])
+    runs = [Run(355000 + i, None, oms_data) for i in range(nruns)]
+    trends_and_configs = [
+        (Trend(i), Config("y", "title", "Trend%s" % i, "A/B/C", None, None, None))
+        for i in range(1, ntrends + 1)
+    ]
+    rng = random.Random(1)
+    rows = [
+        Row(trend.id, run.id, rng.gauss(100, 10), rng.random())
+        for trend, config in trends_and_configs
+        for run in runs
+    ]
+    return trends_and_configs, runs, rows
+
+
+def encode_json(trends_and_configs, runs, rows):
+    points = defaultdict(dict)
+    for point in rows:
+        points[point.trend_id][point.run] = point
+    result = api.get_data_v2(trends_and_configs, runs, points, "CSC", "pd", "ps")
+    with api.app.app_context():
+        return api.jsonify(result).get_data()
+
+
+def encode_columnar(mimetype):
+    def encode(trends_and_configs, runs, rows):
+        return api.get_data_columnar(
+            trends_and_configs, runs, rows, mimetype, "CSC", "pd", "ps"
+        )
+
+    return encode
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--trends", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+
+    data = make_data(args.trends, args.runs)
+    print("points : %s" % len(data[2]))
+    encoders = [("JSON format 2", encode_json)]
+    for mimetype in columnar.get_mimetypes()[1:]:
+        encoders += [(mimetype, encode_columnar(mimetype))]
+    for name, encode in encoders:
+        start = time.perf_counter()
+        body = encode(*data)
+        seconds = time.perf_counter() - start
+        print(
+            "%-36s : %8.2f MB %8.0f ms"
+            % (name, len(body) / 1024.0 ** 2, seconds * 1e3)
+        )
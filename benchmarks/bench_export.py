@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Peak memory of /api/export compared to /api/data for growing datasets.
+Fills an SQLite DB with one subsystem of N trends over M runs and reads the
+responses chunk by chunk, memory is traced with tracemalloc.
+
+python3 benchmarks/bench_export.py --trends 100 300 1000 --runs 1000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from backend import db, api
+from benchmarks.bench_api_data import fill_db
+
+QUERY = "subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+
+def request(client, url):
+    api.data_cache.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, seconds, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--trends", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+
+    urls = {
+        "data format 2": "/api/data?%s&format=2&latest=%s" % (QUERY, args.runs),
+        "export ndjson": "/api/export?%s&format=ndjson" % QUERY,
+        "export csv": "/api/export?%s&format=csv" % QUERY,
+        "export parquet": "/api/export?%s&format=parquet" % QUERY,
+    }
+    print("trends  request            size MB    time s   peak memory MB")
+    for ntrends in args.trends:
+        db.create_session("sqlite:////tmp/hdqm_bench_export.db")
+        db.Base.metadata.drop_all(db.engine)
+        db.Base.metadata.create_all(db.engine)
+        fill_db(ntrends, args.runs)
+        client = api.app.test_client()
+        for name, url in urls.items():
+            size, seconds, peak = request(client, url)
+            print(
+                "%6s  %-15s %10.1f %9.2f %16.1f"
+                % (ntrends, name, size / 1024.0**2, seconds, peak / 1024.0**2)
+            )
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Per-call latency of the LanGau fit set up.
+Compares compiling & loading langau.c and creating the TF1 on every call with the
+compiled function registry of metrics.fits, and the full LanGau metric on top.
+Needs ROOT.
+
+python3 benchmarks/bench_langau.py
+"""
+import os
+import sys
+import time
+import argparse
+
+import ROOT
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from backend.metrics import fits
+
+
+def per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls
+
+
+def compile_every_call():
+    ROOT.gSystem.CompileMacro(fits.LANGAU_PATH, "k-")
+    ROOT.gSystem.Load(fits.LANGAU_PATH)
+    return ROOT.TF1("langau", ROOT.langaufun, 20, 200, 4)
+
+
+def from_registry():
+    fit = ROOT.TF1(fits.get_macro_function(fits.LANGAU_PATH, "langaufun", 4))
+    fit.SetRange(20, 200)
+    return fit
+
+
+def make_histo(entries):
+    histo = ROOT.TH1F("charge", "", 100, 0, 200)
+    random = ROOT.TRandom3(1)
+    for _ in range(entries):
+        histo.Fill(random.Landau(50, 5) + random.Gaus(0, 5))
+    return histo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+
+    # first call of each path compiles or loads the macro
+    start = time.perf_counter()
+    fits.get_macro_function(fits.LANGAU_PATH, "langaufun", 4)
+    first = time.perf_counter() - start
+
+    before = per_call(compile_every_call, args.calls)
+    after = per_call(from_registry, args.calls)
+    metric = fits.LanGau(1, 20, 200, 0.5, (5, 50, 1000, 5))
+    histo = make_histo(2000)
+    fit = per_call(lambda: metric.calculate(histo), args.calls)
+
+    print("first use (compile)  : %.2f ms" % (first * 1e3))
+    print("compile every call   : %.3f ms/call" % (before * 1e3))
+    print("registry             : %.3f ms/call" % (after * 1e3))
+    print("LanGau.calculate     : %.3f ms/call" % (fit * 1e3))
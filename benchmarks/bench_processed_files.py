@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Startup cost of the processed GUI files check.
+Compares preloading all GUIFile paths into extra.ProcessedFiles with the
+former one SELECT per candidate file (db.check_gui_file).
+
+python3 benchmarks/bench_processed_files.py --rows 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from backend import db
+from backend.extra import ProcessedFiles, DQMFile
+
+PATH = "/eos/cms/store/group/comm_dqm/DQMGUI_data/Run2022/PD%s/000%sxx/DQM_V0001_R000%s__PD%s__Run2022C-PromptReco-v1__DQMIO.root"
+
+
+def make_path(i):
+    run = 300000 + i // 50
+    return PATH % (i % 50, run // 100, run, i % 50)
+
+
+def fill_db(nrows):
+    rows = []
+    for i in range(nrows):
+        rows += [{"path": make_path(i), "run": str(300000 + i // 50)}]
+        if len(rows) == 100000:
+            db.session.execute(db.GUIFile.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.GUIFile.__table__.insert(), rows)
+    db.session.commit()
+
+
+def bench(nrows, nqueries):
+    tmp_dir = tempfile.mkdtemp()
+    db.create_session("sqlite:///" + os.path.join(tmp_dir, "bench.db"))
+    db.Base.metadata.create_all(db.engine)
+    fill_db(nrows)
+
+    candidates = [make_path(i) for i in range(0, nrows, max(1, nrows // nqueries))]
+
+    start = time.perf_counter()
+    processed = ProcessedFiles(db.get_gui_file_paths())
+    load_time = time.perf_counter() - start
+
+    del processed
+    tracemalloc.start()
+    processed = ProcessedFiles(db.get_gui_file_paths())
+    memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    assert all(x in processed for x in candidates)
+    set_time = (time.perf_counter() - start) / len(candidates)
+
+    start = time.perf_counter()
+    for path in candidates:
+        assert db.check_gui_file(DQMFile(path, *([None] * 7)))
+    query_time = (time.perf_counter() - start) / len(candidates)
+
+    print("GUIFile rows            : %s" % nrows)
+    print("preload                 : %.2f s" % load_time)
+    print("memory current/peak     : %.1f/%.1f MB" % (memory[0] / 1e6, memory[1] / 1e6))
+    print("lookup, in-memory set   : %.2f us/file" % (set_time * 1e6))
+    print("lookup, check_gui_file  : %.2f us/file" % (query_time * 1e6))
+    print(
+        "all files, in-memory set: %.2f s"
+        % (load_time + set_time * nrows)
+    )
+    print("all files, check_gui_file: %.2f s" % (query_time * nrows))
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    for nrows in args.rows:
+        bench(nrows, args.queries)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Cost per GUI file of the HCAL RBX trends.
+Evaluates every configured hcal_metrics trend with the bin-by-bin calculate and
+with calculateView on HistogramViews, where all RBXs are evaluated at once.
+Uses ROOT TH2D when ROOT is available, a Python stand-in otherwise.
+
+python3 benchmarks/bench_rbx_metrics.py
+"""
+import os
+import sys
+import time
+import argparse
+from glob import glob
+from configparser import RawConfigParser
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from backend.metrics import hcal_metrics
+from backend.metrics.histogram import HistogramView
+
+CFGFILES = "backend/cfg/HCAL/*.ini"
+
+
+class PyHisto:
+    "GetBinContent on a numpy array, a lower bound of the PyROOT call cost"
+
+    def __init__(self, contents):
+        self.contents = contents
+
+    def GetBinContent(self, x, y):
+        return float(self.contents[x, y])
+
+
+def make_histos(use_root, seed):
+    rng = np.random.RandomState(seed)
+    histos = []
+    for i in range(3):
+        contents = rng.normal(100, 10, (86, 74))
+        contents[rng.rand(86, 74) < 0.3] = 0
+        if use_root:
+            import ROOT
+
+            histo = ROOT.TH2D("depth%s_%s" % (i, seed), "", 84, -42, 42, 72, 0, 72)
+            for x in range(86):
+                for y in range(74):
+                    histo.SetBinContent(x, y, contents[x, y])
+            histos += [(histo, HistogramView.from_root(histo))]
+        else:
+            histos += [(PyHisto(contents), HistogramView(contents))]
+    return histos
+
+
+def read_metrics(path):
+    metrics = []
+    for cfg_file in glob(os.path.join(path, CFGFILES)):
+        parser = RawConfigParser()
+        parser.read(cfg_file)
+        for section in parser.sections():
+            metric = parser[section].get("metric", "")
+            if metric.startswith("hcal_metrics."):
+                metrics += [eval(metric, {"hcal_metrics": hcal_metrics})]
+    return metrics
+
+
+def run(metrics, histos, index):
+    start = time.perf_counter()
+    for metric in metrics:
+        metric.setOptionalHisto1(histos[1][index])
+        metric.setOptionalHisto2(histos[2][index])
+        if index:
+            metric.calculateView(histos[0][index])
+        else:
+            metric.calculate(histos[0][index])
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--files", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        import ROOT
+
+        use_root = True
+    except ImportError:
+        use_root = False
+
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    metrics = read_metrics(root)
+    loops, views = 0, 0
+    for seed in range(args.files):
+        histos = make_histos(use_root, seed)
+        loops += run(metrics, histos, 0)
+        views += run(metrics, histos, 1)
+
+    print("histograms          : %s" % ("ROOT TH2D" if use_root else "Python stand-in"))
+    print("RBX trends          : %s" % len(metrics))
+    print("calculate           : %.1f ms/file" % (loops / args.files * 1e3))
+    print("calculateView       : %.1f ms/file" % (views / args.files * 1e3))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Wall time and memory per GUI file of the dqm_extractor.py readers.
+Every reader runs in its own process, so the import of ROOT or uproot is measured
+and the max RSS of one reader does not hide the other. Without --files a synthetic
+GUI file with a TH1D per ME is written with uproot.
+
+python3 benchmarks/bench_readers.py --mes 2000 --repeat 5
+python3 benchmarks/bench_readers.py --files /eos/.../DQM_V0001_R000355555__*.root
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+BACKEND = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "backend"
+)
+SUBSYSTEMS = ["CSC", "DT", "GEM", "Muons", "Tracking", "PixelPhase1", "Hcal"]
+MES_PER_FOLDER = 50
+
+
+def get_mes(nmes):
+    return [
+        "%s/Folder%s/h%s" % (SUBSYSTEMS[i % len(SUBSYSTEMS)], i // MES_PER_FOLDER, i)
+        for i in range(nmes)
+    ]
+
+
+def write_file(path, run, mes):
+    import numpy as np
+    import uproot
+
+    rng = np.random.default_rng(run)
+    with uproot.recreate(path) as f:
+        for me in mes:
+            subsystem, rest = me.split("/", 1)
+            key = "DQMData/Run %s/%s/Run summary/%s" % (run, subsystem, rest)
+            f[key] = np.histogram(rng.normal(50, 10, 1000), bins=100, range=(0, 100))
+
+
+def run_reader(reader, paths, mes, repeat):
+    """
+    Executed in the child process, prints the results as JSON
+    """
+    sys.path.append(BACKEND)
+    start = time.perf_counter()
+    import readers
+    from extra import DQMFile, TrendCfg
+    from dqm_extractor import extract_trend_points, RUNPATTERN
+    from me_resolver import MEResolver
+    from metrics import basic
+
+    reader = readers.READERS[reader]()
+    import_seconds = time.perf_counter() - start
+
+    trend_cfgs = []
+    for i, me in enumerate(mes):
+        trend_cfg = TrendCfg("bench.ini", me, {"relativePath": me}, me.split("/")[0])
+        trend_cfg.SetMetric(basic.Mean())
+        trend_cfg.db_id = i
+        trend_cfgs.append(trend_cfg)
+    resolver = MEResolver(mes)
+
+    seconds = []
+    npoints = 0
+    for _ in range(repeat):
+        for path in paths:
+            run = int(RUNPATTERN.findall(os.path.basename(path))[0])
+            file = DQMFile(path, "", "", "", 1, run, "ZeroBias", "PromptReco")
+            start = time.perf_counter()
+            status, points = extract_trend_points(
+                file, trend_cfgs, resolver, reader=reader
+            )
+            seconds.append(time.perf_counter() - start)
+            npoints += len(points)
+    print(
+        json.dumps(
+            {
+                "import": import_seconds,
+                "seconds": seconds,
+                "points": npoints,
+                "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--files", nargs="+", default=None)
+    parser.add_argument("--mes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--readers", nargs="+", default=["root", "uproot"])
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    mes = get_mes(args.mes)
+
+    if args.child:
+        run_reader(args.child, args.files, mes, args.repeat)
+        sys.exit(0)
+
+    files = args.files
+    if not files:
+        files = ["/tmp/DQM_V0001_R000000001__ZeroBias__Bench-PromptReco-v1__DQMIO.root"]
+        write_file(files[0], 1, mes)
+
+    print("reader   import s   mean s/file   min s/file   points   max RSS MB")
+    for reader in args.readers:
+        command = [sys.executable, __file__, "--child", reader]
+        command += ["--mes", str(args.mes), "--repeat", str(args.repeat)]
+        output = subprocess.run(
+            command + ["--files"] + files,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(BACKEND),
+        )
+        if output.returncode:
+            print("%-8s failed" % reader)
+            continue
+        result = json.loads(output.stdout.decode().splitlines()[-1])
+        seconds = result["seconds"]
+        print(
+            "%-8s %8.2f %13.3f %12.3f %8s %12.1f"
+            % (
+                reader,
+                result["import"],
+                sum(seconds) / len(seconds),
+                min(seconds),
+                result["points"],
+                result["rss"] / 1024.0,  # kB on Linux
+            )
+        )
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Concurrent throughput of a running HDQM API.
+Sends the same set of requests from N client threads and reports requests/s and
+latency percentiles for every concurrency level. Start the API with e.g.
+
+    gunicorn --workers=`nproc` 'backend.api:create_app()' --bind=127.0.0.1:5000
+    gunicorn --workers=`nproc` --threads=4 'backend.api:create_app()' --bind=127.0.0.1:5000
+
+and compare the two configurations. Use DB_POOL_SIZE to set the pool per worker.
+
+python3 benchmarks/load_test_api.py --url http://127.0.0.1:5000 --clients 1 4 16 64
+"""
+import sys
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+QUERIES = [
+    "/api/selection",
+    "/api/plot_selection",
+    "/api/runs",
+]
+
+
+def fetch(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            ok = response.status == 200
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run(urls, clients, requests):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(
+            executor.map(fetch, [urls[i % len(urls)] for i in range(requests)])
+        )
+    seconds = time.perf_counter() - start
+    latencies = sorted(x[1] for x in results)
+    errors = sum(1 for x in results if not x[0])
+    return requests / seconds, latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--query",
+        action="append",
+        help="API path to request, /api/data?... for example. "
+        "Default: %s" % " ".join(QUERIES),
+    )
+    args = parser.parse_args()
+
+    urls = [args.url.rstrip("/") + x for x in (args.query or QUERIES)]
+    for url in urls:
+        ok, seconds = fetch(url)
+        if not ok:
+            sys.exit("API not reachable: %s" % url)
+
+    print("clients   requests/s   p50 ms   p95 ms   p99 ms   errors")
+    for clients in args.clients:
+        throughput, latencies, errors = run(urls, clients, args.requests)
+        print(
+            "%7s %12.1f %8.1f %8.1f %8.1f %8s"
+            % (
+                clients,
+                throughput,
+                percentile(latencies, 0.5) * 1e3,
+                percentile(latencies, 0.95) * 1e3,
+                percentile(latencies, 0.99) * 1e3,
+                errors,
+            )
+        )
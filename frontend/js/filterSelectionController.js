@@ -103,7 +103,7 @@ const filterController = (function(){
             const base = config.getBaseAPIUrl()
 
             const value = $("#filter-select").val()
-            const selectedData = `subsystem=${selectionController.selectedSubsystem()}&pd=${selectionController.selectedPD()}&processing_string=${selectionController.selectedProcessingString()}`
+            const selectedData = `format=2&subsystem=${selectionController.selectedSubsystem()}&pd=${selectionController.selectedPD()}&processing_string=${selectionController.selectedProcessingString()}`
 
             if(value == "latest")
             {
@@ -75,8 +75,25 @@ const main = (function() {
             this.changeUrlToReflectSettings()
         },
 
-        transformAPIResponseToData: function(allSeries) {
+        // Format 2 /data responses send the OMS info of every run once,
+        // expand them to the format 1 list of series with a point per run
+        expandAPIResponse: function(response) {
+            if(response.format !== 2)
+                return response
+            return response.series.map(series => ({
+                metadata: series.metadata,
+                trends: series.runs.map((index, i) => ({
+                    run: response.runs[index].run,
+                    value: series.values[i],
+                    error: series.errors[i],
+                    oms_info: response.runs[index].oms_info
+                }))
+            }))
+        },
+
+        transformAPIResponseToData: function(response) {
             const data = []
+            const allSeries = this.expandAPIResponse(response)
             const allSeriesNames = allSeries.map(x => x.metadata.name)
 
             // Get display groups for the selected subsystem
@@ -64,11 +64,11 @@ const seriesListComponent = (function() {
                 try {
                     this.showSpinner()
                     const base = config.getBaseAPIUrl()
-                    const url = `${base}/data?trend_id=${series_id}&from_run=${runFrom}&to_run=${runTo}&subsystem=${subsystem}&pd=${pd}&processing_string=${ps}`
+                    const url = `${base}/data?format=2&trend_id=${encodeURIComponent(series_id)}&from_run=${runFrom}&to_run=${runTo}&subsystem=${subsystem}&pd=${pd}&processing_string=${ps}`
                     const response = await fetch(url, {
                         credentials: "same-origin"
                     })
-                    allSeries = await response.json()
+                    allSeries = main.expandAPIResponse(await response.json())
                 }
                 catch(error) {
                     console.error(error)
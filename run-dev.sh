@@ -32,7 +32,7 @@ if [ "$1" = "api" ]; then
   fi
   # No need to bind to 0.0.0.0, we have an nginx to take care of
   # exposing the port.
-  gunicorn --workers=`nproc` 'backend.api:create_app()' --bind=127.0.0.1:$PORT
+  gunicorn --workers=`nproc` --threads=${API_THREADS:-1} 'backend.api:create_app()' --bind=127.0.0.1:$PORT
 elif [ "$1" = "extract" ]; then
   source venv/bin/activate
 
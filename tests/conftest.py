@@ -0,0 +1,45 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db, api
+
+DATA_URL = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+
+@pytest.fixture
+def api_db():
+    """
+    In memory DB with the CSC "Mean" trend (id 1) of the ZeroBias PromptReco
+    dataset (id 1) and an empty /api/data cache
+    """
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+    db.session.add(db.Dataset(id=1, stream="ZeroBias", reco_path="PromptReco"))
+    db.session.add(db.Config(id=1, subsystem="CSC", name="Mean"))
+    db.session.add(db.Trend(id=1, subsystem="CSC", dataset_id=1, config_id=1))
+    db.session.commit()
+    api.data_cache.clear()
+
+
+@pytest.fixture
+def client(api_db):
+    return api.app.test_client()
+
+
+@pytest.fixture
+def add_run_points(api_db):
+    """
+    add_run_points(run) writes a RR significant run with a point of trend 1,
+    as the extractor does
+    """
+
+    def add(run):
+        batch = db.WriteBatch()
+        batch.add_run(db.Run(id=run, oms_data="{}", rr_significant=True))
+        batch.add_points([{"trend_id": 1, "run": run, "value": 1.0, "error": 0.0}], 1)
+        batch.flush()
+
+    return add
@@ -0,0 +1,106 @@
+import os
+import sys
+import pytest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db, api, columnar
+
+URL = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+
+@pytest.fixture(autouse=True)
+def points(api_db, add_run_points):
+    db.session.add(db.Config(id=2, subsystem="CSC", name="RMS"))
+    db.session.add(db.Trend(id=2, subsystem="CSC", dataset_id=1, config_id=2))
+    db.session.add(db.Config(id=3, subsystem="CSC", name="Empty"))
+    db.session.add(db.Trend(id=3, subsystem="CSC", dataset_id=1, config_id=3))
+    db.session.commit()
+    for run in [355557, 355555, 355556]:
+        add_run_points(run)
+    db.add_trend_points([{"trend_id": 2, "run": 355556, "value": 2.0, "error": 0.5}])
+    db.session.commit()
+
+
+def expected_series(client):
+    series = {}
+    for x in client.get(URL).get_json():
+        points = [(y["run"], y["value"], y["error"]) for y in x["trends"]]
+        series[x["metadata"]["trend_id"]] = points
+    return series
+
+
+def test_get_columns():
+    rows = [(2, 10, 1.0, 0.1), (1, 12, 2.0, 0.2), (1, 11, 3.0, 0.3)]
+    offsets, runs, values, errors = columnar.get_columns([1, 2, 3], rows)
+    assert offsets.tolist() == [0, 2, 3, 3]
+    assert runs.tolist() == [11, 12, 10]
+    assert values.tolist() == [3.0, 2.0, 1.0]
+    assert runs.dtype == np.int32 and errors.dtype == np.float64
+
+    offsets, runs, values, errors = columnar.get_columns([1], [])
+    assert offsets.tolist() == [0, 0] and runs.size == 0
+
+
+def test_read_points():
+    """
+    Points are read from the cursor in chunks, the array grows past its first size.
+    """
+    query = db.session.query(
+        db.TrendPoint.trend_id,
+        db.TrendPoint.run,
+        db.TrendPoint.value,
+        db.TrendPoint.error,
+    ).order_by(db.TrendPoint.trend_id, db.TrendPoint.run)
+    points = columnar.read_points(db.session.connection(), query.statement, size=2)
+    assert points.shape == (4, 4)
+    assert points.tolist() == [list(x) for x in query.all()]
+
+    query = query.filter(db.TrendPoint.trend_id == 3)
+    points = columnar.read_points(db.session.connection(), query.statement)
+    assert points.shape == (0, 4)
+
+
+def test_msgpack_response():
+    msgpack = pytest.importorskip("msgpack")
+    client = api.app.test_client()
+    response = client.get(URL, headers={"Accept": columnar.MSGPACK_MIMETYPE})
+    assert response.mimetype == columnar.MSGPACK_MIMETYPE
+    data = msgpack.unpackb(response.get_data(), strict_map_key=False)
+    offsets = np.frombuffer(data["offsets"], "<i4")
+    runs = np.frombuffer(data["runs"], "<i4")
+    values = np.frombuffer(data["values"], "<f8")
+    errors = np.frombuffer(data["errors"], "<f8")
+    series = {
+        x["trend_id"]: list(
+            zip(
+                runs[offsets[i] : offsets[i + 1]].tolist(),
+                values[offsets[i] : offsets[i + 1]].tolist(),
+                errors[offsets[i] : offsets[i + 1]].tolist(),
+            )
+        )
+        for i, x in enumerate(data["series"])
+    }
+    assert series == expected_series(client)
+    assert sorted(data["oms_info"]) == [355555, 355556, 355557]
+
+
+def test_arrow_response():
+    pyarrow = pytest.importorskip("pyarrow")
+    client = api.app.test_client()
+    response = client.get(URL, headers={"Accept": columnar.ARROW_MIMETYPE})
+    assert response.mimetype == columnar.ARROW_MIMETYPE
+    table = pyarrow.ipc.open_stream(response.get_data()).read_all()
+    series = {
+        trend_id: list(zip(runs, values, errors))
+        for trend_id, runs, values, errors in zip(*table.to_pydict().values())
+    }
+    assert series == expected_series(client)
+
+
+def test_json_default():
+    client = api.app.test_client()
+    response = client.get(URL, headers={"Accept": "text/html,*/*;q=0.8"})
+    assert response.mimetype == columnar.JSON_MIMETYPE
+    assert client.get(URL, headers={"Accept": "text/html"}).status_code == 406
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+from backend.extra import DQMFile
+
+
+def test_data_delta(client, add_run_points):
+    """
+    Deltas send the points of new runs or the points written since a generation.
+    """
+    for run in [355555, 355556]:
+        add_run_points(run)
+
+    url = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+    full = client.get(url + "&format=2").json
+    assert full["generation"] == 2 and "delta" not in full
+
+    def delta(query):
+        result = client.get(url + query).json
+        assert result["delta"]
+        runs = [x["run"] for x in result["runs"]]
+        return result["generation"], [
+            [runs[i] for i in x["runs"]] for x in result["series"]
+        ]
+
+    assert delta("&since_generation=2") == (2, [[]])
+    add_run_points(355557)
+    assert delta("&since_run=355556") == (3, [[355557]])
+    assert delta("&since_generation=2") == (3, [[355557]])
+
+    # reprocessed run, the batch writes the points with the new generation
+    batch = db.WriteBatch()
+    batch.add_points([{"trend_id": 1, "run": 355555, "value": 2.0, "error": 0.0}], 1)
+    batch.flush()
+    assert delta("&since_generation=3") == (4, [[355555]])
+    assert delta("&since_run=355556&since_generation=3") == (4, [[]])
+    assert client.get(url + "&since_run=1&latest=5").status_code == 400
+
+    # run signed off in RR after its points were written
+    batch.add_points([{"trend_id": 1, "run": 355558, "value": 1.0, "error": 0.0}], 1)
+    batch.add_gui_file(
+        DQMFile("/eos/355558.root", "", "", "", 1, 355558, "ZeroBias", "PromptReco")
+    )
+    batch.add_run(db.Run(id=355558, oms_data="{}", rr_significant=False))
+    batch.flush()
+    generation = delta("&since_generation=4")[0]
+    assert delta("&since_generation=4") == (generation, [[]])
+    batch.add_run(db.Run(id=355558, oms_data="{}", rr_significant=True))
+    batch.flush()
+    assert delta("&since_generation=%s" % generation) == (generation + 1, [[355558]])
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+
+
+def test_data_format_2(client, add_run_points):
+    """
+    Format 2 sends every run once and expands to the format 1 series.
+    """
+    db.session.add(db.Config(id=2, subsystem="CSC", name="RMS"))
+    db.session.add(db.Trend(id=2, subsystem="CSC", dataset_id=1, config_id=2))
+    db.session.commit()
+    for run in [355555, 355556, 355557]:
+        add_run_points(run)
+    db.session.query(db.Run).where(db.Run.id == 355556).update(
+        {"oms_data": "{'fill_number': 8000}"}
+    )
+    db.add_trend_points([{"trend_id": 2, "run": 355556, "value": 2.0, "error": 0.5}])
+    db.session.commit()
+
+    url = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+    v1 = client.get(url).get_json()
+    v2 = client.get(url + "&format=2").get_json()
+    assert [x["run"] for x in v2["runs"]] == [355555, 355556, 355557]
+    assert v2["runs"][1]["oms_info"] == {"fill_number": 8000}
+
+    expanded = [
+        {
+            "metadata": series["metadata"],
+            "trends": [
+                {
+                    "run": v2["runs"][index]["run"],
+                    "value": value,
+                    "error": error,
+                    "oms_info": v2["runs"][index]["oms_info"],
+                }
+                for index, value, error in zip(
+                    series["runs"], series["values"], series["errors"]
+                )
+            ],
+        }
+        for series in v2["series"]
+    ]
+    assert expanded == v1
+    assert client.get(url + "&format=3").status_code == 400
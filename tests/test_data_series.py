@@ -0,0 +1,33 @@
+import os
+import sys
+from urllib.parse import quote
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+
+URL = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+
+def test_data_series_selection(client, add_run_points):
+    """
+    Trends can be selected by config names and by trend ids.
+    """
+    for i, name in [(2, "Plot2"), (3, "ClusterSize_endcap+")]:
+        db.session.add(db.Config(id=i, subsystem="CSC", name=name))
+        db.session.add(db.Trend(id=i, subsystem="CSC", dataset_id=1, config_id=i))
+    db.session.commit()
+    add_run_points(355555)
+
+    def trend_ids(query):
+        return sorted(x["metadata"]["trend_id"] for x in client.get(URL + query).json)
+
+    assert trend_ids("") == [1, 2, 3]
+    assert trend_ids("&trend_id=2") == [2]
+    assert trend_ids("&trend_id=3,1") == [1, 3]
+    assert trend_ids("&series=Plot2,Mean") == [1, 2]
+    assert trend_ids("&series=Plot2&trend_id=1,2") == [2]
+    # names with "+" are selected when encoded as the frontend does
+    assert trend_ids("&series=" + quote("ClusterSize_endcap+,Mean", safe="")) == [1, 3]
+    assert trend_ids("&series=ClusterSize_endcap+") == []
+    assert client.get(URL + "&trend_id=a").status_code == 400
@@ -0,0 +1,34 @@
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db, api
+
+
+def test_thread_local_sessions():
+    """
+    Every thread works with its own session of the shared engine.
+    """
+    db.create_session("sqlite://")
+    sessions = []
+
+    def get_session():
+        sessions.append(db.session())
+
+    threads = [threading.Thread(target=get_session) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(id(x) for x in sessions + [db.session()])) == 4
+    assert all(x.bind is db.engine for x in sessions)
+
+
+def test_request_session_removed():
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+    session = db.session()
+    assert api.app.test_client().get("/api/runs").json == []
+    assert db.session() is not session
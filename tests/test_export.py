@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import json
+import pytest
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db, api, export
+
+URL = "/api/export?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+
+@pytest.fixture(autouse=True)
+def points(api_db, add_run_points):
+    db.session.add(db.Config(id=2, subsystem="CSC", name="RMS"))
+    db.session.add(db.Trend(id=2, subsystem="CSC", dataset_id=1, config_id=2))
+    db.session.commit()
+    for run in [355555, 355556, 355557]:
+        add_run_points(run)
+    db.add_trend_points([{"trend_id": 2, "run": 355556, "value": 2.0, "error": 0.5}])
+    db.session.query(db.Run).where(db.Run.id == 355557).update(
+        {"rr_significant": False}
+    )
+    db.session.commit()
+
+
+def test_export_ndjson():
+    """
+    A line per trend with the points of the significant runs.
+    """
+    client = api.app.test_client()
+    response = client.get(URL)
+    assert response.mimetype == export.NDJSON_MIMETYPE
+    assert "CSC_ZeroBias_PromptReco.ndjson" in response.headers["Content-Disposition"]
+    lines = [json.loads(x) for x in response.get_data(as_text=True).splitlines()]
+    assert [x["metadata"]["name"] for x in lines] == ["Mean", "RMS"]
+    assert lines[0]["runs"] == [355555, 355556]
+    assert lines[1] == dict(lines[1], runs=[355556], values=[2.0], errors=[0.5])
+
+    lines = client.get(URL + "&trend_id=2&from_run=355550&to_run=355555")
+    assert lines.get_data() == b""
+    assert client.get(URL + "&runs=x").status_code == 400
+    assert client.get(URL + "&format=xml").status_code == 400
+
+
+def test_export_csv():
+    """
+    A line per point.
+    """
+    client = api.app.test_client()
+    response = client.get(URL + "&format=csv&series=RMS,Mean&runs=355556")
+    assert response.get_data(as_text=True).splitlines() == [
+        "trend_id,name,run,value,error",
+        "1,Mean,355556,1.0,0.0",
+        "2,RMS,355556,2.0,0.5",
+    ]
+
+
+def test_export_parquet(monkeypatch):
+    """
+    A row group per PARQUET_ROW_GROUP points, read back as one table.
+    """
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    monkeypatch.setattr(export, "PARQUET_ROW_GROUP", 2)
+    client = api.app.test_client()
+    body = client.get(URL + "&format=parquet").get_data()
+    parquet = pyarrow.parquet.ParquetFile(io.BytesIO(body))
+    assert parquet.num_row_groups == 2
+    table = parquet.read().to_pydict()
+    assert table["trend_id"] == [1, 1, 2]
+    assert table["run"] == [355555, 355556, 355556]
+    assert table["value"] == [1.0, 1.0, 2.0]
+    series = json.loads(parquet.schema_arrow.metadata[b"series"])
+    assert [x["trend_id"] for x in series] == [1, 2]
+
+
+def test_export_parquet_missing_pyarrow(monkeypatch):
+    monkeypatch.setattr(export, "pyarrow", None)
+    client = api.app.test_client()
+    response = client.get(URL + "&format=parquet")
+    assert response.status_code == 400
+    assert "pyarrow" in response.get_json()["message"]
+    assert client.get(URL + "&format=csv").status_code == 200
@@ -0,0 +1,66 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+from backend.file_catalog import FileCatalog
+
+PATTERN = "DQM_V*DQMIO.root"
+ERAS = ["Run2022C", "Run2022D"]
+PDS = ["PD%02d" % i for i in range(10)]
+RUN_DIRS = ["000355%sxx" % i for i in range(10)]
+FILES_PER_DIR = 100
+
+
+def file_name(pd, run):
+    return "DQM_V0001_R000%s__%s__Run2022C-PromptReco-v1__DQMIO.root" % (run, pd)
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    """
+    Synthetic DQMGUI_data tree with 20k fake GUI files
+    """
+    root = tmp_path_factory.mktemp("DQMGUI_data")
+    for era in ERAS:
+        for pd in PDS:
+            for run_dir in RUN_DIRS:
+                path = root / era / pd / run_dir
+                path.mkdir(parents=True)
+                for i in range(FILES_PER_DIR):
+                    (path / file_name(pd, 355000 + i)).touch()
+                (path / "not_a_gui_file.txt").touch()
+    return root
+
+
+def test_catalog_full_scan(tree):
+    catalog = FileCatalog(str(tree), PATTERN)
+    files = catalog.update()
+    assert len(files) == len(ERAS) * len(PDS) * len(RUN_DIRS) * FILES_PER_DIR
+    assert len(catalog.changed) == len(ERAS) * len(PDS) * len(RUN_DIRS)
+    assert all(f.endswith("DQMIO.root") for f in files)
+
+
+def test_catalog_incremental_update(tree):
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+
+    catalog = FileCatalog(str(tree), PATTERN)
+    n_files = len(catalog.update())
+    db.update_catalog(catalog.changed, catalog.removed)
+
+    # restart with the catalog stored in the DB, nothing changed
+    catalog = FileCatalog(str(tree), PATTERN, directories=db.get_catalog())
+    assert len(catalog.update()) == n_files
+    assert not catalog.changed and not catalog.removed
+
+    # a new file in one directory
+    path = tree / "Run2022D" / "PD03" / RUN_DIRS[0]
+    new_file = path / file_name("PD03", 356000)
+    new_file.touch()
+    files = catalog.update()
+    assert list(catalog.changed) == [str(path)]
+    assert str(new_file) in files
+    assert len(files) == n_files + 1
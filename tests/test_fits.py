@@ -0,0 +1,89 @@
+import os
+import sys
+import shutil
+import pytest
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend.metrics import fits
+
+
+def test_macro_compiled_once(monkeypatch, tmp_path):
+    ROOT = pytest.importorskip("ROOT")
+    path = str(tmp_path / "langau.c")
+    shutil.copy(fits.LANGAU_PATH, path)
+    calls = []
+    compile_macro = ROOT.gSystem.CompileMacro
+
+    def counting_compile(*args):
+        calls.append(args)
+        return compile_macro(*args)
+
+    monkeypatch.setattr(ROOT.gSystem, "CompileMacro", counting_compile)
+    prototype = fits.get_macro_function(path, "langaufun", 4)
+    assert fits.get_macro_function(path, "langaufun", 4) is prototype
+    assert len(calls) == 1
+
+    # touched but unchanged source is not compiled again
+    os.utime(path, None)
+    assert fits.get_macro_function(path, "langaufun", 4) is prototype
+    assert len(calls) == 1
+
+    with open(path, "a") as source:
+        source.write("\n")
+    assert fits.get_macro_function(path, "langaufun", 4) is not prototype
+    assert len(calls) == 2
+
+
+def make_landau(ROOT, seed, entries=5000):
+    histo = ROOT.TH1F("landau%s" % seed, "", 100, 0, 200)
+    random = ROOT.TRandom3(seed)
+    for _ in range(entries):
+        histo.Fill(random.Landau(50, 5))
+    return histo
+
+
+def test_fit_warm_start():
+    """
+    Seeded fits of consecutive runs need fewer iterations and agree with cold fits.
+    """
+    ROOT = pytest.importorskip("ROOT")
+    cache = fits.FitCache()
+    for metric_cls, args in (
+        (fits.Landau, (0, 20, 150, (50, 5, 1000))),
+        (fits.LandauAroundMax, (0, 0.6, 2.0, 1000)),
+    ):
+        cold_metric = metric_cls(*args)
+        warm_metric = metric_cls(*args)
+        warm_metric.setFitCache(cache, metric_cls.__name__)
+        for seed in range(1, 4):
+            histo = make_landau(ROOT, seed)
+            cold = cold_metric.calculate(histo)
+            warm = warm_metric.calculate(histo)
+            assert warm_metric.fitStatus == 0
+            assert cold_metric.fitIterations == fits.FIT_PASSES
+            assert warm[0] == pytest.approx(cold[0], abs=1e-2 * cold[1])
+            if seed > 1:
+                assert warm_metric.fitIterations <= cold_metric.fitIterations
+        assert cache.get(metric_cls.__name__) is not None
+
+
+def test_fit_cache_size():
+    cache = fits.FitCache(2)
+    for key in range(3):
+        cache.put(key, [key])
+    assert cache.get(0) is None
+    assert cache.get(2) == [2]
+
+
+def test_fit_cache_run_order():
+    """
+    Fits are seeded from an earlier run only, which a later run replaces.
+    """
+    cache = fits.FitCache()
+    cache.put("trend", [2], run=2)
+    assert cache.get("trend", run=3) == [2]
+    assert cache.get("trend", run=2) is None
+    assert cache.get("trend", run=1) is None
+    cache.put("trend", [1], run=1)
+    assert cache.get("trend", run=3) == [2]
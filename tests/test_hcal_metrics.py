@@ -0,0 +1,66 @@
+import os
+import sys
+import pytest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend.metrics import hcal_metrics
+from backend.metrics.histogram import HistogramView
+from tests.test_histogram_view import FakeAxis, FakeHisto
+
+DEPTHS = [(1, 2, 0), (3, 4, 0), (5, 6, 0), (5, 6, 7), (2, 2, 0)]
+
+
+def make_depth_histos(seed):
+    rng = np.random.RandomState(seed)
+    histos = []
+    for _ in range(3):
+        contents = rng.normal(100, 10, (84 + 2, 72 + 2))
+        contents[rng.rand(84 + 2, 72 + 2) < 0.3] = 0
+        histos += [FakeHisto(contents, FakeAxis(84, -42, 42), FakeAxis(72, 0, 72))]
+    return histos
+
+
+@pytest.mark.parametrize("depth", DEPTHS)
+def test_rbx_family_matches_loops(depth):
+    histos = make_depth_histos(sum(depth))
+    views = [x.view() for x in histos]
+    for name in list(hcal_metrics.hcal_map) + ["unknown"]:
+        for cls in (hcal_metrics.RBXMean, hcal_metrics.RBXCountNonZeroChan):
+            metric = cls(name, depth)
+            metric.setOptionalHisto1(histos[1])
+            metric.setOptionalHisto2(histos[2])
+            expected = metric.calculate(histos[0])
+            metric.setOptionalHisto1(views[1])
+            metric.setOptionalHisto2(views[2])
+            assert metric.calculateView(views[0]) == expected
+
+
+def test_rbx_family_single_pass(monkeypatch):
+    """
+    All RBX trends of the same depth histograms share one evaluation.
+    """
+    views = [x.view() for x in make_depth_histos(0)]
+    calls = []
+    take = HistogramView.take
+
+    def counting_take(self, *args):
+        calls.append(self)
+        return take(self, *args)
+
+    monkeypatch.setattr(HistogramView, "take", counting_take)
+    for name in hcal_metrics.hcal_map:
+        # trends of different depths alternate in the configs
+        for depth in [(1, 2, 0), (3, 4, 0)]:
+            metric = hcal_metrics.RBXMean(name, depth)
+            metric.setOptionalHisto1(views[1])
+            metric.calculateView(views[0])
+    assert len(calls) == 6
+
+    # new histograms are evaluated again
+    views = [x.view() for x in make_depth_histos(1)]
+    metric = hcal_metrics.RBXCountNonZeroChan("HBM01", (1, 2, 0))
+    metric.setOptionalHisto1(views[1])
+    metric.calculateView(views[0])
+    assert len(calls) == 9
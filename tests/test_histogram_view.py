@@ -0,0 +1,312 @@
+import os
+import sys
+import math
+import pytest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend.metrics import basic, muon_metrics
+from backend.metrics.histogram import HistogramView
+
+
+class FakeAxis:
+    def __init__(self, nbins, xmin, xmax, labels=None):
+        self.nbins, self.xmin, self.xmax, self.labels = nbins, xmin, xmax, labels
+
+    def GetNbins(self):
+        return self.nbins
+
+    def FindBin(self, x):
+        if isinstance(x, str):
+            return self.labels.index(x) + 1 if x in self.labels else -1
+        if x < self.xmin:
+            return 0
+        if not x < self.xmax:
+            return self.nbins + 1
+        return 1 + int(self.nbins * (x - self.xmin) / (self.xmax - self.xmin))
+
+    def GetBinCenter(self, i):
+        return self.xmin + (i - 0.5) * (self.xmax - self.xmin) / self.nbins
+
+
+class FakeHisto:
+    """
+    The subset of the TH1/TH2 interface used by the metrics, bin by bin in Python
+    """
+
+    def __init__(self, contents, xaxis, yaxis=None):
+        self.contents = contents
+        self.ndim = contents.ndim
+        self.xaxis = xaxis
+        self.yaxis = yaxis if yaxis else FakeAxis(1, 0, 1)
+        self.entries = float(contents.sum()) + 3
+
+    def cell(self, bin, ybin=None):
+        nx = self.xaxis.nbins + 2
+        if self.ndim == 1:
+            return self.contents[min(max(bin, 0), nx - 1)]
+        if ybin is None:
+            bin = min(max(bin, 0), self.contents.size - 1)
+            return self.contents[bin % nx, bin // nx]
+        ny = self.yaxis.nbins + 2
+        return self.contents[min(max(bin, 0), nx - 1), min(max(ybin, 0), ny - 1)]
+
+    def GetBinContent(self, bin, ybin=None):
+        return float(self.cell(bin, ybin))
+
+    def GetBinError(self, bin, ybin=None):
+        return math.sqrt(abs(self.cell(bin, ybin)))
+
+    def GetNbinsX(self):
+        return self.xaxis.nbins
+
+    def GetNbinsY(self):
+        return self.yaxis.nbins
+
+    def GetXaxis(self):
+        return self.xaxis
+
+    def GetYaxis(self):
+        return self.yaxis
+
+    def FindBin(self, x):
+        return self.xaxis.FindBin(x)
+
+    def GetSize(self):
+        return self.contents.size
+
+    def GetEntries(self):
+        return self.entries
+
+    def GetMaximum(self):
+        return max(
+            self.GetBinContent(i, j)
+            for i in range(1, self.GetNbinsX() + 1)
+            for j in range(1, self.GetNbinsY() + 1)
+        )
+
+    def Integral(self, bin1=None, bin2=None):
+        if bin1 is None:
+            bin1, bin2 = 1, self.GetNbinsX()
+        bin1 = max(bin1, 0)
+        if bin2 >= self.GetNbinsX() + 2 or bin2 < bin1:
+            bin2 = self.GetNbinsX() + 1
+        return sum(self.GetBinContent(i) for i in range(bin1, bin2 + 1))
+
+    def GetStats(self):
+        stats = [0.0] * 7
+        for i in range(1, self.GetNbinsX() + 1):
+            for j in range(1, self.GetNbinsY() + 1):
+                w = self.GetBinContent(i, j)
+                x = self.xaxis.GetBinCenter(i)
+                y = self.yaxis.GetBinCenter(j)
+                stats[0] += w
+                stats[1] += abs(w)
+                stats[2] += w * x
+                stats[3] += w * x * x
+                stats[4] += w * y
+                stats[5] += w * y * y
+                stats[6] += w * x * y
+        return stats
+
+    def GetMean(self, axis=1):
+        stats = self.GetStats()
+        return stats[2 * axis] / stats[0]
+
+    def GetStdDev(self, axis=1):
+        stats = self.GetStats()
+        mean = stats[2 * axis] / stats[0]
+        return math.sqrt(max(stats[2 * axis + 1] / stats[0] - mean * mean, 0))
+
+    def GetEffectiveEntries(self):
+        stats = self.GetStats()
+        return stats[0] * stats[0] / stats[1]
+
+    def GetMeanError(self, axis=1):
+        return self.GetStdDev(axis) / math.sqrt(self.GetEffectiveEntries())
+
+    def GetStdDevError(self, axis=1):
+        return self.GetStdDev(axis) / math.sqrt(2 * self.GetEffectiveEntries())
+
+    GetRMS = GetStdDev
+    GetRMSError = GetStdDevError
+
+    def view(self):
+        yedges = None
+        if self.ndim > 1:
+            yedges = np.linspace(self.yaxis.xmin, self.yaxis.xmax, self.yaxis.nbins + 1)
+        return HistogramView(
+            self.contents,
+            xedges=np.linspace(self.xaxis.xmin, self.xaxis.xmax, self.xaxis.nbins + 1),
+            yedges=yedges,
+            entries=self.entries,
+            xlabels=self.xaxis.labels,
+            fixed_xbins=True,
+        )
+
+
+def make_1d(seed, nbins=50, labels=None):
+    contents = np.random.RandomState(seed).poisson(20, nbins + 2).astype(float)
+    return FakeHisto(contents, FakeAxis(nbins, -2.5, 7.5, labels))
+
+
+def make_2d(seed, nx=12, ny=30):
+    rng = np.random.RandomState(seed)
+    contents = rng.poisson(5, (nx + 2, ny + 2)).astype(float)
+    contents[rng.rand(nx + 2, ny + 2) < 0.2] = 0
+    contents[rng.rand(nx + 2, ny + 2) < 0.1] = -1
+    return FakeHisto(contents, FakeAxis(nx, 0, nx), FakeAxis(ny, 0, ny))
+
+
+LABELS = ["bin%s" % i for i in range(1, 11)]
+
+METRICS_1D = [
+    basic.Mean(),
+    basic.MeanEntries(),
+    basic.MeanRMS(),
+    basic.StdDev(),
+    basic.RMSXAxis(),
+    basic.Count(),
+    basic.ProfileMean(),
+    basic.BinCount(7),
+    basic.BinCount("bin3"),
+    basic.ROCfraction(4, 1536, True),
+    basic.ROCfraction("bin5", 1536),
+    basic.FED25ErrorFraction(0.5, 100),
+    basic.EntriesCount(0.3),
+    basic.EntriesCount(-10),
+    basic.EntriesCount(100),
+    basic.BinsCount(1),
+    basic.BinsCount(-3),
+    basic.Ratio(0.2, 1.3),
+    basic.Ratio1(0.2, 1.3),
+    basic.Fraction(0.2, 1.3),
+    basic.Fraction1(-10, 1.3),
+    basic.FractionInBin(3),
+    basic.FractionInBinArray([2, 3], [1, 4]),
+    basic.SummaryMapPartition(3, 4),
+    basic.Mean2D(),
+    basic.MeanPosOnly(),
+    muon_metrics.NOutsideRange(0.2, 1.3),
+    muon_metrics.MeanCh(1),
+]
+
+METRICS_2D = [
+    basic.MeanYAxis(),
+    basic.RMSYAxis(),
+    basic.ProfileMean(),
+    basic.ProfileMeanBPixModules(1),
+    basic.ProfileMeanBPixModules(3),
+    basic.BinCount(40),
+    basic.FED25ErrorFraction(0.3, 400),
+    basic.StripBadComponent([1, 2, 3], 10, 1000),
+    basic.BinsCount(2),
+    basic.Mean2D(),
+    basic.BinRatio2D(2, 3, 4, 5),
+    basic.BinCount2D(3, 4),
+    basic.MeanYForXBin(4),
+    basic.MeanPosOnly(),
+    basic.MeanXRange(2, 5),
+    basic.SummaryMapPartition(3, 40),
+    muon_metrics.MeanCh(2),
+]
+
+
+def compare(metric, histo):
+    try:
+        expected = metric.calculate(histo)
+    except (ValueError, ZeroDivisionError) as error:
+        with pytest.raises(type(error)):
+            metric.calculateView(histo.view())
+        return
+    result = metric.calculateView(histo.view())
+    assert result == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+@pytest.mark.parametrize("metric", METRICS_1D, ids=lambda x: x.__class__.__name__)
+def test_view_1d(metric):
+    for seed in range(5):
+        compare(metric, make_1d(seed, labels=LABELS + [""] * 40))
+
+
+@pytest.mark.parametrize("metric", METRICS_2D, ids=lambda x: x.__class__.__name__)
+def test_view_2d(metric):
+    for seed in range(5):
+        compare(metric, make_2d(seed))
+
+
+def test_view_optional_histos():
+    histo, histo1 = make_1d(1), make_1d(2)
+    contents = histo1.contents.copy()
+    contents[::3] = 0
+    histo1 = FakeHisto(contents, histo1.xaxis)
+    metrics = [
+        basic.PixelEfficiency(),
+        basic.EntriesRate(0.5),
+        basic.RecoFraction(5),
+        basic.StripFEDErrorFraction(53, 1),
+    ]
+    for metric in metrics:
+        metric.setOptionalHisto1(histo1)
+        expected = metric.calculate(histo)
+        metric.setOptionalHisto1(histo1.view())
+        assert metric.calculateView(histo.view()) == pytest.approx(expected)
+
+    h2d, h2d_1 = make_2d(3), make_2d(4)
+    metric = basic.Bin2DRatio(2, 3)
+    metric.setOptionalHisto1(h2d_1)
+    expected = metric.calculate(h2d)
+    metric.setOptionalHisto1(h2d_1.view())
+    assert metric.calculateView(h2d.view()) == pytest.approx(expected)
+
+
+def test_view_fallback():
+    """
+    Metrics without an array path, or cases the array path can not reproduce,
+    raise NotImplementedError so the ROOT path is used.
+    """
+    assert not basic.MeanY().supportsView()
+    assert basic.Mean().supportsView()
+    with pytest.raises(NotImplementedError):
+        basic.MeanY().calculateView(make_1d(0).view())
+    with pytest.raises(NotImplementedError):
+        basic.BinCount("unknown").calculateView(make_1d(0, labels=LABELS).view())
+    with pytest.raises(NotImplementedError):
+        basic.Ratio(1, 2).calculateView(make_2d(0).view())
+
+
+def test_view_bin_numbering():
+    histo = make_2d(0, nx=3, ny=2)
+    view = histo.view()
+    for glob in range(-2, histo.contents.size + 2):
+        assert view.bin_content(glob) == histo.GetBinContent(glob)
+    for x in range(-1, 7):
+        for y in range(-1, 6):
+            assert view.bin_content(x, y) == histo.GetBinContent(x, y)
+
+
+def test_view_from_root():
+    """
+    Both paths on real ROOT histograms, profiles included
+    """
+    ROOT = pytest.importorskip("ROOT")
+    rng = np.random.RandomState(0)
+    h1 = ROOT.TH1F("h1", "h1", 50, -2.5, 7.5)
+    h2 = ROOT.TH2D("h2", "h2", 12, 0, 12, 30, 0, 30)
+    p1 = ROOT.TProfile("p1", "p1", 20, 0, 20)
+    p2 = ROOT.TProfile2D("p2", "p2", 12, 0, 12, 30, 0, 30)
+    for x, y in zip(rng.normal(1, 2, 10000), rng.uniform(-1, 31, 10000)):
+        h1.Fill(x)
+        h2.Fill(x + 5, y, 0.5)
+        p1.Fill(y / 1.5, x)
+        p2.Fill(x + 5, y, x * y)
+    for metrics, histos in ((METRICS_1D, (h1, p1)), (METRICS_2D, (h2, p2))):
+        for histo in histos:
+            view = HistogramView.from_root(histo)
+            for metric in metrics:
+                try:
+                    result = metric.calculateView(view)
+                except NotImplementedError:
+                    continue
+                assert result == pytest.approx(metric.calculate(histo), rel=1e-6)
@@ -0,0 +1,103 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+from backend.extra import get_plot_path
+from backend.me_resolver import MEResolver, MissingMEs
+
+
+class Key:
+    def __init__(self, name, obj):
+        self.name = name
+        self.obj = obj
+
+    def GetName(self):
+        return self.name
+
+    def ReadObj(self):
+        return self.obj
+
+
+class Directory:
+    """
+    TDirectory of a GUI file with {path: object} MEs
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.lookups = 0
+
+    def GetDirectory(self, path):
+        self.lookups += 1
+        prefix = path + "/"
+        objects = {
+            x[len(prefix) :]: obj
+            for x, obj in self.objects.items()
+            if x.startswith(prefix)
+        }
+        return Directory(objects) if objects else None
+
+    def GetListOfKeys(self):
+        names = {x.split("/")[0] for x in self.objects}
+        return [Key(x, self.objects.get(x, None)) for x in sorted(names)]
+
+
+def test_me_resolver():
+    """
+    MEs are read from the listed folders, missing subsystems and folders
+    are looked up once.
+    """
+    present = ["CSC/Digis/wire", "CSC/Digis/strip", "CSC/occupancy", "Pixel/A/B/c"]
+    missing = ["CSC/Digis/other", "CSC/Missing/x", "CSC/Missing/y", "Muon/a/b"]
+    tfile = Directory({get_plot_path(x, 355555): x.upper() for x in present})
+
+    resolver = MEResolver(present + missing)
+    mes = resolver.resolve(tfile, 355555)
+    assert mes == {x: x.upper() for x in present}
+    stats = resolver.stats
+    assert (stats["hits"], stats["misses"]) == (4, 4)
+    assert (stats["folders"], stats["missing_folders"]) == (3, 2)
+    assert resolver.n_mes == 8
+
+    mes = resolver.resolve(tfile, 355556)
+    assert mes == {}
+    assert resolver.stats["misses"] == 8
+
+
+def test_missing_mes():
+    """
+    MEs missing in the last files of a dataset are skipped but every probe-th file,
+    MEs found again are looked up in the next file.
+    """
+    present = ["CSC/Digis/wire"]
+    missing = ["CSC/Digis/other", "Muon/a/b"]
+    tfile = Directory({get_plot_path(x, 1): x for x in present})
+    resolver = MEResolver(present + missing)
+    missing_mes = MissingMEs(files=2, probe=4)
+
+    skipped = []
+    for _ in range(8):
+        skip = missing_mes.get_skipped("Cosmics", "PromptReco")
+        resolver.resolve(tfile, 1, skip)
+        missing_mes.update("Cosmics", "PromptReco", resolver.stats["missing"])
+        skipped.append(resolver.stats["skipped"])
+    assert skipped == [0, 0, 2, 2, 0, 2, 2, 2]
+    assert set(resolver.stats["missing"]) == set(missing)
+    assert missing_mes.get_skipped("ZeroBias", "PromptReco") == set()
+
+    missing_mes.update("Cosmics", "PromptReco", missing[1:])
+    assert missing_mes.get_skipped("Cosmics", "PromptReco") == {"Muon/a/b"}
+    assert missing_mes.pop_changed() == {("Cosmics", "PromptReco"): {"Muon/a/b": 9}}
+    assert missing_mes.pop_changed() == {}
+
+
+def test_missing_mes_db():
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+    records = {("Cosmics", "PromptReco"): {"Muon/a/b": 3, "CSC/x": 1}}
+    db.update_missing_mes(records)
+    db.update_missing_mes({("Cosmics", "PromptReco"): {"CSC/x": 2}})
+    db.update_missing_mes({("ZeroBias", "PromptReco"): {}})
+    assert db.get_missing_mes() == {("Cosmics", "PromptReco"): {"CSC/x": 2}}
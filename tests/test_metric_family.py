@@ -0,0 +1,95 @@
+import os
+import sys
+from configparser import RawConfigParser
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend.extra import TrendCfg, expand_family
+from backend.metrics import basic, hcal_metrics
+from tests.test_histogram_view import make_1d
+from tests.test_hcal_metrics import make_depth_histos
+
+METRICS = {"basic": basic, "hcal_metrics": hcal_metrics}
+
+FAMILY_CFG = """
+[family:MeanTime-depth12]
+metric = hcal_metrics.RBXMeans((1, 2, 0))
+plotName = MeanTime-{output}-depth12
+relativePath = Hcal/DigiTask/DigiTime/depth/depth1
+histo1Path = Hcal/DigiTask/DigiTime/depth/depth2
+threshold = 7
+yTitle = Mean of Timing - {output} - depth12 [TS]
+
+[family:ActiveChan-depth12]
+metric = hcal_metrics.RBXCountsNonZeroChan((1, 2, 0))
+plotName = ActiveChan-{output}-depth12
+relativePath = Hcal/DigiTask/DigiTime/depth/depth1
+histo1Path = Hcal/DigiTask/DigiTime/depth/depth2
+yTitle = Number of Active Channel - {output} - depth12
+outputs =
+    HBM01 HBM02
+    HEP18
+"""
+
+
+def read_family(section):
+    parser = RawConfigParser()
+    parser.read_string(FAMILY_CFG)
+    return expand_family("HCAL/test.ini", section, parser[section], METRICS)
+
+
+def test_expand_family():
+    sections = read_family("family:MeanTime-depth12")
+    assert len(sections) == len(hcal_metrics.hcal_map)
+    name, data, family, output = sections[0]
+    assert name == "plot:MeanTime-HBM01-depth12"
+    assert output == "HBM01"
+    assert all(x[2] is family for x in sections)
+
+    trend = TrendCfg("HCAL/test.ini", name, data, "HCAL")
+    assert trend.metric == "hcal_metrics.RBXMeans((1, 2, 0))['HBM01']"
+    assert trend.y_title == "Mean of Timing - HBM01 - depth12 [TS]"
+    assert trend.relative_path == "Hcal/DigiTask/DigiTime/depth/depth1"
+    assert trend.histo1_path == "Hcal/DigiTask/DigiTime/depth/depth2"
+    assert trend.threshold == "7"
+    assert "outputs" not in data and "plotName" not in data
+
+    sections = read_family("family:ActiveChan-depth12")
+    assert [x[3] for x in sections] == ["HBM01", "HBM02", "HEP18"]
+
+
+def test_family_outputs_match_metrics():
+    """
+    Every output of a family is the value of the single trend metric.
+    """
+    histos = make_depth_histos(0)
+    views = [x.view() for x in histos]
+    for family_cls, cls in (
+        (hcal_metrics.RBXMeans, hcal_metrics.RBXMean),
+        (hcal_metrics.RBXCountsNonZeroChan, hcal_metrics.RBXCountNonZeroChan),
+    ):
+        family = family_cls((1, 2, 0))
+        family.setOptionalHisto1(histos[1])
+        results = family.calculateAll(histos[0])
+        family.setOptionalHisto1(views[1])
+        assert family.calculateAllView(views[0]) == results
+
+        for name in ["HBM01", "HEP18", "HO2P12"]:
+            metric = cls(name, (1, 2, 0))
+            metric.setOptionalHisto1(histos[1])
+            assert results[name] == metric.calculate(histos[0])
+
+            output = family[name]
+            output.setOptionalHisto1(histos[1])
+            assert output.calculate(histos[0]) == results[name]
+
+
+def test_metric_family():
+    family = basic.MetricFamily({"3": basic.BinCount(3), "mean": basic.Mean()})
+    assert family.outputs() == ["3", "mean"]
+    assert family.supportsView()
+    histo = make_1d(0)
+    results = family.calculateAll(histo)
+    assert results["3"] == basic.BinCount(3).calculate(histo)
+    assert results["mean"] == basic.Mean().calculate(histo)
+    assert family["3"].calculate(histo) == results["3"]
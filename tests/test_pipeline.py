@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import pytest
+import threading
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend.pipeline import Pipeline, Stage
+
+
+def test_pipeline():
+    """
+    Items go through all stages, None drops an item, the stats count every stage.
+    """
+    stages = [
+        Stage("read", lambda x: None if x % 3 == 0 else x, workers=3),
+        Stage("compute", lambda x: x * 10),
+    ]
+    pipeline = Pipeline(range(20), stages, depth=2)
+    results = list(pipeline.results("write"))
+    assert sorted(results) == [x * 10 for x in range(20) if x % 3]
+
+    stats = {x.name: x.as_dict() for x in pipeline.stats}
+    assert list(stats) == ["read", "compute", "write"]
+    assert stats["read"]["items"] == 20
+    assert stats["read"]["workers"] == 3
+    assert stats["compute"]["items"] == stats["write"]["items"] == len(results)
+    assert all(x["depth_max"] <= 2 for x in stats.values())
+    assert "compute: 1 threads, 13 items" in str(pipeline.stats[1])
+
+
+def test_pipeline_bounded():
+    """
+    A slow consumer blocks the stages in front of it, they do not run ahead.
+    """
+    started = []
+    lock = threading.Lock()
+
+    def read(x):
+        with lock:
+            started.append(x)
+        return x
+
+    pipeline = Pipeline(range(100), [Stage("read", read)], depth=2)
+    results = pipeline.results("write")
+    assert next(results) == 0
+    time.sleep(0.1)
+    # one item taken, two queued and one waiting to be queued
+    assert len(started) <= 4
+    assert list(results) == list(range(1, 100))
+    stats = pipeline.stats[0].as_dict()
+    assert stats["blocked"] > 0.05
+
+
+def test_pipeline_error():
+    """
+    The first exception of a stage is raised once the other items went through.
+    """
+
+    def compute(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    pipeline = Pipeline(range(6), [Stage("compute", compute, workers=2)])
+    results = []
+    with pytest.raises(ValueError, match="bad item"):
+        for x in pipeline.results():
+            results.append(x)
+    assert sorted(results) == [0, 1, 2, 4, 5]
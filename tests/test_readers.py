@@ -0,0 +1,248 @@
+import os
+import sys
+import pytest
+import numpy as np
+
+uproot = pytest.importorskip("uproot")
+
+# readers.py is imported by dqm_extractor.py as a top level module
+sys.path.append(os.path.realpath("./backend"))
+
+import readers
+from me_resolver import MEResolver
+from metrics.histogram import HistogramView, AXIS_RANGE_BIT
+
+SUMMARY = "DQMData/Run 1/CSC/Run summary"
+
+
+@pytest.fixture
+def gui_file(tmp_path):
+    rng = np.random.default_rng(1)
+    x = rng.normal(5, 2, 1000)
+    y = rng.normal(0, 1, 1000)
+    path = str(
+        tmp_path / "DQM_V0001_R000000001__ZeroBias__Run2022A-PromptReco-v1__DQMIO.root"
+    )
+    with uproot.recreate(path) as f:
+        f[SUMMARY + "/Digis/h1"] = np.histogram(x, bins=10, range=(0, 10))
+        f[SUMMARY + "/Digis/h2"] = np.histogram2d(
+            x, y, bins=(10, 4), range=((0, 10), (-2, 2))
+        )
+        f[SUMMARY + "/Digis/title"] = "not a histogram"
+    return path, x
+
+
+def test_uproot_reader(gui_file):
+    """
+    MEs are resolved by folders and read into HistogramViews.
+    """
+    path, x = gui_file
+    reader = readers.READERS["uproot"]()
+    assert reader.open(path + ".missing") is None
+    tdirectory = reader.open(path)
+    mes = ["CSC/Digis/h1", "CSC/Digis/h2", "CSC/Digis/title", "CSC/Other/h1", "GEM/h1"]
+    resolver = MEResolver(mes)
+    me_dic = resolver.resolve(tdirectory, 1)
+    reader.close(tdirectory)
+
+    assert sorted(me_dic) == ["CSC/Digis/h1", "CSC/Digis/h2"]
+    assert resolver.stats["hits"] == 2
+    assert resolver.stats["missing_folders"] == 2
+    assert "CSC/Digis/title" in resolver.stats["missing"]
+
+    h1 = me_dic["CSC/Digis/h1"]
+    counts = np.histogram(x, bins=10, range=(0, 10))[0]
+    assert h1.ndim == 1 and h1.nbinsx == 10 and h1.fixed_xbins
+    assert np.array_equal(h1.contents[1:-1], counts)
+    assert h1.contents[0] == 0 and h1.contents[-1] == 0
+    assert np.allclose(h1.errors[1:-1], np.sqrt(counts))
+    assert h1.entries == counts.sum()
+    assert h1.bin_content(h1.find_bin(5.5)) == counts[5]
+    centers = np.arange(10) + 0.5
+    assert h1.mean() == pytest.approx(np.average(centers, weights=counts))
+
+    h2 = me_dic["CSC/Digis/h2"]
+    assert h2.ndim == 2 and (h2.nbinsx, h2.nbinsy) == (10, 4)
+    assert h2.contents.sum() == h2.entries
+
+
+def test_extract_trend_points_uproot(gui_file):
+    """
+    Trends are evaluated on the views of the uproot reader.
+    """
+    import dqm_extractor
+    from extra import TrendCfg, DQMFile
+    from metrics import basic
+
+    path, x = gui_file
+    trends = []
+    for i, (name, histo) in enumerate([("mean", "Digis/h1"), ("missing", "h1")]):
+        data = {"relativePath": "CSC/" + histo, "metric": "basic.Mean()"}
+        trend = TrendCfg("CSC/test.ini", name, data, "CSC")
+        trend.SetMetric(basic.Mean())
+        trend.db_id = i
+        trends.append(trend)
+    mes = [me for x in trends for me in x.GetMEs()]
+    file = DQMFile(path, "", "", "", 1, 1, "ZeroBias", "PromptReco")
+    reader = readers.READERS["uproot"]()
+    status, points = dqm_extractor.extract_trend_points(
+        file, trends, mes, reader=reader
+    )
+    assert status == 0
+    counts = np.histogram(x, bins=10, range=(0, 10))[0]
+    centers = np.arange(10) + 0.5
+    assert [x[0] for x in points] == [0]
+    assert points[0][1] == pytest.approx(np.average(centers, weights=counts))
+
+    # read and compute stages of the pipeline without workers
+    from me_resolver import MissingMEs
+    from pipeline import Pipeline, Stage
+
+    dqm_extractor.set_worker_state(trends, mes, None, MissingMEs(), "uproot", True)
+    stages = [
+        Stage("read", dqm_extractor.read_file, 2),
+        Stage("compute", dqm_extractor.compute_file),
+    ]
+    missing = DQMFile(path + ".missing", "", "", "", 1, 2, "ZeroBias", "PromptReco")
+    results = Pipeline([file, missing], stages).results()
+    results = {x[0].run: x[1:] for x in results}
+    assert results[1][:2] == (0, points)
+    assert results[1][2]["hits"] == 1
+    assert results[2] == (1, [], None)
+
+    # files read from the staging cache
+    import functools
+    from staging_cache import StagingCache
+
+    cache = StagingCache(os.path.join(os.path.dirname(path), "cache"), 10**9)
+    stage = functools.partial(dqm_extractor.stage_file, cache)
+    stages.insert(0, Stage("stage", stage))
+    results = list(Pipeline([file], stages).results())
+    assert file.local_path.startswith(cache.directory)
+    assert results[0][1:3] == (0, points)
+    assert cache.stats["bytes_staged"] == os.path.getsize(path)
+
+
+def set_axis_range(axis, first, last):
+    # @fBits of the TObject base, uproot does not write it, so the axis is not written
+    axis.bases[0].bases[0]._members["@fBits"] |= AXIS_RANGE_BIT
+    axis._members["fFirst"], axis._members["fLast"] = first, last
+
+
+def test_uproot_stats_from_bins():
+    """
+    Statistics are recomputed from the bins in the axis range like TH1::GetStats,
+    if a range is set or the stored ones were reset.
+    """
+    from uproot.writing.identify import to_TAxis, to_TH1x, to_TH2x, to_TProfile
+
+    contents = np.array([5.0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 5])
+    centers = np.arange(10) + 0.5
+
+    def th1(fTsumw, first=None, last=None):
+        xaxis = to_TAxis("xaxis", "", 10, 0.0, 10.0)
+        if first:
+            set_axis_range(xaxis, first, last)
+        # stored statistics of all bins shifted by 100
+        return to_TH1x("h", "", contents, 65.0, fTsumw, fTsumw, 1e4, 1e6, None, xaxis)
+
+    view = HistogramView.from_uproot(th1(55.0))
+    assert view.stats[:4].tolist() == [55.0, 55.0, 1e4, 1e6]
+
+    view = HistogramView.from_uproot(th1(0.0))
+    w = contents[1:-1]
+    assert view.stats[:4] == pytest.approx(
+        [55, 55, (w * centers).sum(), (w * centers**2).sum()]
+    )
+    assert view.mean() == pytest.approx(np.average(centers, weights=w))
+    assert view.entries == 65
+
+    view = HistogramView.from_uproot(th1(55.0, 3, 5))
+    w, x = contents[3:6], centers[2:5]
+    assert view.xrange == (3, 5)
+    assert view.mean() == pytest.approx(np.average(x, weights=w))
+    assert view.std_dev() == pytest.approx(np.sqrt(np.cov(x, aweights=w, bias=True)))
+    assert view.effective_entries == pytest.approx(w.sum())
+    # like TH1::GetMaximum, the bins outside the range are ignored
+    assert view.maximum == 5.0
+
+    # 2D, y range only
+    xaxis = to_TAxis("xaxis", "", 2, 0.0, 2.0)
+    yaxis = to_TAxis("yaxis", "", 3, 0.0, 3.0)
+    set_axis_range(yaxis, 2, 3)
+    data = np.arange(20, dtype=float)  # (2 + 2) x (3 + 2), x fastest
+    th2 = to_TH2x("h", "", data, 190.0, 1, 1, 1, 1, 1, 1, 1, None, xaxis, yaxis)
+    view = HistogramView.from_uproot(th2)
+    w = data.reshape(5, 4).T[1:3, 2:4]
+    assert view.stats[0] == w.sum()
+    assert view.mean(1) == pytest.approx(np.average([0.5, 1.5], weights=w.sum(1)))
+    assert view.mean(2) == pytest.approx(np.average([1.5, 2.5], weights=w.sum(0)))
+    assert view.maximum == w.max()
+
+    # profile, the y statistics are the sums of the bins
+    xaxis = to_TAxis("xaxis", "", 4, 0.0, 4.0)
+    set_axis_range(xaxis, 2, 3)
+    sums = np.array([0.0, 2, 6, 1, 8, 0])
+    entries = np.array([0.0, 1, 2, 1, 4, 0])
+    sumw2 = np.array([0.0, 4, 20, 1, 20, 0])
+    profile = to_TProfile(
+        "p", "", sums, 8.0, 8, 8, 0, 0, 0, 0, sumw2, entries, entries, xaxis
+    )
+    view = HistogramView.from_uproot(profile)
+    assert view.stats[:6].tolist() == [3, 3, 2 * 1.5 + 2.5, 2 * 1.5**2 + 2.5**2, 7, 21]
+    assert view.contents[2] == 3.0
+
+
+def test_uproot_matches_root(tmp_path):
+    """
+    Both readers give the same metric values on the same file, including the
+    histograms with an axis range or with reset statistics.
+    """
+    ROOT = pytest.importorskip("ROOT")
+    from metrics import basic
+
+    path = str(
+        tmp_path / "DQM_V0001_R000000001__ZeroBias__Run2022A-PromptReco-v1__DQMIO.root"
+    )
+    rng = np.random.default_rng(2)
+    tfile = ROOT.TFile.Open(path, "RECREATE")
+    tfile.mkdir(SUMMARY).cd()
+    histos = {
+        "h1": ROOT.TH1D("h1", "", 20, 0, 10),
+        "range": ROOT.TH1D("range", "", 20, 0, 10),
+        "reset": ROOT.TH1D("reset", "", 20, 0, 10),
+        "h2": ROOT.TH2D("h2", "", 10, 0, 10, 8, -2, 2),
+        "profile": ROOT.TProfile("profile", "", 10, 0, 10),
+    }
+    for x, y in zip(rng.normal(5, 2, 1000), rng.normal(0, 1, 1000)):
+        for name in ["h1", "range", "reset"]:
+            histos[name].Fill(x)
+        histos["h2"].Fill(x, y)
+        histos["profile"].Fill(x, y)
+    histos["range"].GetXaxis().SetRange(5, 12)
+    histos["h2"].GetYaxis().SetRange(2, 6)
+    entries = histos["reset"].GetEntries()
+    histos["reset"].PutStats(np.zeros(13))
+    histos["reset"].SetEntries(entries)
+    tfile.Write()
+    tfile.Close()
+
+    mes = ["CSC/" + x for x in histos]
+    metrics = [basic.Mean(), basic.StdDev(), basic.MeanRMS(), basic.Count()]
+    values = {}
+    for name in ["root", "uproot"]:
+        reader = readers.READERS[name]()
+        tdirectory = reader.open(path)
+        me_dic = MEResolver(mes).resolve(tdirectory, 1)
+        for me, histo in me_dic.items():
+            if name == "root":
+                histo = HistogramView.from_root(histo)
+            for metric in metrics + ([basic.MeanYAxis()] if me == "CSC/h2" else []):
+                values[name, me, type(metric).__name__] = metric.calculateView(histo)
+            values[name, me, "maximum"] = histo.maximum
+        reader.close(tdirectory)
+
+    assert len(values) == 2 * (5 * 5 + 1)
+    for (name, me, metric), value in values.items():
+        if name == "uproot":
+            assert value == pytest.approx(values["root", me, metric]), (me, metric)
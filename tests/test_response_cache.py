@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db, api
+from backend.response_cache import ResponseCache
+
+
+def test_response_cache_generation():
+    """
+    A newer generation of a dataset drops all its entries, other datasets are kept.
+    """
+    cache = ResponseCache()
+    cache.put("a", 1, 0, "a0")
+    cache.put("b", 1, 0, "b0")
+    cache.put("c", 2, 0, "c0")
+    assert cache.get("a", 1, 0) == "a0"
+
+    assert cache.get("a", 1, 1) is None
+    assert cache.get("b", 1, 1) is None
+    assert cache.get("c", 2, 0) == "c0"
+
+    # a slow request computed with the old generation is not stored
+    cache.put("a", 1, 0, "a0")
+    assert cache.get("a", 1, 1) is None
+    cache.put("a", 1, 1, "a1")
+    assert cache.get("a", 1, 1) == "a1"
+
+
+def test_response_cache_size():
+    cache = ResponseCache(2)
+    for key in "abc":
+        cache.put(key, 1, 0, key)
+    assert len(cache) == 2
+    assert cache.get("a", 1, 0) is None
+    assert cache.get("c", 1, 0) == "c"
+
+
+def test_data_cache_invalidation(client, add_run_points):
+    """
+    /api/data is served from the cache until the extractor commits new points.
+    """
+    url = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+    add_run_points(355555)
+    first = client.get(url).get_json()
+    assert [x["run"] for x in first[0]["trends"]] == [355555]
+    hits = api.data_cache.hits
+    assert client.get(url).get_json() == first
+    assert api.data_cache.hits == hits + 1
+
+    add_run_points(355556)
+    second = client.get(url).get_json()
+    assert [x["run"] for x in second[0]["trends"]] == [355555, 355556]
@@ -0,0 +1,63 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+
+
+def test_data_run_filters(client, add_run_points):
+    """
+    Runs are filtered on the typed OMS columns, legacy oms_data is migrated.
+    """
+    oms = {
+        355555: {
+            "fill_number": 8000,
+            "b_field": 3.8,
+            "recorded_lumi": "12.5 x pb^{-1}",
+        },
+        355556: {
+            "fill_number": 8001,
+            "b_field": 0.0,
+            "recorded_lumi": "0.04 x fb^{-1}",
+        },
+        355557: {
+            "fill_number": 8001,
+            "b_field": 3.79,
+            "recorded_lumi": "8e4 x nb^{-1}",
+        },
+    }
+    for run, energy in [(355555, 6800.0), (355556, 450.0), (355557, 6799.6)]:
+        oms[run]["energy"] = energy
+    for run in oms:
+        add_run_points(run)
+    db.session.query(db.Run).where(db.Run.id == 355555).update(
+        {"oms_data": str(oms[355555])}
+    )
+    db.session.commit()
+    db.migrate_run_metadata()
+    for run in [355556, 355557]:
+        db.set_run_oms(db.session.get(db.Run, run), oms[run])
+    db.session.commit()
+    # lumis in pb^-1 whatever the OMS units
+    lumis = [db.session.get(db.Run, x).recorded_lumi for x in oms]
+    assert lumis == pytest.approx([12.5, 40.0, 80.0])
+    assert db.get_run_oms(db.session.get(db.Run, 355555)) == oms[355555]
+
+    url = "/api/data?subsystem=CSC&pd=ZeroBias&processing_string=PromptReco"
+
+    def runs(query):
+        return [x["run"] for x in client.get(url + query).json[0]["trends"]]
+
+    assert runs("") == [355555, 355556, 355557]
+    assert runs("&b_field=3.8") == [355555, 355557]
+    assert runs("&min_lumi=30") == [355556, 355557]
+    assert runs("&fill=8001&b_field=3.8") == [355557]
+    assert runs("&fill=8000,8001&latest=1&min_lumi=20") == [355557]
+    assert runs("&energy=6800") == [355555, 355557]
+    assert runs("&energy=450&b_field=0") == [355556]
+    assert client.get(url + "&fill=x").status_code == 400
+    assert client.get(url + "&min_lumi=1&format=2").json["runs"][0]["oms_info"] == (
+        oms[355555]
+    )
@@ -0,0 +1,97 @@
+import os
+import sys
+import pytest
+import sqlalchemy
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+
+
+def setup_function():
+    """
+    DB created before the query indexes and the SchemaVersions table
+    """
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+    for index in map(db.get_index, db.QUERY_INDEXES + db.GUI_FILE_RUN_INDEXES):
+        index.drop(bind=db.engine)
+    db.SchemaVersion.__table__.drop(bind=db.engine)
+
+
+def get_indexes(table):
+    return {x["name"] for x in sqlalchemy.inspect(db.engine).get_indexes(table)}
+
+
+def test_migrate_schema():
+    """
+    Pending migrations are applied once and in order.
+    """
+    assert db.get_schema_version() == 0
+    db.migrate_schema(target=1)
+    assert db.get_schema_version() == 1
+    assert "ix_Trends_config_id" not in get_indexes("Trends")
+
+    # trend with points but not in the selection index
+    db.session.add(db.Dataset(id=1, stream="ZeroBias", reco_path="PromptReco"))
+    db.session.add(db.Config(id=1, subsystem="CSC", name="Mean"))
+    db.session.add(db.Trend(id=1, subsystem="CSC", dataset_id=1, config_id=1))
+    db.session.add(db.TrendPoint(trend_id=1, run=355555, value=1.0, error=0.0))
+    # lumi stored in the OMS units
+    oms = {"recorded_lumi": "2.5 x fb^{-1}", "delivered_lumi": "3 x fb^{-1}"}
+    db.session.add(db.Run(id=355555, oms=oms, recorded_lumi=2.5, delivered_lumi=3))
+    db.session.commit()
+
+    db.migrate_schema()
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+    assert db.get_selection_trend_ids() == {1}
+    run = db.session.get(db.Run, 355555)
+    assert (run.recorded_lumi, run.delivered_lumi) == (2500, 3000)
+    assert {
+        "ix_Trends_dataset_id_subsystem",
+        "ix_Trends_config_id",
+        "ux_Trends_dataset_id_config_id",
+    } <= get_indexes("Trends")
+    assert "ux_Datasets_stream_reco_path" in get_indexes("Datasets")
+    assert {"ix_GUIFiles_reco_path_stream_run", "ix_GUIFiles_run"} <= get_indexes(
+        "GUIFiles"
+    )
+
+    db.migrate_schema()
+    assert db.session.query(db.SchemaVersion).count() == len(db.MIGRATIONS)
+
+
+def test_migrate_schema_duplicates():
+    """
+    A unique index is not created over duplicated rows, the version is not bumped.
+    """
+    db.session.add(db.Dataset(id=1, stream="ZeroBias", reco_path="PromptReco"))
+    db.session.add(db.Dataset(id=2, stream="ZeroBias", reco_path="PromptReco"))
+    db.session.commit()
+    with pytest.raises(RuntimeError, match="ux_Datasets_stream_reco_path"):
+        db.migrate_schema()
+    assert db.get_schema_version() == 1
+
+    db.session.query(db.Dataset).where(db.Dataset.id == 2).delete()
+    db.session.commit()
+    db.migrate_schema()
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+
+
+def test_create_schema(monkeypatch):
+    """
+    A new DB gets the full schema and records the versions without migrating.
+    """
+    db.create_session("sqlite://")
+    monkeypatch.setattr(db, "migrate_schema", None)
+    db.create_schema()
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+    assert "ix_GUIFiles_run" in get_indexes("GUIFiles")
+    monkeypatch.undo()
+
+    # existing DB, only the pending migrations are applied
+    last = db.SchemaVersion.version == db.MIGRATIONS[-1][0]
+    db.session.query(db.SchemaVersion).where(last).delete()
+    db.session.commit()
+    db.create_schema()
+    assert db.session.query(db.SchemaVersion).count() == len(db.MIGRATIONS)
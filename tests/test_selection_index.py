@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+
+
+def test_selection_index(client, add_run_points):
+    """
+    Trends appear in the selections with their first point, served with an ETag.
+    """
+    db.session.add(db.Dataset(id=2, stream="ZeroBias", reco_path="ReReco"))
+    db.session.add(db.Trend(id=2, subsystem="CSC", dataset_id=2, config_id=1))
+    db.session.commit()
+    assert client.get("/api/selection").json == {}
+
+    batch = db.WriteBatch()
+    for trend_id, dataset in [(1, "PromptReco"), (2, "ReReco"), (1, "PromptReco")]:
+        batch.add_selection_entries(
+            [
+                {
+                    "trend_id": trend_id,
+                    "subsystem": "CSC",
+                    "dataset_id": trend_id,
+                    "stream": "ZeroBias",
+                    "reco_path": dataset,
+                    "config_id": 1,
+                    "name": "Mean",
+                }
+            ]
+        )
+        batch.flush()
+    assert batch.indexed == {1, 2}
+
+    response = client.get("/api/selection")
+    assert response.json == {"CSC": {"ZeroBias": ["PromptReco", "ReReco"]}}
+    response = client.get("/api/plot_selection")
+    assert response.json["CSC"]["ZeroBias"]["ReReco"] == [{"name": "Mean", "id": 2}]
+    etag = response.headers["ETag"]
+    response = client.get("/api/plot_selection", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    db.rebuild_selection_index()
+    assert db.get_selection_trend_ids() == set()
+    assert client.get("/api/selection").json == {}
+    add_run_points(355555)
+    db.rebuild_selection_index()
+    assert db.get_selection_trend_ids() == {1}
+    response = client.get("/api/selection")
+    assert response.json == {"CSC": {"ZeroBias": ["PromptReco"]}}
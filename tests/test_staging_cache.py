@@ -0,0 +1,98 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend.staging_cache import StagingCache, INDEX_NAME
+
+
+def make_file(tmp_path, name, size):
+    path = tmp_path / "eos" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(name.encode()[:1] * size)
+    return str(path)
+
+
+def test_staging_cache(tmp_path):
+    """
+    Files are copied once and reused while their size and mtime do not change.
+    """
+    path = make_file(tmp_path, "a.root", 100)
+    cache = StagingCache(str(tmp_path / "cache"), 1000)
+    local_path = cache.stage(path)
+    assert local_path != path
+    assert open(local_path, "rb").read() == open(path, "rb").read()
+    assert cache.stage(path) == local_path
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+    assert cache.stats["bytes_saved"] == cache.stats["bytes_staged"] == 100
+    assert "hits/misses = 1/1 (50%)" in str(cache)
+
+    # changed on EOS
+    with open(path, "ab") as f:
+        f.write(b"b")
+    assert cache.stage(path) == local_path
+    assert os.path.getsize(local_path) == 101
+    assert cache.stats["misses"] == 2
+    assert cache.used_bytes == 101
+
+    assert cache.stage(str(tmp_path / "eos" / "missing.root")) is None
+
+
+def test_staging_cache_lru(tmp_path):
+    """
+    The least recently used files not pinned are removed to make room.
+    """
+    paths = [make_file(tmp_path, "%s.root" % x, 100) for x in "abcd"]
+    cache = StagingCache(str(tmp_path / "cache"), 300)
+    a, b, c = [cache.stage(x) for x in paths[:3]]
+    for path in paths[:3]:
+        cache.release(path)
+    # a is used again, b is the least recently used
+    cache.stage(paths[0])
+    d = cache.stage(paths[3])
+    assert not os.path.exists(b)
+    assert all(os.path.exists(x) for x in [a, c, d])
+    assert cache.stats["evicted"] == 1
+
+    # all files pinned, no room
+    cache.stage(paths[2])
+    assert cache.stage(paths[1]) is None
+    assert cache.used_bytes == 300
+    # larger than the cache
+    assert cache.stage(make_file(tmp_path, "e.root", 400)) is None
+
+
+def test_staging_cache_index(tmp_path):
+    """
+    The copies are reused by the next runs, leftovers of other runs are removed.
+    """
+    directory = str(tmp_path / "cache")
+    paths = [make_file(tmp_path, "%s.root" % x, 100) for x in "ab"]
+    cache = StagingCache(directory, 1000)
+    local_paths = [cache.stage(x) for x in paths]
+    cache.save()
+    open(os.path.join(directory, "x.root.1.tmp"), "w").close()
+    os.remove(local_paths[1])
+
+    cache = StagingCache(directory, 1000)
+    assert list(cache.entries) == paths[:1]
+    assert sorted(os.listdir(directory)) == sorted(
+        [INDEX_NAME, os.path.basename(local_paths[0])]
+    )
+    assert cache.stage(paths[0]) == local_paths[0]
+    assert cache.stats["hits"] == 1
+
+
+def test_staging_cache_autosave(tmp_path):
+    """
+    The index is saved every save_every staged files, not only by save().
+    """
+    directory = str(tmp_path / "cache")
+    paths = [make_file(tmp_path, "%s.root" % x, 100) for x in "abc"]
+    cache = StagingCache(directory, 1000, save_every=2)
+    local_paths = [cache.stage(x) for x in paths]
+
+    # crashed without save()
+    cache = StagingCache(directory, 1000)
+    assert list(cache.entries) == paths[:2]
+    assert not os.path.exists(local_paths[2])
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+
+
+def setup_function():
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+
+
+def get_points(trend_id):
+    query = db.session.query(db.TrendPoint).where(db.TrendPoint.trend_id == trend_id)
+    return {x.run: (x.value, x.error) for x in query}
+
+
+def test_add_trend_points_upsert():
+    """
+    Points of already known (trend, run) pairs are updated, new ones are added.
+    """
+    db.add_trend_points(
+        [
+            {"trend_id": 1, "run": 355555, "value": 1.0, "error": 0.1},
+            {"trend_id": 1, "run": 355556, "value": 2.0, "error": 0.2},
+        ]
+    )
+    db.add_trend_points([{"trend_id": 1, "run": 355556, "value": 3.0, "error": 0.3}])
+    db.session.commit()
+
+    assert get_points(1) == {355555: (1.0, 0.1), 355556: (3.0, 0.3)}
+
+
+def test_migrate_trend_points():
+    """
+    Legacy points blobs are moved to the TrendPoints table.
+    """
+    db.session.add(db.Trend(id=1, subsystem="CSC", points="{355555: [1.5, 0.5]}"))
+    db.session.add(db.Trend(id=2, subsystem="CSC", points="{}"))
+    db.session.commit()
+
+    db.migrate_trend_points()
+    db.migrate_trend_points()
+
+    assert get_points(1) == {355555: (1.5, 0.5)}
+    assert get_points(2) == {}
+    assert db.session.query(db.Trend).where(db.Trend.id == 1).first().points == "{}"
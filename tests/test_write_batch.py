@@ -0,0 +1,151 @@
+import os
+import sys
+import pytest
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.realpath("./backend")))
+
+from backend import db
+from backend.extra import DQMFile
+
+
+def setup_function():
+    db.create_session("sqlite://")
+    db.Base.metadata.create_all(db.engine)
+
+
+def make_file(run):
+    name = "DQM_V0001_R000%s__ZeroBias__Run2022C-PromptReco-v1__DQMIO.root" % run
+    return DQMFile(
+        "/eos/" + name, "/eos", name, name[10:], 1, run, "ZeroBias", "PromptReco"
+    )
+
+
+def add_file(batch, run):
+    batch.add_points([{"trend_id": 1, "run": run, "value": 1.0, "error": 0.0}])
+    batch.add_gui_file(make_file(run))
+    batch.add_run(db.Run(id=run, oms_data="{}"))
+    batch.file_done()
+
+
+def count(table):
+    return db.session.query(table).count()
+
+
+def test_write_batch_size():
+    """
+    Nothing is written until the batch has the requested number of files.
+    """
+    batch = db.WriteBatch(2)
+    add_file(batch, 355555)
+    assert count(db.GUIFile) == 0
+    assert count(db.TrendPoint) == 0
+
+    add_file(batch, 355556)
+    assert count(db.GUIFile) == 2
+    assert count(db.TrendPoint) == 2
+    assert count(db.Run) == 2
+
+
+def test_write_batch_rollback(monkeypatch):
+    """
+    A batch failing after its points were sent leaves neither points
+    nor processed files in the DB.
+    """
+    execute = db.session.execute
+
+    def failing_execute(stmt, *args, **kwargs):
+        if stmt.table.name == "GUIFiles":
+            raise RuntimeError("crash")
+        return execute(stmt, *args, **kwargs)
+
+    batch = db.WriteBatch(10)
+    add_file(batch, 355555)
+    monkeypatch.setattr(db.session, "execute", failing_execute)
+    with pytest.raises(RuntimeError):
+        batch.flush()
+    monkeypatch.undo()
+
+    assert count(db.GUIFile) == 0
+    assert count(db.TrendPoint) == 0
+    assert count(db.Run) == 0
+
+
+def test_write_batch_new_trends(monkeypatch):
+    """
+    Datasets and trends created for the points of a batch are committed with it.
+    """
+    config = SimpleNamespace(subsystem="CSC", db_id=1)
+    batch = db.WriteBatch(10)
+    dataset = db.add_dataset("ZeroBias", "PromptReco")
+    db.add_trends(dataset, [config])
+    trend = db.get_trends(dataset)[0]
+    batch.add_points(
+        [{"trend_id": trend.id, "run": 355555, "value": 1.0, "error": 0.0}],
+        dataset.id,
+    )
+    batch.add_gui_file(make_file(355555))
+    batch.file_done()
+
+    execute = db.session.execute
+
+    def failing_execute(stmt, *args, **kwargs):
+        if stmt.table.name == "GUIFiles":
+            raise RuntimeError("crash")
+        return execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(db.session, "execute", failing_execute)
+    with pytest.raises(RuntimeError):
+        batch.flush()
+    monkeypatch.undo()
+    assert count(db.Dataset) == 0
+    assert count(db.Trend) == 0
+
+
+def get_generations():
+    return {x.id: x.generation for x in db.session.query(db.Dataset)}
+
+
+def test_write_batch_generation():
+    """
+    A flush bumps the generation of the datasets it wrote points to, of all
+    datasets for a new run, and of the datasets with files of the runs whose
+    metadata changed.
+    """
+    db.session.add_all(
+        [
+            db.Dataset(id=1, stream="ZeroBias", reco_path="PromptReco"),
+            db.Dataset(id=2, stream="Cosmics", reco_path="PromptReco"),
+            db.Dataset(id=3, stream="ZeroBias", reco_path="ReReco"),
+        ]
+    )
+    db.session.commit()
+
+    batch = db.WriteBatch()
+    batch.add_points([{"trend_id": 1, "run": 1, "value": 1.0, "error": 0.0}], 1)
+    batch.flush()
+    assert get_generations() == {1: 1, 2: 0, 3: 0}
+
+    # first file of a new run, the latest runs of all datasets change
+    add_file(batch, 355555)
+    assert get_generations() == {1: 2, 2: 1, 3: 1}
+
+    # metadata of the run updated
+    batch.add_run(db.Run(id=355555, oms_data="{}", rr_significant=True))
+    batch.file_done()
+    assert get_generations() == {1: 3, 2: 1, 3: 1}
+
+    # file of the run in another dataset, written in the same batch
+    file = make_file(355555)
+    file.path, file.reco_path = file.path + ".rereco", "ReReco"
+    batch.add_gui_file(file)
+    batch.add_run(db.Run(id=355555, oms_data="{}", rr_significant=False))
+    batch.file_done()
+    assert get_generations() == {1: 4, 2: 1, 3: 2}
+
+    # OMS data of a known run, the OMS filters of all datasets change
+    run = db.session.get(db.Run, 355555)
+    db.set_run_oms(run, {"b_field": 3.8})
+    batch.add_run(run)
+    batch.file_done()
+    assert get_generations() == {1: 5, 2: 2, 3: 3}